@@ -0,0 +1,278 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+from constants import *
+from game import Game, level_seed
+from pathing import DIRECTIONS
+from events import AttackEvent, DeathEvent, PickupEvent
+
+#plays lots of headless games with a scripted player (see ScriptedPlayer)
+#for every combination of a grid of game parameters, on all the CPU cores,
+#and sums up how each combination went: how long the player survived, the
+#damage taken, the potions used... the games are normal games (same map
+#generation, monsters and combat), only the player is a script.
+#
+#    python balance.py --games 500 --grid player_hp=20,30,40 --grid heal_amount=4,8
+
+#the parameters that can be swept, with their default values
+PARAMETERS = {
+    'max_room_monsters': MAX_ROOM_MONSTERS,
+    'max_room_items': MAX_ROOM_ITEMS,
+    'heal_amount': HEAL_AMOUNT,
+}
+for (kind, (hp, defense, power)) in FIGHTER_STATS.items():
+    PARAMETERS[kind + '_hp'] = hp
+    PARAMETERS[kind + '_defense'] = defense
+    PARAMETERS[kind + '_power'] = power
+
+MAX_TURNS = 1000
+
+def game_settings(params):
+    #the Game arguments for a set of parameters
+    fighter_stats = {}
+    for kind in FIGHTER_STATS:
+        fighter_stats[kind] = (params[kind + '_hp'], params[kind + '_defense'], params[kind + '_power'])
+    return dict(max_room_monsters=params['max_room_monsters'], max_room_items=params['max_room_items'],
+                heal_amount=params['heal_amount'], fighter_stats=fighter_stats)
+
+class GameStats:
+    #event sink (see events.py) counting what happened to the player
+    def __init__(self):
+        self.damage_taken = 0
+        self.damage_dealt = 0
+        self.kills = 0
+        self.potions_found = 0
+
+    def consume(self, events):
+        for event in events:
+            if isinstance(event, AttackEvent):
+                if event.target == 'player':
+                    self.damage_taken += max(event.damage, 0)
+                else:
+                    self.damage_dealt += max(event.damage, 0)
+            elif isinstance(event, DeathEvent):
+                if not event.player:
+                    self.kills += 1
+            elif isinstance(event, PickupEvent):
+                if event.picked_up:
+                    self.potions_found += 1
+
+class ScriptedPlayer:
+    #a simple player: drinks a potion when at half health, fights whatever
+    #it sees and picks up the potions it sees. otherwise it explores until it
+    #has seen the stairs, then takes them
+    def __init__(self, game):
+        self.game = game
+        self.potions_used = 0
+        self.map = None
+
+    def look(self):
+        #remember the tiles seen on this level
+        game = self.game
+        if self.map is not game.map:
+            self.map = game.map
+            self.seen = bytearray(game.map.width * game.map.height)
+        w = game.map.width
+        for (x, y) in game.visible_tiles:
+            self.seen[y * w + x] = 1
+
+    def act(self):
+        #do one thing: 'took-turn', 'descended' (doesn't take a turn) or None
+        #if there's nothing left to do
+        game = self.game
+        player = game.player
+        index = game.objects.index
+        self.look()
+
+        #drinking doesn't take a turn, like in the inventory menu
+        fighter = player.fighter
+        if fighter.hp <= fighter.max_hp // 2 and game.inventory:
+            count = len(game.inventory)
+            game.inventory[0].item.use(game)
+            self.potions_used += count - len(game.inventory)
+
+        for (dx, dy) in DIRECTIONS:
+            target = index.blocking_at(player.x + dx, player.y + dy)
+            if target is not None and target.fighter:
+                game.player_move_or_attack(dx, dy)
+                return 'took-turn'
+
+        if len(game.inventory) < 26:
+            for obj in index.at(player.x, player.y):
+                if obj.item:
+                    game.pick_up()
+                    return 'took-turn'
+
+        if game.descend():
+            return 'descended'
+
+        monsters = set()
+        items = set()
+        for obj in game.objects:
+            if obj is not player and (obj.x, obj.y) in game.visible_tiles:
+                if obj.fighter and obj.ai:
+                    monsters.add((obj.x, obj.y))
+                elif obj.item and len(game.inventory) < 26:
+                    items.add((obj.x, obj.y))
+        #walk to the nearest monster or potion, or to the stairs once they
+        #have been seen (to the nearest tile never seen until then)
+        seen = self.seen
+        w = game.map.width
+        stairs = (game.stairs.x, game.stairs.y)
+        targets = monsters | items
+        if seen[stairs[1] * w + stairs[0]]:
+            targets.add(stairs)
+            step = self.path_step(lambda x, y: (x, y) in targets)
+        else:
+            step = self.path_step(lambda x, y: (x, y) in targets or not seen[y * w + x])
+        if step is None:
+            return None
+        game.player_move_or_attack(*step)
+        return 'took-turn'
+
+    def path_step(self, is_goal):
+        #first step of the shortest walk to the nearest tile where is_goal(x, y)
+        #is true, going around monsters. None if there's no such tile
+        game = self.game
+        map = game.map
+        w = map.width
+        h = map.height
+        blocked = map.blocked
+        index = game.objects.index
+        (px, py) = (game.player.x, game.player.y)
+        first = {py * w + px: None}
+        queue = deque([(px, py)])
+        while queue:
+            (x, y) = queue.popleft()
+            step = first[y * w + x]
+            for (dx, dy) in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                if not (0 <= nx < w and 0 <= ny < h):
+                    continue
+                i = ny * w + nx
+                if i in first or blocked[i]:
+                    continue
+                next_step = step or (dx, dy)
+                if is_goal(nx, ny):
+                    return next_step
+                first[i] = next_step
+                if index.blocking_at(nx, ny) is None:
+                    queue.append((nx, ny))
+        return None
+
+def play_game(task):
+    #play one game to the end (or to max_turns), returns what happened
+    (set_id, params, seed, max_turns) = task
+    game = Game(seed=seed, **game_settings(params))
+    stats = GameStats()
+    game.events.sinks = [stats]
+    player = ScriptedPlayer(game)
+    stuck = False
+    actions = 0
+    while game.game_state == 'playing' and game.turn < max_turns and actions < 2 * max_turns:
+        actions += 1
+        action = player.act()
+        if action is None:
+            stuck = True
+            break
+        if action == 'took-turn':
+            game.monsters_take_turn()
+        game.events.flush()
+
+    return {
+        'set': set_id,
+        'seed': seed,
+        'died': game.game_state == 'dead',
+        'stuck': stuck,
+        'turns': game.turn,
+        'dungeon_level': game.dungeon_level,
+        'damage_taken': stats.damage_taken,
+        'damage_dealt': stats.damage_dealt,
+        'kills': stats.kills,
+        'potions_found': stats.potions_found,
+        'potions_used': player.potions_used,
+    }
+
+def summarize(runs):
+    #averages of the runs of one parameter set
+    n = len(runs)
+    turns = sorted(run['turns'] for run in runs)
+    summary = {
+        'games': n,
+        'survival': sum(not run['died'] for run in runs) / float(n),
+        'median_turns': turns[n // 2],
+    }
+    for field in ('turns', 'dungeon_level', 'damage_taken', 'damage_dealt', 'kills', 'potions_found', 'potions_used'):
+        summary['mean_' + field] = sum(run[field] for run in runs) / float(n)
+    return summary
+
+def parameter_grid(grid_args):
+    #every combination of the --grid values, the other parameters keep their defaults
+    names = []
+    values = []
+    for arg in grid_args:
+        (name, _, text) = arg.partition('=')
+        if name not in PARAMETERS:
+            raise SystemExit('unknown parameter %r, can be one of: %s' % (name, ', '.join(sorted(PARAMETERS))))
+        names.append(name)
+        values.append([int(v) for v in text.split(',')])
+    sets = []
+    for combination in itertools.product(*values):
+        params = dict(PARAMETERS)
+        params.update(zip(names, combination))
+        sets.append(params)
+    return (names, sets)
+
+def print_table(names, sets, runs, done, total, elapsed):
+    print('%i/%i games, %.1fs' % (done, total, elapsed))
+    columns = ['survival', 'mean_turns', 'median_turns', 'mean_dungeon_level', 'mean_damage_taken', 'mean_potions_used']
+    print('  '.join(names + ['games'] + columns))
+    for (set_id, params) in enumerate(sets):
+        if not runs[set_id]:
+            continue
+        summary = summarize(runs[set_id])
+        print('  '.join(['%*i' % (len(name), params[name]) for name in names] + ['%5i' % summary['games']] +
+                        ['%*.2f' % (len(column), summary[column]) for column in columns]))
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many games with a scripted player to balance the parameters.')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help='values of a parameter to try (can be repeated): ' + ', '.join(sorted(PARAMETERS)))
+    parser.add_argument('--games', type=int, default=100, help='games per parameter set')
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS, help='stop a game after this many turns')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the game seeds')
+    parser.add_argument('--report', type=float, default=10.0, metavar='SECONDS',
+                        help='print the results so far this often')
+    parser.add_argument('--output', metavar='FILE', help='write the results as JSON')
+    args = parser.parse_args()
+
+    (names, sets) = parameter_grid(args.grid)
+    #every parameter set plays the same seeds, so they're compared on the same dungeons
+    tasks = [(set_id, params, level_seed(args.seed, i), args.max_turns)
+             for i in range(args.games) for (set_id, params) in enumerate(sets)]
+    runs = [[] for params in sets]
+
+    start = time.perf_counter()
+    last_report = start
+    with Pool(args.processes) as pool:
+        for (done, run) in enumerate(pool.imap_unordered(play_game, tasks, chunksize=4), 1):
+            runs[run['set']].append(run)
+            now = time.perf_counter()
+            if now - last_report >= args.report:
+                last_report = now
+                print_table(names, sets, runs, done, len(tasks), now - start)
+    print_table(names, sets, runs, len(tasks), len(tasks), time.perf_counter() - start)
+
+    if args.output:
+        results = [{'params': params, 'summary': summarize(runs[set_id])} for (set_id, params) in enumerate(sets)]
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
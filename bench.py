@@ -0,0 +1,206 @@
+#benchmarks for the hot paths: map generation, FOV (the python shadowcasting
+#and tdl's quickFOV), one monster turn and one rendered frame, at a few map
+#sizes and monster densities. every case uses a fixed seed so two runs do the
+#same work. results are printed as JSON:
+#
+#   python bench.py > before.json
+#   ... change things ...
+#   python bench.py --compare before.json
+#
+#the second command exits with status 1 if a benchmark got slower than the
+#allowed ratio, so it can be run before shipping a change. --large also
+#times the generation of a huge dungeon and frames on a huge overworld.
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import tdl
+from constants import *
+from game import Game, make_fov_function
+from fov import FovCache
+from render import Renderer
+from world import ChunkStore
+
+MAP_SIZES = [(80, 50), (160, 100), (320, 200)]
+#only map generation is timed at this size (thousands of rooms)
+LARGE_MAP_SIZE = (1000, 1000)
+#frames on an overworld this big (see world.py) should cost what they cost
+#on a small map
+WORLD_SIZE = (10000, 10000)
+#max monsters per room
+MONSTER_DENSITIES = [3, 10]
+SEED = 1234
+REPEAT = 20
+#the FOV algorithms compared, by benchmark name (see FOV_ALGO)
+FOV_ALGORITHMS = [('fov_shadowcast', 'SHADOWCAST'), ('fov_quick', 'PERMISSIVE')]
+
+def timed(function, repeat):
+    #run function() "repeat" times, returns the time of each run in seconds
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def new_game(width, height, density, seed):
+    #more rooms on bigger maps, so they are as crowded as the default one
+    max_rooms = MAX_ROOMS * (width * height) // (MAP_WIDTH * MAP_HEIGHT)
+    return Game(seed=seed, map_width=width, map_height=height, max_rooms=max_rooms,
+                max_room_monsters=density)
+
+def walkable_tiles(game, count, seed):
+    map = game.map
+    tiles = [(i % map.width, i // map.width) for i, blocked in enumerate(map.blocked)
+             if not blocked]
+    return random.Random(seed).sample(tiles, min(count, len(tiles)))
+
+def bench_make_map(width, height, density, repeat):
+    seeds = iter(range(SEED, SEED + repeat))
+    return timed(lambda: new_game(width, height, density, next(seeds)), repeat)
+
+def bench_fov(game, algorithm, repeat):
+    #a new position every time, with an empty cache: the full cost of a FOV
+    fov = FovCache(game.map, make_fov_function(algorithm))
+    positions = iter(walkable_tiles(game, repeat, SEED))
+    def compute():
+        fov.results.clear()
+        (x, y) = next(positions)
+        fov.compute(x, y)
+    return timed(compute, repeat)
+
+def bench_monster_turns(game, repeat):
+    return timed(game.monsters_take_turn, repeat)
+
+def bench_render_all(game, repeat):
+    #one frame after a player step, drawn into offscreen consoles
+    root = tdl.Console(SCREEN_WIDTH, SCREEN_HEIGHT)
+    con = tdl.Console(game.map_width, game.map_height)
+    panel = tdl.Console(SCREEN_WIDTH, PANEL_HEIGHT)
+    renderer = Renderer(root, con, panel)
+    renderer.render_all(game)
+    rng = random.Random(SEED)
+    directions = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+    def frame():
+        (dx, dy) = rng.choice(directions)
+        game.player_move_or_attack(dx, dy)
+        renderer.render_all(game)
+    return timed(frame, repeat)
+
+def bench_world_frame(game, repeat):
+    #one frame after a player step on an overworld, drawn into a console of
+    #the usual size. the player keeps going the same way, so the view
+    #scrolls and new chunks are made and paged in along the way
+    root = tdl.Console(SCREEN_WIDTH, SCREEN_HEIGHT)
+    con = tdl.Console(MAP_WIDTH, MAP_HEIGHT)
+    panel = tdl.Console(SCREEN_WIDTH, PANEL_HEIGHT)
+    renderer = Renderer(root, con, panel)
+    renderer.render_all(game)
+    rng = random.Random(SEED)
+    directions = [(1, 0), (1, 0), (1, -1), (1, 1)]
+    def frame():
+        (dx, dy) = rng.choice(directions)
+        game.player_move_or_attack(dx, dy)
+        game.monsters_take_turn()
+        renderer.render_all(game)
+    return timed(frame, repeat)
+
+def summary(name, width, height, density, game, times):
+    return {
+        'name': name,
+        'map_width': width,
+        'map_height': height,
+        'max_room_monsters': density,
+        'monsters': sum(1 for obj in game.objects if obj.ai),
+        'seed': SEED,
+        'repeat': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+
+def run(sizes, densities, repeat, large=False):
+    results = []
+    if large:
+        (width, height) = LARGE_MAP_SIZE
+        density = MAX_ROOM_MONSTERS
+        times = bench_make_map(width, height, density, max(1, repeat // 10))
+        game = new_game(width, height, density, SEED)
+        results.append(summary('make_map', width, height, density, game, times))
+        (width, height) = WORLD_SIZE
+        store = ChunkStore(tempfile.TemporaryFile(), width, height)
+        try:
+            game = Game(seed=SEED, world=store)
+            results.append(summary('world_frame', width, height, density, game,
+                                   bench_world_frame(game, repeat * 10)))
+        finally:
+            store.close()
+    for (width, height) in sizes:
+        for density in densities:
+            times = bench_make_map(width, height, density, repeat)
+            game = new_game(width, height, density, SEED)
+            results.append(summary('make_map', width, height, density, game, times))
+            for (name, algorithm) in FOV_ALGORITHMS:
+                results.append(summary(name, width, height, density, game,
+                                       bench_fov(game, algorithm, repeat)))
+            results.append(summary('monster_turns', width, height, density, game,
+                                   bench_monster_turns(game, repeat)))
+            game = new_game(width, height, density, SEED)
+            results.append(summary('render_all', width, height, density, game,
+                                   bench_render_all(game, repeat)))
+    return results
+
+def compare(results, baseline, max_ratio):
+    #print how each benchmark changed against an older run, returns the
+    #list of the ones that are slower than allowed
+    def key(result):
+        return (result['name'], result['map_width'], result['map_height'],
+                result['max_room_monsters'])
+    old = dict((key(result), result) for result in baseline)
+    slower = []
+    for result in results:
+        before = old.get(key(result))
+        if before is None or before['median'] <= 0:
+            continue
+        ratio = result['median'] / before['median']
+        line = '%-14s %4ix%-4i monsters %2i: %8.3fms -> %8.3fms (x%.2f)' % (
+            key(result) + (before['median'] * 1000, result['median'] * 1000, ratio))
+        if ratio > max_ratio:
+            line += '  SLOWER'
+            slower.append(result)
+        sys.stderr.write(line + '\n')
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description='Time map generation, FOV, monster turns and rendering.')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--quick', action='store_true', help='only the default map size')
+    parser.add_argument('--large', action='store_true', help='also time map generation at %ix%i and overworld frames at %ix%i' % (LARGE_MAP_SIZE + WORLD_SIZE))
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--max-ratio', type=float, default=1.25,
+                        help='slowest allowed median, relative to the compared run')
+    args = parser.parse_args()
+
+    sizes = MAP_SIZES[:1] if args.quick else MAP_SIZES
+    results = run(sizes, MONSTER_DENSITIES, args.repeat, args.large)
+
+    text = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.max_ratio):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
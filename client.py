@@ -0,0 +1,95 @@
+#plays a game hosted by server.py: shows the frames it sends in a tdl window
+#and sends it the keys pressed as commands (see server.py for both)
+#
+#   python client.py --port 7777      (or --unix /tmp/roguelike.sock)
+import argparse
+import asyncio
+import tdl
+from server import STREAM_MAGIC, STREAM_VERSION, HELLO, FRAME_HEADER, apply_frame
+
+#how often the window is polled for input (seconds)
+POLL_INTERVAL = 0.01
+
+#the command for each key, the other keys are sent as their character
+KEY_COMMANDS = {
+    'UP': 'up',
+    'DOWN': 'down',
+    'LEFT': 'left',
+    'RIGHT': 'right',
+    'ESCAPE': 'quit',
+}
+
+async def read_hello(reader):
+    (magic, version, width, height) = HELLO.unpack(await reader.readexactly(HELLO.size))
+    if magic != STREAM_MAGIC:
+        raise ValueError('not a game server')
+    if version != STREAM_VERSION:
+        raise ValueError('unsupported stream version %i' % version)
+    return (width, height)
+
+async def read_frame(reader):
+    #the next frame's payload, None when the server closed the connection
+    try:
+        (size,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+
+def key_command(event):
+    #the command for a tdl event, None if it isn't sent
+    if event.type == 'KEYDOWN':
+        if event.key in KEY_COMMANDS:
+            return KEY_COMMANDS[event.key]
+        if event.key == 'CHAR' and len(event.char) == 1:
+            return event.char
+    elif event.type == 'MOUSEMOTION':
+        return 'mouse %i %i' % event.cell
+    return None
+
+async def show(reader, console):
+    #the frames task, draws them as they come
+    while True:
+        payload = await read_frame(reader)
+        if payload is None:
+            return
+        apply_frame(console, payload)
+        tdl.flush()
+
+async def send_keys(writer):
+    #the input task, runs until the window is closed
+    while not tdl.event.isWindowClosed():
+        for event in tdl.event.get():
+            command = key_command(event)
+            if command is not None:
+                writer.write(command.encode('ascii') + b'\n')
+        await writer.drain()
+        await asyncio.sleep(POLL_INTERVAL)
+
+async def play(host, port, unix_path):
+    if unix_path is not None:
+        (reader, writer) = await asyncio.open_unix_connection(unix_path)
+    else:
+        (reader, writer) = await asyncio.open_connection(host, port)
+    (width, height) = await read_hello(reader)
+    console = tdl.init(width, height, title='Roguelike')
+    tasks = [asyncio.ensure_future(show(reader, console)), asyncio.ensure_future(send_keys(writer))]
+    try:
+        #until the server ends the game or the window is closed
+        (done, pending) = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+    finally:
+        writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Play a game hosted by server.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', help='connect to a Unix socket instead of TCP')
+    args = parser.parse_args()
+    asyncio.run(play(args.host, args.port, args.unix))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+SCREEN_WIDTH = 80
+SCREEN_HEIGHT = 65
+
+MAX_ROOM_MONSTERS = 3
+
+#size of the map
+MAP_WIDTH = 80
+MAP_HEIGHT = 50
+
+#sizes and coordinates relevant for the GUI
+BAR_WIDTH = 20
+PANEL_HEIGHT = 7
+PANEL_Y = SCREEN_HEIGHT - PANEL_HEIGHT
+MSG_X = BAR_WIDTH + 2
+MSG_WIDTH = SCREEN_WIDTH - BAR_WIDTH - 2
+MSG_HEIGHT = PANEL_HEIGHT - 1
+
+INVENTORY_WIDTH = 50
+
+LIMIT_FPS = 20
+playerX = SCREEN_WIDTH/2
+playerY = SCREEN_HEIGHT/2
+
+ROOM_MAX_SIZE = 10
+ROOM_MIN_SIZE = 6
+MAX_ROOMS = 30
+MAX_ROOM_ITEMS = 2
+
+#FOV algorithm: 'SHADOWCAST' is the one in fov.py, any other is one of tdl's
+#quickFOV ('BASIC', 'DIAMOND', 'SHADOW', 'PERMISSIVE', 'RESTRICTIVE'...)
+FOV_ALGO = 'SHADOWCAST'
+FOV_LIGHT_WALLS = True
+TORCH_RADIUS = 10
+HEAL_AMOUNT = 4
+#with the roaming rules, a monster out of view wanders about and slowly heals
+#(see BasicMonster): the chance it takes a step in a turn, and heals 1 hp
+ROAM_CHANCE = 0.5
+REGEN_CHANCE = 0.1
+#combat stats (hp, defense, power) of the player and the monsters
+FIGHTER_STATS = {'player': (30, 2, 5), 'orc': (10, 0, 3), 'troll': (16, 1, 4)}
+
+color_dark_wall = [0, 0, 100]
+color_light_wall = [130, 110, 50]
+color_dark_ground = [50, 50, 150]
+color_light_ground = [200, 180, 50]
+color_yellow = [255, 255, 0]
+color_green = [0, 255, 0]
+color_dark_green = [0, 153, 0]
+color_dark_red = [204, 0, 0]
+color_violet = [255, 0, 255]
@@ -0,0 +1,114 @@
+from constants import *
+
+#turning the player's input into actions. the input comes from an "input"
+#object with the coroutines get() (the next events) and menu(header,
+#options, width) (the chosen option's index, or None), and mouse_x/mouse_y,
+#so the same code runs for the tdl window and for replays of recorded
+#sessions. waiting for input (even in a menu) doesn't block anything else
+#running in the event loop, like the rendering.
+
+def menu_choice(key, options):
+    #convert the ASCII code to an index; if it corresponds to an option, return it
+    if len(key.char) != 1: return None  #not a character key (arrows...)
+    index = ord(key.char) - ord('a')
+    if index >= 0 and index < len(options): return index
+    return None
+
+async def inventory_menu(game, input, header):
+    #show a menu with each item of the inventory as an option
+    inventory = game.inventory
+    if len(inventory) == 0:
+        options = ['Inventory is empty.']
+    else:
+        options = [item.name for item in inventory]
+
+    index = await input.menu(header, options, INVENTORY_WIDTH)
+
+    #if an item was chosen, return it
+    if index is None or len(inventory) == 0: return None
+    return inventory[index].item
+
+async def handle_keys(game, input):
+    user_input = await input.get()
+
+    #if user_input.key == 'ESCAPE':
+    for event in user_input:
+        #print(str(event))
+        if event.type == 'KEYDOWN':
+            if event.key == 'ESCAPE':
+                return 'exit'
+        if game.game_state == 'playing':
+            if event.type == 'KEYDOWN':
+                if event.key == 'UP':
+                    game.player_move_or_attack(0, -1)
+                    return 'took-turn'
+                elif event.key == 'DOWN':
+                    game.player_move_or_attack(0, 1)
+                    return 'took-turn'
+                elif event.key == 'LEFT':
+                    game.player_move_or_attack(-1, 0)
+                    return 'took-turn'
+                elif event.key == 'RIGHT':
+                    game.player_move_or_attack(1, 0)
+                    return 'took-turn'
+                else:
+                    key_char = event.keychar
+                    if key_char == 'g':
+                    #pick up an item
+                        game.pick_up()
+                        return 'took_turn'
+                    if key_char == 'i':
+                        #show the inventory
+                        chosen_item = await inventory_menu(game, input, 'Inventory')
+                        if chosen_item is not None:
+                            chosen_item.use(game)
+                    if key_char == '<':
+                        #go down stairs, if the player is on them
+                        game.descend()
+                    if key_char == '>':
+                        #go up stairs, if the player is on them
+                        game.ascend()
+
+            elif event.type == 'MOUSEMOTION':
+                coord = event.cell
+                input.mouse_x = coord[0]
+                input.mouse_y = coord[1]
+                #create a list with the names of all objects at the mouse's coordinates and in FOV
+
+
+            else:
+                return 'didnt-take-turn'
+        else:
+            return 'didnt-take-turn'
+
+    return 'didnt-take-turn'
+    #if user_input.contains('ESCAPE'):
+            #return 'exit'
+    '''if game_state == 'playing':
+        if user_input.key == 'UP':
+            player_move_or_attack(0, -1)
+            fov_recompute = True
+        elif user_input.key == 'DOWN':
+            player_move_or_attack(0, 1)
+            fov_recompute = True
+        elif user_input.key == 'LEFT':
+            player_move_or_attack(-1, 0)
+            fov_recompute = True
+        elif user_input.key == 'RIGHT':
+            player_move_or_attack(1, 0)
+            fov_recompute = True
+        else:
+            return 'didnt-take-turn'''''
+
+async def play_turn(game, input):
+    #handle the player's input, then let the monsters act if it took a turn
+    player_action = await handle_keys(game, input)
+    #print(player_action)
+    if player_action != 'exit':
+        #let monsters take their turn
+        if game.game_state == 'playing' and player_action != 'didnt-take-turn':
+            game.monsters_take_turn()
+
+    #everything that happened this turn goes to the log(s) at once
+    game.events.flush()
+    return player_action
@@ -0,0 +1,85 @@
+import re
+import struct
+
+_NONZERO = re.compile(b'[^\x00]')
+_KIND = struct.Struct('<I3BB')
+
+class DecalLayer:
+    #what lies on the floor and can't be interacted with (the remains of the
+    #dead...). these aren't objects, the turns don't pay for them: each tile
+    #has a byte, 0 for nothing or the index of its kind, a (char, color,
+    #name) in "kinds". a tile holds one decal, the last one put there
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+        #anything indexed like a bytearray of width * height will do (the
+        #chunks of a world, see world.py)
+        if cells is None:
+            cells = bytearray(width * height)
+        self.cells = cells
+        self.kinds = [None]
+        self.kind_ids = {}
+        #bumped on every change, so the renderer knows when to draw again
+        self.version = 0
+
+    def kind_id(self, char, color, name):
+        key = (char, tuple(color), name)
+        i = self.kind_ids.get(key)
+        if i is None:
+            i = len(self.kinds)
+            if i > 255:
+                raise ValueError('too many kinds of decals')
+            self.kinds.append((char, list(color), name))
+            self.kind_ids[key] = i
+        return i
+
+    def add(self, x, y, char, color, name):
+        self.cells[y * self.width + x] = self.kind_id(char, color, name)
+        self.version += 1
+
+    def at(self, x, y):
+        #(char, color, name) of the decal at (x, y), None if there's none
+        return self.kinds[self.cells[y * self.width + x]]
+
+    def draw(self, con, visible_tiles, camera=(0, 0)):
+        #draw the decals in view, only the rows and columns the FOV covers
+        #are looked at. the tile at "camera" is drawn at the console's
+        #(0, 0), over the background the map gave it. returns the console
+        #cells drawn
+        rect = visible_tiles.rect()
+        if rect is None:
+            return []
+        (x1, y1, x2, y2) = rect
+        (cam_x, cam_y) = camera
+        w = self.width
+        drawn = []
+        for y in range(y1, y2):
+            row = self.cells[y * w + x1:y * w + x2]
+            for match in _NONZERO.finditer(row):
+                x = x1 + match.start()
+                if (x, y) in visible_tiles:
+                    (char, color, name) = self.kinds[row[match.start()]]
+                    con.drawChar(x - cam_x, y - cam_y, char, color, bgcolor=None)
+                    drawn.append((x - cam_x, y - cam_y))
+        return drawn
+
+    def pack_kinds(self, parts):
+        #the kinds as bytes, appended to parts: count (B), then each one's
+        #char (I), color (3B), name (length B, UTF-8)
+        parts.append(bytes([len(self.kinds) - 1]))
+        for (char, color, name) in self.kinds[1:]:
+            name = name.encode('utf-8')[:255]
+            parts.append(_KIND.pack(ord(char), color[0], color[1], color[2], len(name)))
+            parts.append(name)
+
+    def unpack_kinds(self, data, pos):
+        #read back what pack_kinds() wrote at pos, returns the next pos
+        count = data[pos]
+        pos += 1
+        for i in range(count):
+            (char, r, g, b, length) = _KIND.unpack_from(data, pos)
+            pos += _KIND.size
+            name = bytes(data[pos:pos + length]).decode('utf-8')
+            pos += length
+            self.kind_id(chr(char), [r, g, b], name)
+        return pos
@@ -0,0 +1,190 @@
+import struct
+import sys
+from constants import *
+
+#what happens during a turn (attacks, deaths, pickups) is not written out
+#right away: it's emitted as an event on the game's EventBus, and at the end
+#of the turn the whole batch goes to each sink (the message log, stdout, a
+#binary log file...). anything that wants to follow the game can add a sink.
+
+class AttackEvent:
+    __slots__ = ('turn', 'attacker', 'target', 'damage')
+    code = 1
+
+    def __init__(self, turn, attacker, target, damage):
+        self.turn = turn
+        self.attacker = attacker
+        self.target = target
+        self.damage = damage
+
+    def text(self):
+        if self.damage > 0:
+            return self.attacker.capitalize() + ' attacks ' + self.target + ' for ' + str(self.damage) + ' hit points.'
+        return self.attacker.capitalize() + ' attacks ' + self.target + ' but it has no effect!'
+
+    def color(self):
+        return [255, 255, 255]
+
+class DeathEvent:
+    __slots__ = ('turn', 'name', 'player')
+    code = 2
+
+    def __init__(self, turn, name, player=False):
+        self.turn = turn
+        self.name = name
+        self.player = player
+
+    def text(self):
+        if self.player:
+            return 'You died!'
+        return self.name.capitalize() + ' is dead!'
+
+    def color(self):
+        return color_dark_red
+
+class PickupEvent:
+    __slots__ = ('turn', 'item', 'picked_up')
+    code = 3
+
+    def __init__(self, turn, item, picked_up=True):
+        self.turn = turn
+        self.item = item
+        #false if the inventory was full
+        self.picked_up = picked_up
+
+    def text(self):
+        if self.picked_up:
+            return 'You picked up a ' + self.item + '!'
+        return 'Your inventory is full, cannot pick up ' + self.item + '.'
+
+    def color(self):
+        if self.picked_up:
+            return color_green
+        return color_dark_red
+
+EVENT_TYPES = dict((cls.code, cls) for cls in (AttackEvent, DeathEvent, PickupEvent))
+
+class EventBus:
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.pending = []
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, event):
+        self.pending.append(event)
+
+    def flush(self):
+        #hand the events of the turn to every sink, once
+        if not self.pending:
+            return
+        events = self.pending
+        self.pending = []
+        for sink in self.sinks:
+            sink.consume(events)
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            close = getattr(sink, 'close', None)
+            if close is not None:
+                close()
+
+class MessageLogSink:
+    #shows the events in the game's message log, on screen
+    def __init__(self, game):
+        self.game = game
+
+    def consume(self, events):
+        for event in events:
+            self.game.message(event.text(), event.color())
+
+class StdoutSink:
+    #prints the events, all of a turn in one write
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def consume(self, events):
+        stream = self.stream or sys.stdout
+        stream.write(''.join([event.text() + '\n' for event in events]))
+
+#binary event log: magic and version, then the events one after the other.
+#each event is its type code (see EVENT_TYPES) and turn, then its fields:
+#strings are a length byte and utf-8, numbers are signed 32 bit
+LOG_MAGIC = b'RLEV'
+LOG_VERSION = 1
+_LOG_HEADER = struct.Struct('<4sB')
+_EVENT_HEADER = struct.Struct('<BI')
+_INT = struct.Struct('<i')
+
+def _pack_string(text, parts):
+    encoded = text.encode('utf-8')[:255]
+    parts.append(bytes([len(encoded)]))
+    parts.append(encoded)
+
+def pack_event(event, parts):
+    parts.append(_EVENT_HEADER.pack(event.code, event.turn))
+    if event.code == AttackEvent.code:
+        _pack_string(event.attacker, parts)
+        _pack_string(event.target, parts)
+        parts.append(_INT.pack(event.damage))
+    elif event.code == DeathEvent.code:
+        _pack_string(event.name, parts)
+        parts.append(bytes([event.player]))
+    else:
+        _pack_string(event.item, parts)
+        parts.append(bytes([event.picked_up]))
+
+class BinaryLogSink:
+    #appends the events to a binary log file, one write per turn
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+    def consume(self, events):
+        parts = []
+        for event in events:
+            pack_event(event, parts)
+        self.file.write(b''.join(parts))
+
+    def close(self):
+        self.file.close()
+
+def read_event_log(path):
+    #the events of a binary log, in order
+    with open(path, 'rb') as f:
+        data = f.read()
+    (magic, version) = _LOG_HEADER.unpack_from(data, 0)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise ValueError('not an event log (or an unsupported version)')
+    pos = _LOG_HEADER.size
+    events = []
+
+    def string():
+        nonlocal pos
+        length = data[pos]
+        text = data[pos + 1:pos + 1 + length].decode('utf-8')
+        pos += 1 + length
+        return text
+
+    while pos < len(data):
+        (code, turn) = _EVENT_HEADER.unpack_from(data, pos)
+        pos += _EVENT_HEADER.size
+        if code == AttackEvent.code:
+            attacker = string()
+            target = string()
+            (damage,) = _INT.unpack_from(data, pos)
+            pos += _INT.size
+            events.append(AttackEvent(turn, attacker, target, damage))
+        elif code == DeathEvent.code:
+            name = string()
+            events.append(DeathEvent(turn, name, bool(data[pos])))
+            pos += 1
+        elif code == PickupEvent.code:
+            item = string()
+            events.append(PickupEvent(turn, item, bool(data[pos])))
+            pos += 1
+        else:
+            raise ValueError('unknown event type %i' % code)
+    return events
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from constants import *
+
+FOV_CACHE_SIZE = 64
+
+#the 8 octants around the origin, as (xx, xy, yx, yy): the cell "col" cells
+#across and "row" rows away in an octant is at x - col * xx - row * xy,
+#y - col * yx - row * yy
+_OCTANTS = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+            (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+#octant tables by radius, see octant_tables()
+_tables = {}
+
+class FovResult:
+    #the tiles that can be seen from one position. stored as a bitmask (one
+    #byte per tile) that only covers the bounding box of the visible tiles,
+    #so it stays small even on a huge map. supports "(x, y) in result".
+    __slots__ = ('x1', 'y1', 'x2', 'y2', 'width', 'mask', 'count')
+
+    def __init__(self, cells, map_width, map_height):
+        inside = [(x, y) for (x, y) in cells
+                  if 0 <= x < map_width and 0 <= y < map_height]
+        self.count = len(inside)
+        if not inside:
+            self.x1 = self.y1 = self.x2 = self.y2 = self.width = 0
+            self.mask = bytearray()
+            return
+        self.x1 = min(x for (x, y) in inside)
+        self.y1 = min(y for (x, y) in inside)
+        self.x2 = max(x for (x, y) in inside) + 1
+        self.y2 = max(y for (x, y) in inside) + 1
+        self.width = w = self.x2 - self.x1
+        self.mask = mask = bytearray(w * (self.y2 - self.y1))
+        x1 = self.x1
+        y1 = self.y1
+        for (x, y) in inside:
+            mask[(y - y1) * w + x - x1] = 1
+
+    @classmethod
+    def from_mask(cls, x1, y1, x2, y2, mask):
+        #a result from a mask that already covers (x1, y1, x2, y2), a box
+        #inside the map that holds every visible tile (it can be bigger)
+        result = cls.__new__(cls)
+        result.x1 = x1
+        result.y1 = y1
+        result.x2 = x2
+        result.y2 = y2
+        result.width = x2 - x1
+        result.mask = mask
+        result.count = len(mask) - mask.count(0)
+        if not result.count:
+            result.x1 = result.y1 = result.x2 = result.y2 = result.width = 0
+            result.mask = bytearray()
+        return result
+
+    def __contains__(self, coord):
+        (x, y) = coord
+        if x < self.x1 or x >= self.x2 or y < self.y1 or y >= self.y2:
+            return False
+        return self.mask[(y - self.y1) * self.width + x - self.x1] == 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        w = self.width
+        for i, seen in enumerate(self.mask):
+            if seen:
+                yield (self.x1 + i % w, self.y1 + i // w)
+
+    def rect(self):
+        #bounding box of the visible tiles (x1, y1, x2, y2, exclusive), or None
+        if not self.count:
+            return None
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    def row(self, y, x1, x2):
+        #the mask for tiles x1 <= x < x2 of row y, as bytes
+        if y < self.y1 or y >= self.y2 or x2 <= self.x1 or x1 >= self.x2:
+            return bytes(x2 - x1)
+        a = max(x1, self.x1)
+        b = min(x2, self.x2)
+        i = (y - self.y1) * self.width - self.x1
+        return bytes(a - x1) + self.mask[i + a:i + b] + bytes(x2 - b)
+
+class FovCache:
+    #computes the field of view over a precomputed transparency grid, and
+    #remembers the results for the last few origins (least recently used
+    #ones are dropped first), so walking back and forth doesn't recompute.
+    #the cache is only thrown away when the map's walls change, or when
+    #invalidate() is called (e.g. a light-blocking object moved).
+    def __init__(self, map, fov_function, max_entries=FOV_CACHE_SIZE):
+        self.map = map
+        #fov_function(x, y, is_transparent) returns the set of visible (x, y),
+        #like tdl.map.quickFOV does. if it has a compute_result() (like
+        #Shadowcaster) that is used instead, on the transparency grid itself
+        self.fov_function = fov_function
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.transparent = None
+        self.map_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.map_version = None
+
+    def rebuild(self):
+        #one byte per tile, 1 if light goes through it
+        map = self.map
+        self.transparent = map.transparency()
+        self.results.clear()
+        self.map_version = map.version
+
+    def is_transparent(self, x, y):
+        x = int(x)
+        y = int(y)
+        map = self.map
+        if x < 0 or y < 0 or x >= map.width or y >= map.height:
+            return False
+        return self.transparent[y * map.width + x] == 1
+
+    def compute(self, x, y):
+        if self.map_version != self.map.version:
+            self.rebuild()
+
+        key = (x, y)
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        compute_result = getattr(self.fov_function, 'compute_result', None)
+        if compute_result is not None:
+            result = compute_result(self.transparent, self.map.width, self.map.height, x, y)
+        else:
+            cells = self.fov_function(x, y, self.is_transparent)
+            result = FovResult(cells, self.map.width, self.map.height)
+        self.results[key] = result
+        if len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+        return result
+
+def octant_tables(radius):
+    #for each octant, the cells of each row (1 to radius) in the order the
+    #shadowcasting looks at them, as (dx, dy, high slope, low slope, inside
+    #the radius). it only depends on the radius, so it's made once
+    tables = _tables.get(radius)
+    if tables is not None:
+        return tables
+    tables = []
+    for (xx, xy, yx, yy) in _OCTANTS:
+        rows = []
+        for row in range(1, radius + 1):
+            cells = []
+            for col in range(row, -1, -1):
+                cells.append((-col * xx - row * xy, -col * yx - row * yy,
+                              (col + 0.5) / (row - 0.5), (col - 0.5) / (row + 0.5),
+                              col * col + row * row <= radius * radius))
+            rows.append(cells)
+        tables.append(rows)
+    _tables[radius] = tables
+    return tables
+
+class Shadowcaster:
+    #recursive shadowcasting: each octant is scanned row by row away from
+    #the origin, and an opaque tile casts a shadow (a range of slopes) that
+    #the following rows skip. only the tiles within "radius" are looked at,
+    #so it costs the same in a huge open cave as in a corridor. the slopes
+    #of every cell come from precomputed tables (see octant_tables())
+    def __init__(self, radius=TORCH_RADIUS, light_walls=FOV_LIGHT_WALLS):
+        self.radius = radius
+        self.light_walls = light_walls
+        self.octants = octant_tables(radius)
+
+    def compute_result(self, transparent, width, height, x, y):
+        #the FovResult from (x, y) over "transparent", one byte per tile (1
+        #if light goes through it), row by row
+        r = self.radius
+        light_walls = self.light_walls
+        #the box around the origin that can be seen, inside the map
+        x1 = max(x - r, 0)
+        y1 = max(y - r, 0)
+        x2 = min(x + r + 1, width)
+        y2 = min(y + r + 1, height)
+        box_width = x2 - x1
+        mask = bytearray(box_width * (y2 - y1))
+        mask[(y - y1) * box_width + x - x1] = 1
+
+        def scan(rows, first_row, start, end):
+            #light the cells of rows first_row.. between the slopes start
+            #and end (start > end), then recurse under each opaque run
+            if start < end:
+                return
+            new_start = 0.0
+            for depth in range(first_row, r + 1):
+                blocked = False
+                for (dx, dy, high, low, inside) in rows[depth - 1]:
+                    if start < low:
+                        continue
+                    if end > high:
+                        break
+                    cx = x + dx
+                    cy = y + dy
+                    if x1 <= cx < x2 and y1 <= cy < y2:
+                        opaque = not transparent[cy * width + cx]
+                        if inside and (light_walls or not opaque):
+                            mask[(cy - y1) * box_width + cx - x1] = 1
+                    else:
+                        opaque = True
+                    if blocked:
+                        if opaque:
+                            new_start = low
+                            continue
+                        blocked = False
+                        start = new_start
+                    elif opaque and depth < r:
+                        blocked = True
+                        scan(rows, depth + 1, start, high)
+                        new_start = low
+                if blocked:
+                    break
+
+        for rows in self.octants:
+            scan(rows, 1, 1.0, 0.0)
+        return FovResult.from_mask(x1, y1, x2, y2, mask)
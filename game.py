@@ -0,0 +1,897 @@
+import argparse
+import functools
+import random
+import math
+import struct
+import textwrap
+import zlib
+from constants import *
+from gamemap import GameMap
+from world import ChunkedMap, CHUNK_SIZE, overworld_chunk
+from spatial import ObjectList, RectGrid
+from fov import FovCache, Shadowcaster
+from pathing import FlowField, DIRECTIONS
+from scheduler import TurnScheduler, NORMAL_SPEED
+from events import EventBus, MessageLogSink, AttackEvent, DeathEvent, PickupEvent
+from levels import Level, LevelManager, pack_bits, unpack_bits
+
+class Rect:
+    #a rectangle on the map. used to characterize a room.
+    __slots__ = ('x1', 'y1', 'x2', 'y2')
+
+    def __init__(self, x, y, w, h):
+        self.x1 = x
+        self.y1 = y
+        self.x2 = x + w
+        self.y2 = y + h
+
+    def center(self):
+        center_x = int((self.x1 + self.x2) / 2)
+        center_y = int((self.y1 + self.y2) / 2)
+        return (center_x, center_y)
+
+    def intersect(self, other):
+        #returns true if this rectangle intersects with another one
+        return (self.x1 <= other.x2 and self.x2 >= other.x1 and
+                self.y1 <= other.y2 and self.y2 >= other.y1)
+
+
+#the classes of things on the map use __slots__: no per-instance dict, so a
+#level with tens of thousands of monsters and items stays small. only the
+#attributes listed there can be set on them.
+
+class Fighter:
+    #combat-related properties and methods (monster, player, NPC).
+    __slots__ = ('max_hp', 'hp', 'defense', 'power', 'death_function', 'owner')
+
+    def __init__(self, hp, defense, power, death_function=None):
+        self.max_hp = hp
+        self.hp = hp
+        self.defense = defense
+        self.power = power
+        self.death_function = death_function
+
+    def take_damage(self, damage, game):
+        #apply damage if possible
+        if damage > 0:
+            self.hp -= damage
+        if self.hp <= 0:
+            function = self.death_function
+            if function is not None:
+                function(self.owner, game)
+
+    def attack(self, target, game):
+        #a simple formula for attack damage
+        damage = self.power - target.fighter.defense
+
+        game.events.emit(AttackEvent(game.turn, self.owner.name, target.name, damage))
+        if damage > 0:
+            #make the target take some damage
+            target.fighter.take_damage(damage, game)
+
+    def heal(self, amount):
+        #heal by the given amount, without going over the maximum
+        self.hp += amount
+        if self.hp > self.max_hp:
+            self.hp = self.max_hp
+
+class BasicMonster:
+    #AI for a basic monster.
+    __slots__ = ('speed', 'owner')
+
+    def __init__(self, speed=NORMAL_SPEED):
+        #how often it acts: twice the normal speed is two actions per player turn
+        self.speed = speed
+
+    def take_turn(self, game):
+        #a basic monster takes its turn. If you can see it, it can see you.
+        #out of view, only the game's visible_tiles, roaming, rng and
+        #is_blocked() are used (regions.py runs it on a stand-in for a far region)
+        monster = self.owner
+        player = game.player
+        #if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+        coord = (monster.x, monster.y)
+        if coord in game.visible_tiles:
+
+            #move towards player if far away, following the flow field (or
+            #in a straight line if the player is too far away for it)
+            if monster.distance_to(player) >= 2:
+                step = game.flow.best_step(monster.x, monster.y, game.is_blocked)
+                if step is None:
+                    monster.move_towards(player.x, player.y, game)
+                elif step != (0, 0):
+                    monster.move(step[0], step[1], game)
+
+            #close enough, attack! (if the player is still alive.)
+            elif player.fighter.hp > 0:
+                monster.fighter.attack(player, game)
+
+        elif game.roaming:
+            #out of view, with the roaming rules: it wanders about and slowly heals
+            rng = game.rng
+            if rng.random() < REGEN_CHANCE:
+                monster.fighter.heal(1)
+            if rng.random() < ROAM_CHANCE:
+                (dx, dy) = rng.choice(DIRECTIONS)
+                monster.move(dx, dy, game)
+
+class GameObject:
+    # this is a generic object: the player, a monster, an item, the stairs...
+    # it's always represented by a character on screen.
+    __slots__ = ('name', 'blocks', 'x', 'y', 'char', 'color', 'fighter', 'ai', 'item', 'index')
+
+    def __init__(self, x, y, char, name, color, blocks=False, fighter=None, ai=None, item=None):
+        self.name = name
+        self.blocks = blocks
+        self.x = x
+        self.y = y
+        self.char = char
+        self.color = color
+
+        self.fighter = fighter
+        if self.fighter:  #let the fighter component know who owns it
+            self.fighter.owner = self
+
+        self.ai = ai
+        if self.ai:  #let the AI component know who owns it
+            self.ai.owner = self
+
+        self.item = item
+        if self.item:  #let the Item component know who owns it
+            self.item.owner = self
+
+        #the spatial index of the object list it is in, set by ObjectList
+        self.index = None
+
+    def place(self, x, y):
+        #put the object at (x, y), keeping the spatial index up to date
+        if self.index is not None:
+            self.index.move(self, x, y)
+        else:
+            self.x = x
+            self.y = y
+
+    def move(self, dx, dy, game):
+        #move by the given amount, if the destination is not blocked
+        if not game.is_blocked(self.x + dx, self.y + dy):
+            self.place(self.x + dx, self.y + dy)
+            #print(str(self.x) + " " + str(self.y))
+
+    def move_towards(self, target_x, target_y, game):
+        #vector from this object to the target, and distance
+        dx = target_x - self.x
+        dy = target_y - self.y
+        distance = math.sqrt(dx ** 2 + dy ** 2)
+
+        #normalize it to length 1 (preserving direction), then round it and
+        #convert to integer so the movement is restricted to the map grid
+        dx = int(round(dx / distance))
+        dy = int(round(dy / distance))
+        self.move(dx, dy, game)
+
+    def distance_to(self, other):
+        #return the distance to another object
+        dx = other.x - self.x
+        dy = other.y - self.y
+        return math.sqrt(dx ** 2 + dy ** 2)
+
+    def draw(self, con, visible_tiles, camera=(0, 0)):
+        #the tile at "camera" is drawn at the console's (0, 0), over the
+        #background the map gave that cell
+        coord = (self.x, self.y)
+        if coord in visible_tiles:
+            con.drawChar(self.x - camera[0], self.y - camera[1], self.char, self.color, bgcolor=None)
+
+class Item:
+    #an item that can be picked up and used.
+    __slots__ = ('use_function', 'owner')
+
+    def __init__(self, use_function=None):
+        self.use_function = use_function
+
+    def pick_up(self, game):
+        #add to the player's inventory and remove from the map
+        if len(game.inventory) >= 26:
+            game.events.emit(PickupEvent(game.turn, self.owner.name, picked_up=False))
+        else:
+            game.inventory.append(self.owner)
+            game.objects.remove(self.owner)
+            game.events.emit(PickupEvent(game.turn, self.owner.name))
+    def use(self, game):
+        #just call the "use_function" if it is defined
+        if self.use_function is None:
+            game.message('The ' + self.owner.name + ' cannot be used.')
+        else:
+            if self.use_function(game) != 'cancelled':
+                game.inventory.remove(self.owner)  #destroy after use, unless it was cancelled for some reason
+
+def player_death(player, game):
+    #the game ended!
+    game.events.emit(DeathEvent(game.turn, player.name, player=True))
+    game.game_state = 'dead'
+
+    #for added effect, transform the player into a corpse!
+    player.char = '%'
+    player.color = color_dark_red
+
+def monster_death(monster, game):
+    #transform it into a nasty corpse! it doesn't block, can't be
+    #attacked and doesn't move: it's no longer an object at all, only a
+    #decal on the map (see decals.py)
+    game.events.emit(DeathEvent(game.turn, monster.name))
+    game.map.decals.add(monster.x, monster.y, '%', color_dark_red, 'remains of ' + monster.name)
+    monster.fighter = None
+    monster.ai = None
+    game.objects.remove(monster)
+
+def cast_heal(game):
+    #heal the player
+    player = game.player
+    if player.fighter.hp == player.fighter.max_hp:
+        game.message('You are already at full health.', color_dark_red)
+        return 'cancelled'
+
+    game.message('Your wounds start to feel better!', color_violet)
+    player.fighter.heal(game.heal_amount)
+
+#the kinds of objects a new level can contain, see create_object()
+OBJECT_KINDS = ['orc', 'troll', 'healing potion', 'stairs', 'upstairs']
+
+def create_object(kind, x, y, fighter_stats=FIGHTER_STATS):
+    #make a new object of one of the OBJECT_KINDS, monsters get their
+    #(hp, defense, power) from fighter_stats
+    if kind == 'orc':
+        (hp, defense, power) = fighter_stats['orc']
+        fighter_component = Fighter(hp=hp, defense=defense, power=power, death_function=monster_death)
+        ai_component = BasicMonster()
+        return GameObject(x, y, 'o', 'orc', color_green, blocks=True, fighter=fighter_component, ai=ai_component)
+    elif kind == 'troll':
+        (hp, defense, power) = fighter_stats['troll']
+        fighter_component = Fighter(hp=hp, defense=defense, power=power, death_function=monster_death)
+        ai_component = BasicMonster()
+        return GameObject(x, y, 'I', 'troll', color_dark_green, blocks=True, fighter=fighter_component, ai=ai_component)
+    elif kind == 'healing potion':
+        item_component = Item(use_function=cast_heal)
+        return GameObject(x, y, '!', 'healing potion', color_violet, item=item_component)
+    elif kind == 'stairs':
+        return GameObject(x, y, '<', 'stairs', [255, 255, 255])
+    elif kind == 'upstairs':
+        return GameObject(x, y, '>', 'upstairs', [255, 255, 255])
+    raise ValueError('unknown kind of object: ' + kind)
+
+#a level packed by Game.pack_level(): header, the zlib-compressed "blocked"
+#and "block_sight" layers, then one (kind, x, y) entry per object in the order
+#of the object list (the spatial index sorts each tile out for drawing). kind
+#is an index into OBJECT_KINDS, or PLAYER_KIND for the player.
+LEVEL_MAGIC = b'RLVL'
+LEVEL_VERSION = 1
+PLAYER_KIND = 255
+_LEVEL_HEADER = struct.Struct('<4sBHHI')
+_LEVEL_OBJECT = struct.Struct('<BHH')
+
+#a level the player left, compressed by Game.freeze_level(): zlib of a header
+#(width, height, object count), the blocked, block_sight and explored layers
+#as bits (see levels.py), the decals (one byte per tile, then their kinds, see
+#decals.py), then the objects one after the other: position,
+#char, color, flags (FROZEN_*), name, then the components it has. functions
+#(death_function, use_function) are written as indices into COMPONENT_FUNCTIONS
+_FROZEN_HEADER = struct.Struct('<HHI')
+_FROZEN_OBJECT = struct.Struct('<HHI3BBB')
+_FROZEN_FIGHTER = struct.Struct('<hhhhB')
+_FROZEN_AI = struct.Struct('<H')
+_FROZEN_ITEM = struct.Struct('<B')
+FROZEN_BLOCKS = 1
+FROZEN_FIGHTER = 2
+FROZEN_AI = 4
+FROZEN_ITEM = 8
+FROZEN_STAIRS = 16
+FROZEN_UPSTAIRS = 32
+FROZEN_PLAYER = 64
+NO_FUNCTION = 255
+
+COMPONENT_FUNCTIONS = [player_death, monster_death, cast_heal]
+
+def _function_index(function):
+    if function is None:
+        return NO_FUNCTION
+    return COMPONENT_FUNCTIONS.index(function)
+
+def _function_at(i):
+    if i == NO_FUNCTION:
+        return None
+    return COMPONENT_FUNCTIONS[i]
+
+def pack_object(obj, parts, flags=0):
+    #an object and its components as bytes, appended to parts
+    name = obj.name.encode('utf-8')[:255]
+    if obj.blocks:
+        flags |= FROZEN_BLOCKS
+    if obj.fighter:
+        flags |= FROZEN_FIGHTER
+    if obj.ai:
+        flags |= FROZEN_AI
+    if obj.item:
+        flags |= FROZEN_ITEM
+    parts.append(_FROZEN_OBJECT.pack(obj.x, obj.y, ord(obj.char), obj.color[0], obj.color[1], obj.color[2],
+                                     flags, len(name)))
+    parts.append(name)
+    if obj.fighter:
+        fighter = obj.fighter
+        parts.append(_FROZEN_FIGHTER.pack(fighter.max_hp, fighter.hp, fighter.defense, fighter.power,
+                                          _function_index(fighter.death_function)))
+    if obj.ai:
+        parts.append(_FROZEN_AI.pack(obj.ai.speed))
+    if obj.item:
+        parts.append(_FROZEN_ITEM.pack(_function_index(obj.item.use_function)))
+
+def unpack_object(data, pos):
+    #the object pack_object() wrote at pos, returns (object, flags, next pos)
+    (x, y, char, r, g, b, flags, length) = _FROZEN_OBJECT.unpack_from(data, pos)
+    pos += _FROZEN_OBJECT.size
+    name = bytes(data[pos:pos + length]).decode('utf-8')
+    pos += length
+    fighter = ai = item = None
+    if flags & FROZEN_FIGHTER:
+        (max_hp, hp, defense, power, death) = _FROZEN_FIGHTER.unpack_from(data, pos)
+        pos += _FROZEN_FIGHTER.size
+        fighter = Fighter(hp=max_hp, defense=defense, power=power, death_function=_function_at(death))
+        fighter.hp = hp
+    if flags & FROZEN_AI:
+        (speed,) = _FROZEN_AI.unpack_from(data, pos)
+        pos += _FROZEN_AI.size
+        ai = BasicMonster(speed)
+    if flags & FROZEN_ITEM:
+        (use,) = _FROZEN_ITEM.unpack_from(data, pos)
+        pos += _FROZEN_ITEM.size
+        item = Item(use_function=_function_at(use))
+    obj = GameObject(x, y, chr(char), name, [r, g, b], blocks=bool(flags & FROZEN_BLOCKS),
+                     fighter=fighter, ai=ai, item=item)
+    return (obj, flags, pos)
+
+def make_fov_function(algorithm=FOV_ALGO, radius=TORCH_RADIUS, light_walls=FOV_LIGHT_WALLS):
+    #the FOV function for FovCache: the python shadowcasting, or tdl's
+    #quickFOV with one of its algorithms
+    if algorithm == 'SHADOWCAST':
+        return Shadowcaster(radius, light_walls)
+    #only imported here, so a game that doesn't use quickFOV runs without
+    #tdl (and libtcod) installed
+    import tdl
+    return functools.partial(tdl.map.quickFOV, fov=algorithm, radius=radius, lightWalls=light_walls)
+
+def level_seed(seed, dungeon_level):
+    #the seed a level is generated from, so it comes out the same whether it
+    #was made ahead of time or when the player got there
+    return (seed * 0x9E3779B97F4A7C15 + dungeon_level) % 2**64
+
+def seed_argument(text):
+    #argparse type of a --seed option. seeds are written as 64 bit unsigned
+    #numbers in recordings and saves, so any other number is refused here
+    #instead of failing half way through the game
+    seed = int(text)
+    if not 0 <= seed < 2**64:
+        raise argparse.ArgumentTypeError('the seed must be between 0 and 2**64 - 1, not %i' % seed)
+    return seed
+
+def generate_level(settings, seed):
+    #build a level with a fresh Game, and return it packed. runs fine in a
+    #worker process (see levelgen.py)
+    return Game(seed=seed, **settings).pack_level()
+
+class Game:
+    #the state of one game (map, objects, inventory, messages) and the turn
+    #logic that changes it. nothing here opens a window or draws anything,
+    #so a Game can be played headless: call player_move_or_attack() or
+    #pick_up() for the player's action, then monsters_take_turn().
+    def __init__(self, seed=None, fov_function=None, map_width=MAP_WIDTH, map_height=MAP_HEIGHT,
+                 max_rooms=MAX_ROOMS, max_room_monsters=MAX_ROOM_MONSTERS, max_room_items=MAX_ROOM_ITEMS,
+                 heal_amount=HEAL_AMOUNT, fighter_stats=FIGHTER_STATS, generate=True, world=None,
+                 roaming=False):
+        #all the randomness of a game comes from its own generator, so the
+        #same seed (and the same input) always plays out the same way
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.map_width = map_width
+        self.map_height = map_height
+        self.max_rooms = max_rooms
+        self.max_room_monsters = max_room_monsters
+        self.max_room_items = max_room_items
+        self.heal_amount = heal_amount
+        self.fighter_stats = fighter_stats
+        #the monsters out of view wander and heal instead of waiting (see
+        #BasicMonster), the far ones too when "regions" is set
+        self.roaming = roaming
+        #where the next levels come from when pregenerated (see levelgen.py),
+        #otherwise they are generated when the player takes the stairs
+        self.level_source = None
+        #with the roaming rules, simulates the monsters far from the player
+        #in worker processes (see regions.py), otherwise they don't do
+        #anything while asleep
+        self.regions = None
+        self.dungeon_level = 1
+        #the levels the player left, to find them again when going back
+        self.levels = LevelManager(self.freeze_level, self.thaw_level)
+        #the stairs to the level above, none on the first level
+        self.upstairs = None
+        #how the FOV is computed, FOV_ALGO unless told otherwise
+        if fov_function is None:
+            fov_function = make_fov_function()
+        self.fov_function = fov_function
+
+        self.game_state = 'playing'
+        #set whenever visible_tiles changes, the renderer resets it
+        self.fov_recompute = True
+
+        (hp, defense, power) = fighter_stats['player']
+        fighter_component = Fighter(hp=hp, defense=defense, power=power, death_function=player_death)
+        self.player = GameObject(0, 0, '@', 'player', [255, 255, 255], blocks=True, fighter=fighter_component)
+
+        #create the list of game messages and their colors, starts empty
+        self.game_msgs = []
+        #what happens in a turn goes through the event bus (see events.py),
+        #shown in the message log at the end of the turn. more sinks can be added
+        self.events = EventBus([MessageLogSink(self)])
+        #player turns played so far
+        self.turn = 0
+
+        self.objects = ObjectList([self.player])
+        self.inventory = []
+
+        #a game loaded from a save (see savegame.py) gets its map, objects
+        #and messages from there instead
+        if not generate:
+            return
+
+        #generate map (at this point it's not drawn to the screen), or the
+        #overworld kept in "world", a ChunkStore (see world.py)
+        if world is not None:
+            self.make_world(world)
+        else:
+            self.make_map()
+
+        #a warm welcoming message!
+        self.message('Welcome stranger! Prepare to perish in the Tombs of the Ancient Kings.', color_dark_red)
+
+    def create_room(self, room):
+        #make the tiles inside the rectangle passable, one row slice at a time
+        self.map.carve_rect(room.x1 + 1, room.y1 + 1, room.x2, room.y2)
+
+    def create_h_tunnel(self, x1, x2, y):
+        self.map.carve_h_line(int(x1), int(x2), int(y))
+
+    def create_v_tunnel(self, y1, y2, x):
+        #vertical tunnel
+        self.map.carve_v_line(int(y1), int(y2), int(x))
+
+    def is_blocked(self, x, y):
+        map = self.map
+        #first test the map tile
+        if map.blocked[y * map.width + x]:
+            return True
+
+        #now check for any blocking objects on that tile
+        for object in self.objects.index.at(x, y):
+            if object.blocks:
+                return True
+
+        return False
+
+    def place_objects(self, room):
+        num_monsters = self.rng.randint(0, self.max_room_monsters)
+
+        for i in range(num_monsters):
+            #choose random spot for this monster
+            x = self.rng.randint(room.x1+1, room.x2-1)
+            y = self.rng.randint(room.y1+1, room.y2-1)
+
+            #only place it if the tile is not blocked
+            if not self.is_blocked(x, y):
+                if self.rng.randint(0, 100) < 80:
+                    monster = create_object('orc', x, y, self.fighter_stats)
+                else:
+                    monster = create_object('troll', x, y, self.fighter_stats)
+
+                self.objects.append(monster)
+
+        #choose random number of items
+        num_items = self.rng.randint(0, self.max_room_items)
+
+        for i in range(num_items):
+            #choose random spot for this item
+            x = self.rng.randint(room.x1+1, room.x2-1)
+            y = self.rng.randint(room.y1+1, room.y2-1)
+
+            #only place it if the tile is not blocked
+            if not self.is_blocked(x, y):
+                #create a healing potion
+                item = create_object('healing potion', x, y)
+
+                self.objects.append(item)
+
+    def make_map(self):
+        #fill map with "blocked" tiles
+        self.map = GameMap(self.map_width, self.map_height)
+        #field of view over that map, results are cached per position
+        self.fov = FovCache(self.map, self.fov_function)
+        #the way to the player for the monsters
+        self.flow = FlowField(self.map)
+
+        rooms = []
+        num_rooms = 0
+        #the rooms again, filed by area, so checking a new room for overlaps
+        #only looks at its neighbours even with thousands of rooms
+        room_grid = RectGrid(ROOM_MAX_SIZE + 1)
+
+        #at least one room: the first one can't overlap anything, so the
+        #player and the stairs always have one
+        for r in range(max(self.max_rooms, 1)):
+            #random width and height
+            w = self.rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            h = self.rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            #random position without going out of the boundaries of the map
+            x = self.rng.randint(0, self.map_width - w - 1)
+            y = self.rng.randint(0, self.map_height - h - 1)
+            #"Rect" class makes rectangles easier to work with
+            new_room = Rect(x, y, w, h)
+
+            #see if any of the other rooms intersect with this one
+            failed = room_grid.intersects_any(new_room)
+
+            if not failed:
+                #this means there are no intersections, so this room is valid
+
+                #"paint" it to the map's tiles
+                self.create_room(new_room)
+
+                #add some contents to this room, such as monsters
+                self.place_objects(new_room)
+
+                #center coordinates of new room, will be useful later
+                (new_x, new_y) = new_room.center()
+
+                if num_rooms == 0:
+                    #this is the first room, where the player starts at
+                    self.player.place(new_x, new_y)
+                else:
+                    #all rooms after the first:
+                    #connect it to the previous room with a tunnel
+
+                    #center coordinates of previous room
+                    (prev_x, prev_y) = rooms[num_rooms-1].center()
+
+                    #draw a coin (random number that is either 0 or 1)
+                    if self.rng.randint(0, 1) == 1:
+                        #first move horizontally, then vertically
+                        self.create_h_tunnel(prev_x, new_x, prev_y)
+                        self.create_v_tunnel(prev_y, new_y, new_x)
+                    else:
+                        #first move vertically, then horizontally
+                        self.create_v_tunnel(prev_y, new_y, prev_x)
+                        self.create_h_tunnel(prev_x, new_x, new_y)
+
+                #finally, append the new room to the list
+                rooms.append(new_room)
+                room_grid.add(new_room)
+                num_rooms += 1
+
+        #create stairs at the center of the last room
+        self.stairs = create_object('stairs', new_x, new_y)
+        self.objects.append(self.stairs)
+
+        self.recompute_fov()
+        self.schedule_monsters()
+
+    def make_world(self, store):
+        #an overworld instead of a dungeon level, without stairs. its chunks
+        #are made by generate_chunk() as the player gets near them
+        self.map = ChunkedMap(store)
+        self.fov = FovCache(self.map, self.fov_function)
+        self.flow = FlowField(self.map)
+        self.stairs = None
+        #the monsters are scheduled as their chunk is made, and leave with
+        #the other objects when it's dropped from memory
+        self.scheduler = TurnScheduler()
+        store.generate = self.generate_chunk
+        store.save_objects = self.save_chunk_objects
+        store.load_objects = self.load_chunk_objects
+
+        #the player starts on open ground near the middle of the world
+        (x, y) = (store.width // 2, store.height // 2)
+        store.generate_around(x, y, CHUNK_SIZE)
+        while self.is_blocked(x, y):
+            x += 1
+        self.player.place(x, y)
+        self.recompute_fov()
+
+    def generate_chunk(self, chunk, x0, y0):
+        #fill a chunk of the world whose first tile is (x0, y0). it has a
+        #generator of its own, so it comes out the same whenever it's made
+        rng = random.Random('%i/%i/%i' % (self.seed, x0, y0))
+        overworld_chunk(chunk, x0, y0, self.map.width, self.map.height, rng)
+        blocked = chunk.layers[0]
+
+        def open_tile():
+            #a random tile of the chunk (on the map), None if it's blocked
+            (x, y) = (rng.randrange(CHUNK_SIZE), rng.randrange(CHUNK_SIZE))
+            if (blocked[y * CHUNK_SIZE + x] or x0 + x >= self.map.width or y0 + y >= self.map.height or
+                    self.objects.index.at(x0 + x, y0 + y)):
+                return None
+            return (x0 + x, y0 + y)
+
+        for i in range(rng.randint(0, 2 * self.max_room_monsters)):
+            tile = open_tile()
+            if tile is not None:
+                kind = 'orc' if rng.randint(0, 100) < 80 else 'troll'
+                monster = create_object(kind, tile[0], tile[1], self.fighter_stats)
+                self.objects.append(monster)
+                self.scheduler.add(monster)
+
+        for i in range(rng.randint(0, self.max_room_items)):
+            tile = open_tile()
+            if tile is not None:
+                item = create_object('healing potion', tile[0], tile[1])
+                self.objects.append(item)
+
+    def save_chunk_objects(self, chunk, x0, y0):
+        #take the objects off a chunk of the world that is dropped from
+        #memory, and return them as bytes: one after the other, as
+        #pack_object() writes them (like a save, see savegame.py)
+        at = self.objects.index.at
+        leaving = [obj for y in range(y0, y0 + CHUNK_SIZE) for x in range(x0, x0 + CHUNK_SIZE)
+                   for obj in at(x, y) if obj is not self.player]
+        parts = []
+        for obj in leaving:
+            pack_object(obj, parts)
+            self.objects.remove(obj)
+            if obj.ai:
+                self.scheduler.forget(obj)
+        return b''.join(parts)
+
+    def load_chunk_objects(self, chunk, x0, y0, data):
+        #put back the objects save_chunk_objects() took off the chunk
+        pos = 0
+        while pos < len(data):
+            (obj, flags, pos) = unpack_object(data, pos)
+            self.objects.append(obj)
+            if obj.ai:
+                self.scheduler.add(obj)
+
+    def schedule_monsters(self):
+        #a new scheduler for the monsters of a new level
+        self.scheduler = TurnScheduler()
+        for obj in self.objects:
+            if obj.ai:
+                self.scheduler.add(obj)
+
+    def settings(self):
+        #what a level generated for this game depends on, besides its seed
+        return dict(map_width=self.map_width, map_height=self.map_height,
+                    max_rooms=self.max_rooms, max_room_monsters=self.max_room_monsters,
+                    max_room_items=self.max_room_items, fighter_stats=self.fighter_stats)
+
+    def pack_level(self):
+        #the map and the objects on it, as compact bytes (see LEVEL_MAGIC)
+        map = self.map
+        layers = zlib.compress(bytes(map.blocked) + bytes(map.block_sight), 1)
+        parts = [_LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, map.width, map.height, len(self.objects)),
+                 struct.pack('<I', len(layers)), layers]
+        for obj in self.objects:
+            kind = PLAYER_KIND if obj is self.player else OBJECT_KINDS.index(obj.name)
+            parts.append(_LEVEL_OBJECT.pack(kind, obj.x, obj.y))
+        return b''.join(parts)
+
+    def load_level(self, data):
+        #replace the map and its objects with a level from pack_level()
+        (magic, version, width, height, count) = _LEVEL_HEADER.unpack_from(data, 0)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError('not a packed level')
+        pos = _LEVEL_HEADER.size
+        (size,) = struct.unpack_from('<I', data, pos)
+        pos += 4
+        layers = zlib.decompress(data[pos:pos + size])
+        pos += size
+
+        self.map = GameMap(width, height)
+        self.map.blocked[:] = layers[:width * height]
+        self.map.block_sight[:] = layers[width * height:]
+        self.fov = FovCache(self.map, self.fov_function)
+        self.flow = FlowField(self.map)
+
+        self.objects = ObjectList()
+        for i in range(count):
+            (kind, x, y) = _LEVEL_OBJECT.unpack_from(data, pos)
+            pos += _LEVEL_OBJECT.size
+            if kind == PLAYER_KIND:
+                self.objects.append(self.player)
+                self.player.place(x, y)
+            else:
+                obj = create_object(OBJECT_KINDS[kind], x, y, self.fighter_stats)
+                if obj.name == 'stairs':
+                    self.stairs = obj
+                self.objects.append(obj)
+        self.recompute_fov()
+        self.schedule_monsters()
+
+    def freeze_level(self, level):
+        #a Level as compressed bytes (see _FROZEN_HEADER), for the LevelManager
+        map = level.map
+        parts = [_FROZEN_HEADER.pack(map.width, map.height, len(level.objects)),
+                 pack_bits(map.blocked), pack_bits(map.block_sight), pack_bits(map.explored),
+                 map.decals.cells]
+        map.decals.pack_kinds(parts)
+        for obj in level.objects:
+            flags = 0
+            if obj is level.stairs:
+                flags = FROZEN_STAIRS
+            elif obj is level.upstairs:
+                flags = FROZEN_UPSTAIRS
+            pack_object(obj, parts, flags)
+        return zlib.compress(b''.join(parts), 1)
+
+    def thaw_level(self, data):
+        #the Level freeze_level() compressed
+        data = zlib.decompress(data)
+        (width, height, count) = _FROZEN_HEADER.unpack_from(data, 0)
+        pos = _FROZEN_HEADER.size
+        n = width * height
+        size = (n + 7) // 8
+        map = GameMap(width, height)
+        map.blocked[:] = unpack_bits(data[pos:pos + size], n)
+        map.block_sight[:] = unpack_bits(data[pos + size:pos + 2 * size], n)
+        map.explored[:] = unpack_bits(data[pos + 2 * size:pos + 3 * size], n)
+        pos += 3 * size
+        map.decals.cells[:] = data[pos:pos + n]
+        pos = map.decals.unpack_kinds(data, pos + n)
+
+        level = Level(map, ObjectList(), None)
+        for i in range(count):
+            (obj, flags, pos) = unpack_object(data, pos)
+            if flags & FROZEN_STAIRS:
+                level.stairs = obj
+            elif flags & FROZEN_UPSTAIRS:
+                level.upstairs = obj
+            level.objects.append(obj)
+        return level
+
+    def level_data(self, dungeon_level):
+        #a level as it was first generated, packed. the first level comes
+        #from the game's own seed, the others from their level_seed()
+        if dungeon_level == 1:
+            return generate_level(self.settings(), self.seed)
+        data = None
+        if self.level_source is not None:
+            data = self.level_source.take(dungeon_level)
+        if data is None:
+            data = generate_level(self.settings(), level_seed(self.seed, dungeon_level))
+        return data
+
+    def leave_level(self):
+        #keep the current level (without the player) in the level manager
+        self.objects.remove(self.player)
+        self.levels.store(self.dungeon_level, Level(self.map, self.objects, self.stairs, self.upstairs))
+
+    def enter_level(self, dungeon_level, arrive_at):
+        #make dungeon_level the current level, the player arrives at its
+        #'stairs' or 'upstairs'. it's the level as the player left it, or a
+        #new one if it wasn't visited (or was forgotten since)
+        self.dungeon_level = dungeon_level
+        level = self.levels.take(dungeon_level)
+        if level is None:
+            self.load_level(self.level_data(dungeon_level))
+            if dungeon_level > 1:
+                #the stairs up are where the player starts on a new level
+                self.upstairs = create_object('upstairs', self.player.x, self.player.y)
+                self.objects.append(self.upstairs)
+            else:
+                self.upstairs = None
+        else:
+            self.map = level.map
+            self.objects = level.objects
+            self.stairs = level.stairs
+            self.upstairs = level.upstairs
+            self.fov = FovCache(self.map, self.fov_function)
+            self.flow = FlowField(self.map)
+            self.objects.append(self.player)
+            self.schedule_monsters()
+        if arrive_at == 'upstairs':
+            self.player.place(self.upstairs.x, self.upstairs.y)
+        else:
+            self.player.place(self.stairs.x, self.stairs.y)
+        self.recompute_fov()
+
+    def next_level(self):
+        #advance to the next level
+        if self.dungeon_level + 1 not in self.levels:
+            self.message('You descend deeper into the heart of the dungeon...', color_dark_red)
+        else:
+            self.message('You descend again.', color_dark_red)
+        self.leave_level()
+        self.enter_level(self.dungeon_level + 1, 'upstairs')
+
+    def previous_level(self):
+        #go back to the level above
+        self.message('You climb back up the stairs.', color_violet)
+        self.leave_level()
+        self.enter_level(self.dungeon_level - 1, 'stairs')
+
+    def descend(self):
+        #go down stairs, if the player is on them
+        stairs = self.stairs
+        if stairs is not None and stairs.x == self.player.x and stairs.y == self.player.y:
+            self.next_level()
+            return True
+        return False
+
+    def ascend(self):
+        #go up stairs, if the player is on them
+        upstairs = self.upstairs
+        if upstairs is not None and upstairs.x == self.player.x and upstairs.y == self.player.y:
+            self.previous_level()
+            return True
+        return False
+
+    def recompute_fov(self):
+        if self.map.chunked:
+            #make the world around the player before anything looks at it,
+            #always in the same order so the same game comes out
+            self.map.store.generate_around(self.player.x, self.player.y, CHUNK_SIZE)
+        self.visible_tiles = self.fov.compute(self.player.x, self.player.y)
+        self.fov_recompute = True
+
+    def message(self, new_msg, color = [255, 255, 255]):
+        #split the message if necessary, among multiple lines
+        if len(new_msg) <= MSG_WIDTH and new_msg.isprintable() and new_msg.strip() and not new_msg[-1].isspace():
+            new_msg_lines = [new_msg]  #fits in one line, no need to wrap it
+        else:
+            new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
+
+        #add the new lines as tuples, with the text and the color
+        self.game_msgs.extend([(line, color) for line in new_msg_lines])
+        #if the buffer is full, remove the first lines to make room for the new ones
+        if len(self.game_msgs) > MSG_HEIGHT:
+            del self.game_msgs[:-MSG_HEIGHT]
+
+    def player_move_or_attack(self, dx, dy):
+        player = self.player
+        #the coordinates the player is moving to/attacking
+        x = player.x + dx
+        y = player.y + dy
+
+        #try to find an attackable object there
+        target = None
+        for object in self.objects.index.at(x, y):
+            if object.fighter:
+                target = object
+                break
+
+        #attack if target found, move otherwise
+        if target is not None:
+            player.fighter.attack(target, self)
+        else:
+            player.move(dx, dy, self)
+            self.recompute_fov()
+
+    def pick_up(self):
+        #pick up an item in the player's tile, if there is one
+        player = self.player
+        for object in self.objects.index.at(player.x, player.y):
+            if object.item:
+                object.item.pick_up(self)
+                break
+
+    def monsters_take_turn(self):
+        #let monsters take their turn
+        if self.game_state == 'playing':
+            self.turn += 1
+            #one field to the player, shared by all the monsters
+            self.flow.update(self.player.x, self.player.y)
+            #the far regions go on in the workers while the monsters that
+            #are awake, and whose turn it is, act
+            regions = self.regions
+            if regions is not None:
+                regions.start(self)
+            self.scheduler.run_turn(self)
+            if regions is not None:
+                regions.finish(self)
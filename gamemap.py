@@ -0,0 +1,155 @@
+from decals import DecalLayer
+
+#turns a byte that is 1 for opaque tiles into 1 for transparent ones
+_FLIP = bytes([1, 0]) + bytes(254)
+
+class GameMap:
+    #the tiles of the map. instead of one Tile object per cell, every property
+    #is kept in a flat bytearray (one byte per tile, row by row), so a big map
+    #costs a few bytes per tile and rooms/tunnels are carved with slice writes.
+    #a chunked map (see world.py) is only ever in memory around the player
+    chunked = False
+
+    def __init__(self, width, height, blocked=True):
+        self.width = width
+        self.height = height
+
+        #by default, every tile starts blocked (a wall), which also blocks sight
+        fill = 1 if blocked else 0
+        self.blocked = bytearray([fill]) * (width * height)
+        self.block_sight = bytearray(self.blocked)
+
+        #all tiles start unexplored
+        self.explored = bytearray(width * height)
+        #the remains of the dead, drawn under the objects
+        self.decals = DecalLayer(width, height)
+
+        #bumped every time "blocked" or "block_sight" change, so anything
+        #derived from them (FOV, pathfinding...) knows when to rebuild
+        self.version = 0
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        #keep map[x][y] working: map[x] is a column, map[x][y] a single tile
+        if x < 0 or x >= self.width:
+            raise IndexError('map column out of range')
+        return MapColumn(self, x)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        #position of the tile (x, y) in the flat arrays
+        return y * self.width + x
+
+    def is_blocked(self, x, y):
+        return self.blocked[y * self.width + x] == 1
+
+    def is_transparent(self, x, y):
+        i = y * self.width + x
+        return not (self.blocked[i] or self.block_sight[i])
+
+    def transparency(self):
+        #one byte per tile, 1 if light goes through it (see fov.py)
+        size = self.width * self.height
+        opaque = (int.from_bytes(self.blocked, 'little') |
+                  int.from_bytes(self.block_sight, 'little'))
+        return opaque.to_bytes(size, 'little').translate(_FLIP)
+
+    def window(self, layer, x1, y1, x2, y2, fill=1):
+        #the tiles x1 <= x < x2, y1 <= y < y2 of a layer (self.blocked...),
+        #row by row. the ones off the map are "fill"
+        w = self.width
+        (a, b) = (max(x1, 0), min(x2, w))
+        rows = []
+        for y in range(y1, y2):
+            if 0 <= y < self.height and a < b:
+                rows.append(bytes([fill]) * (a - x1) + layer[y * w + a:y * w + b] + bytes([fill]) * (x2 - b))
+            else:
+                rows.append(bytes([fill]) * (x2 - x1))
+        return b''.join(rows)
+
+    def carve_rect(self, x1, y1, x2, y2):
+        #make every tile with x1 <= x < x2 and y1 <= y < y2 passable
+        w = self.width
+        n = x2 - x1
+        if n <= 0 or y2 <= y1:
+            return
+        empty = bytes(n)
+        for y in range(y1, y2):
+            i = y * w + x1
+            self.blocked[i:i + n] = empty
+            self.block_sight[i:i + n] = empty
+        self.version += 1
+
+    def carve_h_line(self, x1, x2, y):
+        #horizontal tunnel, both ends included: one contiguous slice
+        x1, x2 = min(x1, x2), max(x1, x2)
+        i = y * self.width
+        empty = bytes(x2 - x1 + 1)
+        self.blocked[i + x1:i + x2 + 1] = empty
+        self.block_sight[i + x1:i + x2 + 1] = empty
+        self.version += 1
+
+    def carve_v_line(self, y1, y2, x):
+        #vertical tunnel, both ends included: a slice stepping one row at a time
+        y1, y2 = min(y1, y2), max(y1, y2)
+        w = self.width
+        start = y1 * w + x
+        stop = y2 * w + x + 1
+        empty = bytes(y2 - y1 + 1)
+        self.blocked[start:stop:w] = empty
+        self.block_sight[start:stop:w] = empty
+        self.version += 1
+
+class MapColumn:
+    #one column of the map, only used to support the map[x][y] syntax
+    __slots__ = ('map', 'x')
+
+    def __init__(self, map, x):
+        self.map = map
+        self.x = x
+
+    def __len__(self):
+        return self.map.height
+
+    def __getitem__(self, y):
+        if y < 0 or y >= self.map.height:
+            raise IndexError('map row out of range')
+        return TileView(self.map, y * self.map.width + self.x)
+
+class TileView:
+    #looks like the old Tile object, but reads and writes the map's arrays
+    __slots__ = ('map', 'i')
+
+    def __init__(self, map, i):
+        self.map = map
+        self.i = i
+
+    @property
+    def blocked(self):
+        return self.map.blocked[self.i] == 1
+
+    @blocked.setter
+    def blocked(self, value):
+        self.map.blocked[self.i] = 1 if value else 0
+        self.map.version += 1
+
+    @property
+    def block_sight(self):
+        return self.map.block_sight[self.i] == 1
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.map.block_sight[self.i] = 1 if value else 0
+        self.map.version += 1
+
+    @property
+    def explored(self):
+        return self.map.explored[self.i] == 1
+
+    @explored.setter
+    def explored(self, value):
+        self.map.explored[self.i] = 1 if value else 0
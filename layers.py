@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+#how many pre-rendered layers (menus...) a LayerCache keeps
+LAYER_CACHE_SIZE = 16
+
+class ConsolePool:
+    #offscreen consoles to reuse instead of allocating new ones, kept by size.
+    #"new_console" makes one when none of that size is free (tdl.Console)
+    def __init__(self, new_console):
+        self.new_console = new_console
+        #(width, height) -> consoles not in use
+        self.free = {}
+        self.allocated = 0
+
+    def get(self, width, height):
+        free = self.free.get((width, height))
+        if free:
+            return free.pop()
+        self.allocated += 1
+        return self.new_console(width, height)
+
+    def release(self, console):
+        self.free.setdefault((console.width, console.height), []).append(console)
+
+class Layer:
+    #an offscreen console with something drawn on it. it's drawn again only
+    #when what it shows (its "key") changes, then it can be blitted anywhere
+    def __init__(self, pool, width, height, draw):
+        self.console = pool.get(width, height)
+        self.draw = draw
+        self.key = None
+
+    def update(self, key, *args):
+        #draw(console, *args) if the key changed, returns whether it did
+        if key == self.key:
+            return False
+        self.key = key
+        self.console.clear()
+        self.draw(self.console, *args)
+        return True
+
+    def invalidate(self):
+        self.key = None
+
+class LayerCache:
+    #pre-rendered layers by key (a menu with its options...), the least
+    #recently used ones give their console back to the pool
+    def __init__(self, pool, max_entries=LAYER_CACHE_SIZE):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.layers = OrderedDict()
+
+    def get(self, key, width, height, draw):
+        #the console for key, drawn with draw(console) if it wasn't cached
+        console = self.layers.get(key)
+        if console is not None:
+            self.layers.move_to_end(key)
+            return console
+        console = self.pool.get(width, height)
+        console.clear()
+        draw(console)
+        self.layers[key] = console
+        if len(self.layers) > self.max_entries:
+            (old_key, old_console) = self.layers.popitem(last=False)
+            self.pool.release(old_console)
+        return console
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+from game import generate_level, level_seed
+
+#how many levels below the current one are kept ready
+LOOKAHEAD = 2
+
+class LevelPregenerator:
+    #generates the next levels of a game ahead of time in worker processes,
+    #so taking the stairs only has to unpack a level that is already built.
+    #set it as the game's level_source. levels come out exactly the same as
+    #the ones the game would generate itself (same seed per level).
+    def __init__(self, game, lookahead=LOOKAHEAD, processes=1):
+        self.settings = game.settings()
+        self.seed = game.seed
+        self.lookahead = lookahead
+        self.pool = ProcessPoolExecutor(max_workers=processes)
+        #dungeon level -> future of its packed data
+        self.pending = {}
+        self.request_after(game.dungeon_level)
+
+    def request(self, dungeon_level):
+        if dungeon_level not in self.pending:
+            self.pending[dungeon_level] = self.pool.submit(
+                generate_level, self.settings, level_seed(self.seed, dungeon_level))
+
+    def request_after(self, dungeon_level):
+        for i in range(1, self.lookahead + 1):
+            self.request(dungeon_level + i)
+
+    def take(self, dungeon_level):
+        #the packed level, waiting for it if it's still being built. None if
+        #it was never requested (the game then generates it itself)
+        future = self.pending.pop(dungeon_level, None)
+        self.request_after(dungeon_level)
+        if future is None:
+            return None
+        return future.result()
+
+    def close(self):
+        #drop the levels not started yet and wait for the one being built:
+        #leaving the workers behind makes the executor's exit hook fail
+        self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+#how many of the last visited levels are kept as they are (ready to play),
+#and how many bytes the older, compressed ones can take in all
+RECENT_LEVELS = 2
+LEVEL_MEMORY_BUDGET = 1 << 20
+
+def pack_bits(layer):
+    #a layer of 0/1 bytes as bits, 8 cells per byte (the first cell is the
+    #lowest bit). each of the 8 interleaved slices becomes one big integer,
+    #shifted to its bit, so it's all done without a python loop per cell
+    n = (len(layer) + 7) // 8
+    padded = bytes(layer) + bytes(n * 8 - len(layer))
+    packed = 0
+    for bit in range(8):
+        packed |= int.from_bytes(padded[bit::8], 'little') << bit
+    return packed.to_bytes(n, 'little')
+
+def unpack_bits(data, length):
+    #the layer of 0/1 bytes that pack_bits() turned into data
+    n = len(data)
+    packed = int.from_bytes(data, 'little')
+    ones = int.from_bytes(b'\x01' * n, 'little')
+    layer = bytearray(n * 8)
+    for bit in range(8):
+        layer[bit::8] = ((packed >> bit) & ones).to_bytes(n, 'little')
+    del layer[length:]
+    return layer
+
+class Level:
+    #a level of the dungeon that isn't being played: its map and the objects
+    #on it (the player excepted), with the stairs up and down among them
+    __slots__ = ('map', 'objects', 'stairs', 'upstairs')
+
+    def __init__(self, map, objects, stairs, upstairs=None):
+        self.map = map
+        self.objects = objects
+        self.stairs = stairs
+        self.upstairs = upstairs
+
+class LevelManager:
+    #keeps the levels the player left, to find them as they were when coming
+    #back. the last few stay as Level objects, the older ones are compressed
+    #with freeze(level) (to bytes) and brought back with thaw(data). when the
+    #compressed ones take more than the budget, the least recently visited
+    #are forgotten: going back there makes the level again from its seed.
+    def __init__(self, freeze, thaw, recent=RECENT_LEVELS, budget=LEVEL_MEMORY_BUDGET):
+        self.freeze = freeze
+        self.thaw = thaw
+        self.max_recent = recent
+        self.budget = budget
+        #dungeon level -> Level, and dungeon level -> compressed bytes, the
+        #least recently visited first
+        self.recent = OrderedDict()
+        self.compressed = OrderedDict()
+        self.compressed_size = 0
+
+    def store(self, dungeon_level, level):
+        self.recent[dungeon_level] = level
+        self.recent.move_to_end(dungeon_level)
+        while len(self.recent) > self.max_recent:
+            (old, old_level) = self.recent.popitem(last=False)
+            data = self.freeze(old_level)
+            self.compressed[old] = data
+            self.compressed_size += len(data)
+        while self.compressed_size > self.budget:
+            (old, data) = self.compressed.popitem(last=False)
+            self.compressed_size -= len(data)
+
+    def take(self, dungeon_level):
+        #the Level left at dungeon_level, None if it was never visited (or
+        #forgotten). it's no longer kept: store it again when leaving it
+        level = self.recent.pop(dungeon_level, None)
+        if level is not None:
+            return level
+        data = self.compressed.pop(dungeon_level, None)
+        if data is None:
+            return None
+        self.compressed_size -= len(data)
+        return self.thaw(data)
+
+    def __contains__(self, dungeon_level):
+        return dungeon_level in self.recent or dungeon_level in self.compressed
@@ -0,0 +1,124 @@
+from array import array
+from collections import deque
+from constants import *
+
+#how far (in steps) from the player the flow field is exact. monsters
+#farther away than this walk in a straight line, like before
+FLOW_RADIUS = 2 * TORCH_RADIUS
+
+#stored value of the tiles the field hasn't reached
+UNREACHED = 2 ** 30
+
+#on a chunked map the field only keeps the tiles it reached, and starts over
+#when it holds more than this many (a long walk leaves a trail behind)
+SPARSE_LIMIT = 4 * (2 * FLOW_RADIUS + 1) ** 2
+
+#the 8 steps a monster can take
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+class SparseField(dict):
+    #the stored distances of a chunked map, by tile index: the tiles not
+    #reached aren't stored, they read as UNREACHED
+    def __missing__(self, i):
+        return UNREACHED
+
+class FlowField:
+    #the number of steps from each tile to the player, over the walkable
+    #tiles of the map. it's computed once per turn and shared by all the
+    #monsters, each of them just steps to its neighbour closest to the player.
+    #
+    #when the player moves one tile, no tile can get more than one step
+    #farther, so the old distances plus one are an upper bound of the new
+    #ones: adding one everywhere is done in O(1) with an offset ("base"), and
+    #only the tiles that got closer are visited again. tiles up to "radius"
+    #steps away are always exact, the others are only upper bounds.
+    def __init__(self, map, radius=FLOW_RADIUS):
+        self.map = map
+        self.radius = radius
+        #distance of each tile is stored[i] + base
+        self.stored = None
+        self.base = 0
+        self.origin = None
+        self.map_version = None
+
+    def update(self, x, y):
+        #make the field lead to (x, y)
+        if self.origin == (x, y) and self.map_version == self.map.version:
+            return
+        if (self.origin is None or self.map_version != self.map.version or
+                max(abs(x - self.origin[0]), abs(y - self.origin[1])) > 1 or
+                (self.map.chunked and len(self.stored) > SPARSE_LIMIT)):
+            self.rebuild(x, y)
+            return
+
+        #moved one tile: everything is at most one step farther than before,
+        #then spread the tiles that got closer out from the new position
+        self.base += 1
+        self.origin = (x, y)
+        i = y * self.map.width + x
+        self.stored[i] = -self.base
+        self._relax(deque([(x, y)]))
+
+    def rebuild(self, x, y):
+        map = self.map
+        if map.chunked:
+            self.stored = SparseField()
+        else:
+            self.stored = array('i', [UNREACHED]) * (map.width * map.height)
+        self.base = 0
+        self.origin = (x, y)
+        self.map_version = map.version
+        self.stored[y * map.width + x] = 0
+        self._relax(deque([(x, y)]))
+
+    def _relax(self, queue):
+        #breadth-first: lower the neighbours of each queued tile if going
+        #through it is shorter, up to "radius" steps from the player
+        map = self.map
+        w = map.width
+        h = map.height
+        blocked = map.blocked
+        stored = self.stored
+        limit = self.radius - self.base
+        while queue:
+            (x, y) = queue.popleft()
+            d = stored[y * w + x] + 1
+            if d > limit:
+                continue
+            for (dx, dy) in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < w and 0 <= ny < h:
+                    i = ny * w + nx
+                    if d < stored[i] and not blocked[i]:
+                        stored[i] = d
+                        queue.append((nx, ny))
+
+    def distance(self, x, y):
+        #steps from (x, y) to the player, None if farther than "radius"
+        value = self.stored[y * self.map.width + x]
+        if value >= UNREACHED:
+            return None
+        value += self.base
+        if value > self.radius:
+            return None
+        return value
+
+    def best_step(self, x, y, is_blocked):
+        #the (dx, dy) that brings a monster at (x, y) closest to the player,
+        #(0, 0) if every step closer is blocked, None if it's too far away
+        current = self.distance(x, y)
+        if current is None:
+            return None
+        w = self.map.width
+        h = self.map.height
+        best = (0, 0)
+        for (dx, dy) in DIRECTIONS:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < w and 0 <= ny < h:
+                d = self.distance(nx, ny)
+                if d is not None and d < current and not is_blocked(nx, ny):
+                    current = d
+                    best = (dx, dy)
+        return best
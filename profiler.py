@@ -0,0 +1,120 @@
+import json
+import time
+from collections import deque
+
+#how many frames the rolling timings cover
+ROLLING_FRAMES = 300
+
+#upper bounds (in ms) of the frame time histogram buckets, the last one
+#catches everything slower
+HISTOGRAM_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))
+    return sorted_values[i]
+
+class FrameProfiler:
+    #times the phases of the main loop (rendering, input, FOV, monsters...).
+    #a function is timed by replacing it with wrap(phase, function), so when
+    #profiling is off nothing is wrapped and it costs nothing at all. the
+    #time of a phase doesn't include the phases nested in it (the FOV is
+    #computed while handling input, but only counts as "fov").
+    def __init__(self, idle_phases=('flush',)):
+        #phases that are mostly waiting (for the next frame), they
+        #are timed but don't count in the frame time
+        self.idle_phases = idle_phases
+        self.stack = []
+        #phase -> time spent in it during the current frame
+        self.current = {}
+        self.calls = {}
+        self.totals = {}
+        #phase -> the last ROLLING_FRAMES times (one per frame)
+        self.rolling = {}
+        self.frame_times = deque(maxlen=ROLLING_FRAMES)
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.frames = 0
+
+    def wrap(self, phase, function):
+        def timed(*args, **kwargs):
+            self.begin(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.end()
+        return timed
+
+    def begin(self, phase):
+        now = time.perf_counter()
+        if self.stack:
+            #pause the enclosing phase
+            outer = self.stack[-1]
+            self.current[outer[0]] = self.current.get(outer[0], 0.0) + now - outer[1]
+        self.stack.append([phase, now])
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def end(self):
+        now = time.perf_counter()
+        (phase, start) = self.stack.pop()
+        self.current[phase] = self.current.get(phase, 0.0) + now - start
+        if self.stack:
+            #resume the enclosing phase
+            self.stack[-1][1] = now
+
+    def end_frame(self):
+        #call once per iteration of the main loop
+        frame = 0.0
+        for phase in set(self.rolling) | set(self.current):
+            spent = self.current.get(phase, 0.0)
+            if phase not in self.rolling:
+                self.rolling[phase] = deque(maxlen=ROLLING_FRAMES)
+            self.rolling[phase].append(spent)
+            self.totals[phase] = self.totals.get(phase, 0.0) + spent
+            if phase not in self.idle_phases:
+                frame += spent
+        self.current = {}
+        self.frame_times.append(frame)
+        self.frames += 1
+
+        ms = frame * 1000
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def phase_stats(self, phase):
+        times = sorted(self.rolling.get(phase, ()))
+        return {
+            'calls': self.calls.get(phase, 0),
+            'total_ms': self.totals.get(phase, 0.0) * 1000,
+            'mean_ms': sum(times) / len(times) * 1000 if times else 0.0,
+            'p50_ms': percentile(times, 50) * 1000,
+            'p99_ms': percentile(times, 99) * 1000,
+        }
+
+    def overlay_lines(self):
+        #a few lines of text for the debug overlay
+        times = sorted(self.frame_times)
+        lines = ['frame p50 %.2fms p99 %.2fms' % (percentile(times, 50) * 1000,
+                                                  percentile(times, 99) * 1000)]
+        for phase in sorted(self.rolling):
+            stats = self.phase_stats(phase)
+            lines.append('%-8s %6.2fms p99 %6.2f %6i' % (phase, stats['mean_ms'],
+                                                         stats['p99_ms'], stats['calls']))
+        return lines
+
+    def dump(self, path):
+        times = sorted(self.frame_times)
+        labels = ['<=%ims' % bound for bound in HISTOGRAM_BUCKETS] + ['>%ims' % HISTOGRAM_BUCKETS[-1]]
+        data = {
+            'frames': self.frames,
+            'frame_p50_ms': percentile(times, 50) * 1000,
+            'frame_p99_ms': percentile(times, 99) * 1000,
+            'frame_histogram': dict(zip(labels, self.histogram)),
+            'phases': dict((phase, self.phase_stats(phase)) for phase in sorted(self.rolling)),
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
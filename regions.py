@@ -0,0 +1,204 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from game import pack_object, unpack_object
+from spatial import ObjectList
+from scheduler import SLEEP_RADIUS, REGION_SIZE, ACTION_COST, NORMAL_SPEED
+
+#the monsters far from the player are asleep (see scheduler.py). with the
+#roaming rules (see Game.roaming) the monsters out of view wander about and
+#slowly heal, and the far ones are simulated here, at a reduced rate and in
+#worker processes. the level is cut into square regions (the scheduler files
+#the sleeping monsters by region). every REGION_INTERVAL turns the regions
+#far enough from the player advance DISTANT_TICKS ticks at once, each of them
+#on its own: a worker gets the region's walls (and a tile around it), what
+#blocks around it and its monsters packed like in a save, and runs their
+#BasicMonster turns as the game would. a monster stepping out of its region
+#is handed off to the next one: the step is taken when the results are
+#merged back, if the tile is still free then. every region has its own
+#generator, so the results don't depend on how many processes there are.
+
+#player turns between two runs, and the ticks a run advances the regions by
+REGION_INTERVAL = 10
+DISTANT_TICKS = 5
+#only regions farther than this from the player are simulated, no monster
+#there is awake (see scheduler.py)
+DISTANT_RADIUS = 2 * SLEEP_RADIUS
+
+class Region:
+    #what BasicMonster.take_turn() uses of a Game, for the monsters of one
+    #region in a worker. the player is far away, nothing is in view
+    def __init__(self, seed, x1, y1, x2, y2, window):
+        self.rng = random.Random(seed)
+        self.roaming = True
+        self.player = None
+        self.visible_tiles = frozenset()
+        self.objects = ObjectList()
+        (self.x1, self.y1, self.x2, self.y2) = (x1, y1, x2, y2)
+        #1 for the walls and what blocks around the region, with a tile more
+        #on each side (the region's own monsters are in "objects")
+        self.window = window
+
+    def inside(self, x, y):
+        return self.x1 <= x < self.x2 and self.y1 <= y < self.y2
+
+    def is_blocked(self, x, y):
+        if self.window[(y - self.y1 + 1) * (self.x2 - self.x1 + 2) + x - self.x1 + 1]:
+            return True
+        return self.objects.index.blocking_at(x, y) is not None
+
+def simulate_region(task):
+    #advance the monsters of one region (see RegionSimulator.tasks()), runs
+    #in a worker. returns each monster's (x, y, hp, step): step is the
+    #(dx, dy) into the next region it's handed off with, None if it stayed
+    (seed, x1, y1, x2, y2, window, packed, ticks) = task
+    region = Region(seed, x1, y1, x2, y2, window)
+    actors = []
+    pos = 0
+    while pos < len(packed):
+        (actor, flags, pos) = unpack_object(packed, pos)
+        region.objects.append(actor)
+        actors.append(actor)
+
+    #a tick is a player turn: like in the scheduler, a faster monster acts
+    #more often in it, and each one first acts one of its actions from now
+    next_action = [ACTION_COST * NORMAL_SPEED // actor.ai.speed for actor in actors]
+    steps = [None] * len(actors)
+    for tick in range(ticks):
+        time = (tick + 1) * ACTION_COST
+        for (i, actor) in enumerate(actors):
+            while steps[i] is None and next_action[i] <= time:
+                (x, y) = (actor.x, actor.y)
+                actor.ai.take_turn(region)
+                next_action[i] += ACTION_COST * NORMAL_SPEED // actor.ai.speed
+                if not region.inside(actor.x, actor.y):
+                    #it keeps its tile, waiting at the edge to leave
+                    steps[i] = (actor.x - x, actor.y - y)
+                    actor.place(x, y)
+    return [(actor.x, actor.y, actor.fighter.hp, step) for (actor, step) in zip(actors, steps)]
+
+class RegionSimulator:
+    #set it as the game's "regions". start() sends the far regions to the
+    #workers before the awake monsters act, finish() waits for them and
+    #merges what they did back in, so it's all done before the next player
+    #turn. processes is the number of workers (one per core by default), 0
+    #runs the regions in this process. in a game without the roaming rules,
+    #a monster out of view doesn't do anything, so nothing is sent
+    def __init__(self, processes=None, interval=REGION_INTERVAL, ticks=DISTANT_TICKS):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+        self.interval = interval
+        self.ticks = ticks
+        self.pool = None
+        if processes > 0:
+            self.pool = ProcessPoolExecutor(max_workers=processes)
+        #the regions sent, in order, as (actors, x1, y1, x2, y2, walls), and
+        #their results to come
+        self.sent = None
+        self.pending = None
+        self.regions_run = 0
+        self.handoffs = 0
+
+    def start(self, game):
+        if not game.roaming or game.turn % self.interval:
+            return
+        (sent, tasks) = self.tasks(game)
+        if not tasks:
+            return
+        self.sent = sent
+        if self.pool is None:
+            self.pending = [simulate_region(task) for task in tasks]
+        else:
+            #a few regions per message, enough of them to keep every worker busy
+            chunksize = max(1, len(tasks) // (4 * self.processes))
+            self.pending = self.pool.map(simulate_region, tasks, chunksize=chunksize)
+
+    def tasks(self, game):
+        #the far regions with sleeping monsters in them, as filed by the
+        #scheduler: (what finish() needs of each one, the task
+        #simulate_region() gets)
+        map = game.map
+        player = game.player
+        filed = game.scheduler.regions
+
+        def alive(key):
+            return [a for a in filed.get(key, {}).values() if a.ai is not None and a.index is not None]
+
+        sent = []
+        tasks = []
+        for key in sorted(filed):
+            x1 = key[0] * REGION_SIZE
+            y1 = key[1] * REGION_SIZE
+            x2 = min(x1 + REGION_SIZE, map.width)
+            y2 = min(y1 + REGION_SIZE, map.height)
+            if max(x1 - player.x, player.x - x2 + 1, y1 - player.y, player.y - y2 + 1) <= DISTANT_RADIUS:
+                continue
+            actors = alive(key)
+            if not actors:
+                continue
+            walls = map.window(map.blocked, x1 - 1, y1 - 1, x2 + 1, y2 + 1)
+            window = bytearray(walls)
+            #the monsters of the regions around on the tiles next to this
+            #one (its own are sent). that far from the player, they're all
+            #asleep: nothing else blocks
+            w = x2 - x1 + 2
+            for ny in (key[1] - 1, key[1], key[1] + 1):
+                for nx in (key[0] - 1, key[0], key[0] + 1):
+                    if (nx, ny) == key:
+                        continue
+                    for a in alive((nx, ny)):
+                        if x1 - 1 <= a.x <= x2 and y1 - 1 <= a.y <= y2:
+                            window[(a.y - y1 + 1) * w + a.x - x1 + 1] = 1
+            seed = '%i/%i/%i/%i' % (game.seed, game.turn, key[0], key[1])
+            packed = []
+            for a in actors:
+                pack_object(a, packed)
+            tasks.append((seed, x1, y1, x2, y2, bytes(window), b''.join(packed), self.ticks))
+            sent.append((actors, x1, y1, x2, y2, walls))
+        return (sent, tasks)
+
+    def finish(self, game):
+        if self.pending is None:
+            return
+        results = list(self.pending)
+        sent = self.sent
+        self.pending = None
+        self.sent = None
+        scheduler = game.scheduler
+        index = game.objects.index
+
+        #the moves inside each region first, they can't collide: a region
+        #only ever moves its own monsters, to its own free tiles. the
+        #monsters are filed again in the scheduler where they end up. the
+        #ones that died or left the map since (their chunk was dropped, see
+        #world.py) are left as they are
+        handoffs = []
+        for (region, result) in zip(sent, results):
+            for (actor, (x, y, hp, step)) in zip(region[0], result):
+                if actor.ai is None or actor.index is not index:
+                    continue
+                actor.fighter.hp = hp
+                if (x, y) != (actor.x, actor.y):
+                    scheduler.forget(actor)
+                    actor.place(x, y)
+                    scheduler.sleep(actor)
+                if step is not None:
+                    handoffs.append((actor, step, region))
+        #then the monsters that step into another region, if nothing got
+        #there first. the tile is on the border of the walls sent with the
+        #region, so the map itself isn't read (on a world, that would page
+        #in chunks far from the player)
+        for (actor, (dx, dy), (actors, x1, y1, x2, y2, walls)) in handoffs:
+            (nx, ny) = (actor.x + dx, actor.y + dy)
+            if walls[(ny - y1 + 1) * (x2 - x1 + 2) + nx - x1 + 1] or index.blocking_at(nx, ny) is not None:
+                continue
+            scheduler.forget(actor)
+            actor.place(nx, ny)
+            scheduler.sleep(actor)
+            self.handoffs += 1
+        self.regions_run += len(sent)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
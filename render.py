@@ -0,0 +1,382 @@
+import re
+from constants import *
+from layers import ConsolePool, Layer, LayerCache
+
+#background shades a map cell can be drawn with (index into the color list)
+SHADE_NONE = 0
+SHADE_DARK_WALL = 1
+SHADE_DARK_GROUND = 2
+SHADE_LIGHT_WALL = 3
+SHADE_LIGHT_GROUND = 4
+
+#the raw code of a cell is explored | wall << 1 | visible << 2, this table
+#turns it into its shade (an unexplored cell is never drawn, wall or not)
+_RAW_TO_SHADE = bytearray(256)
+_RAW_TO_SHADE[1] = SHADE_DARK_GROUND
+_RAW_TO_SHADE[3] = SHADE_DARK_WALL
+_RAW_TO_SHADE[5] = SHADE_LIGHT_GROUND
+_RAW_TO_SHADE[7] = SHADE_LIGHT_WALL
+_RAW_TO_SHADE = bytes(_RAW_TO_SHADE)
+
+#width of the debug overlay, at the right of the panel
+OVERLAY_WIDTH = 36
+
+#on a map bigger than the console, the view scrolls when the player gets
+#closer than this to its edge. more than the torch's radius, so everything
+#in view is always on the console
+CAMERA_MARGIN = TORCH_RADIUS + 1
+
+_NONZERO = re.compile(b'[^\x00]')
+
+def _to_int(data):
+    return int.from_bytes(data, 'little')
+
+class BackgroundLayer:
+    #the background colors of the map console. instead of visiting every cell
+    #each time the FOV changes, the shades are computed a whole row slice at a
+    #time (as big integers / byte tables), and only the cells whose shade
+    #differs from the last frame are drawn. only the rows and columns covered
+    #by the old and the new FOV can change, so that is all that gets looked at.
+    #
+    #the console shows width x height tiles of the map (all of it by
+    #default), from the tile "camera" passed to update(). a bigger map only
+    #costs what the console shows.
+    def __init__(self, map, colors, width=None, height=None):
+        self.map = map
+        #colors[shade] is the background color for that shade
+        self.colors = colors
+        self.width = map.width if width is None else width
+        self.height = map.height if height is None else height
+        #the shade of each console cell
+        self.shade = bytearray(self.width * self.height)
+        self.camera = None
+        #bounding box (x1, y1, x2, y2, exclusive) of the last visible tiles
+        self.visible_rect = None
+        #none yet, so the first update looks at the whole view (a level the
+        #player comes back to has explored tiles everywhere)
+        self.map_version = None
+
+    def update(self, con, visible_tiles, camera=(0, 0)):
+        #mark visible tiles as explored and draw the cells that changed color.
+        #visible_tiles is a FovResult
+        map = self.map
+        if camera != self.camera:
+            if self.camera is not None:
+                #the view scrolled, every cell of it is drawn again
+                con.clear()
+                self.shade = bytearray(self.width * self.height)
+            self.camera = camera
+            self.map_version = None
+        (cam_x, cam_y) = camera
+        old_rect = self.visible_rect
+        rect = self.visible_rect = visible_tiles.rect()
+        if old_rect is not None:
+            if rect is None:
+                rect = old_rect
+            else:
+                rect = (min(old_rect[0], rect[0]), min(old_rect[1], rect[1]),
+                        max(old_rect[2], rect[2]), max(old_rect[3], rect[3]))
+        if map.version != self.map_version:
+            #walls were added or removed somewhere, look at the whole view
+            self.map_version = map.version
+            rect = (cam_x, cam_y, min(cam_x + self.width, map.width), min(cam_y + self.height, map.height))
+        if rect is None:
+            return 0
+
+        #only what is on the console is drawn, but all the visible tiles are explored
+        (x1, y1, x2, y2) = rect
+        (vx1, vx2) = (max(x1, cam_x), min(x2, cam_x + self.width))
+        (vy1, vy2) = (max(y1, cam_y), min(y2, cam_y + self.height))
+        w = map.width
+        n = x2 - x1
+        explored = map.explored
+        block_sight = map.block_sight
+        shade = self.shade
+        colors = self.colors
+        drawn = 0
+        for y in range(y1, y2):
+            a = y * w + x1
+            b = a + n
+            vis = _to_int(visible_tiles.row(y, x1, x2))
+            exp = _to_int(explored[a:b]) | vis
+            explored[a:b] = exp.to_bytes(n, 'little')
+            if y < vy1 or y >= vy2 or vx1 >= vx2:
+                continue
+            raw = exp | (_to_int(block_sight[a:b]) << 1) | (vis << 2)
+            new = raw.to_bytes(n, 'little').translate(_RAW_TO_SHADE)[vx1 - x1:vx2 - x1]
+            c = (y - cam_y) * self.width + vx1 - cam_x
+            old = shade[c:c + len(new)]
+            if new == old:
+                continue
+            changed = (_to_int(new) ^ _to_int(old)).to_bytes(len(new), 'little')
+            for match in _NONZERO.finditer(changed):
+                i = match.start()
+                con.drawChar(vx1 - cam_x + i, y - cam_y, None, bgcolor=colors[new[i]])
+                drawn += 1
+            shade[c:c + len(new)] = new
+        return drawn
+
+class Renderer:
+    #draws a Game: the map on "con", the GUI on "panel", both blitted to
+    #"root". any tdl consoles will do, so it can also draw offscreen.
+    def __init__(self, root, con, panel):
+        self.root = root
+        self.con = con
+        self.panel = panel
+        self.background = None
+        #the map tile shown at the top left of "con", see update_camera()
+        self.camera = (0, 0)
+        #lines of text drawn over the right side of the panel (the profiler's
+        #debug overlay), None for nothing
+        self.overlay = None
+        #an offscreen console shown over everything (a menu), as (console, x, y)
+        self.popup = None
+        self.popup_shown = None
+        #offscreen consoles of the same kind as the panel, reused instead of
+        #allocated (see layers.py). "layers" keeps pre-rendered windows, like
+        #menus, and the parts of the panel are layers of their own, drawn
+        #again only when what they show changes
+        self.pool = ConsolePool(type(panel))
+        self.layers = LayerCache(self.pool)
+        self.message_layer = Layer(self.pool, SCREEN_WIDTH - MSG_X, PANEL_HEIGHT - 1, self.draw_messages)
+        self.hp_layer = Layer(self.pool, BAR_WIDTH, 1, self.draw_hp)
+        self.mouse_layer = Layer(self.pool, SCREEN_WIDTH, 1, self.draw_mouse_message)
+        #what was drawn last time, to only draw again what changed: the
+        #positions the objects were drawn at, the object index and its
+        #version
+        self.object_cells = []
+        self.objects_seen = None
+        self.game_state = None
+        self.overlay_shown = None
+
+    def invalidate(self):
+        #draw everything again on the next frame (something else was drawn
+        #over the root console)
+        self.objects_seen = None
+        self.message_layer.invalidate()
+        self.hp_layer.invalidate()
+        self.mouse_layer.invalidate()
+        self.overlay_shown = None
+        self.popup_shown = None
+
+    def render_all(self, game, mouse_x=0, mouse_y=0):
+        #draw what changed since the last frame. returns False if nothing
+        #did, then there's no need to flush the root console
+        con = self.con
+        panel = self.panel
+        player = game.player
+        camera = self.update_camera(game)
+        (cam_x, cam_y) = camera
+
+        #objects are drawn again when they moved, appeared or disappeared
+        #(the index changes), when a decal was added, when the FOV changed
+        #or when the player died
+        index = game.objects.index
+        decals = game.map.decals
+        objects_seen = (index, index.version, decals, decals.version)
+        con_changed = (game.fov_recompute or objects_seen != self.objects_seen or
+                       game.game_state != self.game_state)
+        if con_changed:
+            #erase all objects (and decals) at their old locations, keeping the background
+            for (x, y) in self.object_cells:
+                con.drawChar(x, y, ' ', bgcolor=None)
+
+        if game.fov_recompute:
+            game.fov_recompute = False
+            #set the background color of the tiles whose color changed since the last time
+            if self.background is None or self.background.map is not game.map:
+                con.clear()
+                self.background = BackgroundLayer(game.map, [None, color_dark_wall, color_dark_ground,
+                                                             color_light_wall, color_light_ground],
+                                                  con.width, con.height)
+            self.background.update(con, game.visible_tiles, camera)
+
+        if con_changed:
+            self.objects_seen = objects_seen
+            self.game_state = game.game_state
+            #the remains on the floor first, the objects are drawn over them
+            decal_cells = decals.draw(con, game.visible_tiles, camera)
+            #draw all objects in the list, except the player. we want it to
+            #always appear over all other objects! so it's drawn later.
+            shown = objects_in_view(game)
+            for object in shown:
+                if object != player:
+                    object.draw(con, game.visible_tiles, camera)
+            player.draw(con, game.visible_tiles, camera)
+            self.object_cells = decal_cells + [(obj.x - cam_x, obj.y - cam_y) for obj in shown
+                                               if (obj.x, obj.y) in game.visible_tiles]
+        if con_changed:
+            self.root.blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT,0,0)
+
+        #prepare to render the GUI panel, only the parts that changed
+        panel_changed = con_changed  #the map was blitted over it
+        #the overlay covers the other parts, or uncovers them
+        uncovered = self.overlay != self.overlay_shown
+        self.overlay_shown = self.overlay
+
+        #the game messages, the player's stats and the names under the mouse
+        names = ''
+        if mouse_x < con.width and mouse_y < con.height:
+            names = get_names_under_mouse(game, mouse_x + cam_x, mouse_y + cam_y)
+        layers = [(self.message_layer, MSG_X, 1, tuple(game.game_msgs), game.game_msgs),
+                  (self.hp_layer, 1, 1, (player.fighter.hp, player.fighter.max_hp), player.fighter),
+                  (self.mouse_layer, 0, 0, names, names)]
+        for (layer, x, y, key, source) in layers:
+            if layer.update(key, source) or uncovered:
+                console = layer.console
+                panel.blit(console, x, y, console.width, console.height, 0, 0)
+                panel_changed = True
+
+        if panel_changed and self.overlay is not None:
+            self.render_overlay(self.overlay)
+
+        if panel_changed:
+            #blit the contents of "panel" to the root console
+            #libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
+            panel.move(0, 0)
+            self.root.blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT)
+
+        if self.popup is not self.popup_shown:
+            if self.popup_shown is not None:
+                #it was closed, draw again what it covered
+                self.invalidate()
+                return self.render_all(game, mouse_x, mouse_y)
+            self.popup_shown = self.popup
+            panel_changed = True
+        if panel_changed and self.popup is not None:
+            #blit the contents of the popup to the root console, over the rest
+            #libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
+            (window, x, y) = self.popup
+            self.root.blit(window, x, y, window.width, window.height, 0, 0)
+        return panel_changed
+
+    def update_camera(self, game):
+        #the map tile at the top left of "con". a map that fits on it is
+        #shown whole, a bigger one scrolls to keep the player at least
+        #CAMERA_MARGIN tiles from the edge, centering the view on them
+        map = game.map
+        player = game.player
+        (width, height) = (self.con.width, self.con.height)
+        (x, y) = self.camera
+        if not CAMERA_MARGIN <= player.x - x < width - CAMERA_MARGIN:
+            x = player.x - width // 2
+        if not CAMERA_MARGIN <= player.y - y < height - CAMERA_MARGIN:
+            y = player.y - height // 2
+        self.camera = (max(0, min(x, map.width - width)), max(0, min(y, map.height - height)))
+        return self.camera
+
+    def draw_messages(self, console, game_msgs):
+        #print the game messages, one line at a time
+        y = 0
+        for (line, color) in game_msgs:
+            #libtcod.console_set_default_foreground(panel, color)
+            #libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+
+            text = "%s" % (line)
+            # then get a string spanning the entire bar with the text centered
+            text = text.center(MSG_X)
+            # render this text over the bar while preserving the background color
+            console.drawStr(0, y, text, [255,255,255], None)
+
+            y += 1
+
+    def draw_hp(self, console, fighter):
+        #show the player's stats
+        self.render_bar(console, 0, 0, BAR_WIDTH, 'HP', fighter.hp, fighter.max_hp,
+            color_dark_red, color_yellow)
+
+    def draw_mouse_message(self, console, names):
+        #libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
+        mouse_message = "%s" % (names)
+        mouse_message = mouse_message.center(1)
+        console.drawStr(1, 0, mouse_message, [255, 255, 255], None)
+
+    def render_overlay(self, lines):
+        #text on a black box at the right of the panel, over the messages
+        x = SCREEN_WIDTH - OVERLAY_WIDTH
+        for (y, line) in enumerate(lines[:PANEL_HEIGHT]):
+            self.panel.drawStr(x, y, line[:OVERLAY_WIDTH].ljust(OVERLAY_WIDTH), color_yellow, [0, 0, 0])
+
+    def render_bar(self, panel, x, y, total_width, name, value, maximum, bar_color, back_color):
+        #render a bar (HP, experience, etc). first calculate the width of the bar
+        bar_width = int(float(value) / maximum * total_width)
+
+        #render the background first
+        #libtcod.console_set_default_background(panel, back_color)
+        #panel.setColors(bg=back_color) # not used if there's no printStr call
+        #libtcod.console_rect(panel, x, y, total_width, 1, False, libtcod.BKGND_SCREEN)
+        panel.drawRect(x, y, total_width, 1, None, None, back_color)
+
+        #now render the bar on top
+        #libtcod.console_set_default_background(panel, bar_color)
+        #panel.setColors(bg=bar_color)
+        if bar_width > 0:
+            #libtcod.console_rect(panel, x, y, bar_width, 1, False, libtcod.BKGND_SCREEN)
+            panel.drawRect(x, y, bar_width, 1, None, None, bar_color)
+
+        #finally, some centered text with the values
+        #libtcod.console_set_default_foreground(panel, libtcod.white)
+        #panel.setColors(fg=[255,255,255])
+        #libtcod.console_print_ex(panel, x + total_width / 2, y, libtcod.BKGND_NONE, libtcod.CENTER,
+         #   name + ': ' + str(value) + '/' + str(maximum))
+        #panel.printStr(name + ": " + str(value) + '/' + str(maximum))
+
+        # prepare the text using old-style Python string formatting
+        text = "%s: %i/%i" % (name, value, maximum)
+        # then get a string spanning the entire bar with the text centered
+        text = text.center(total_width)
+
+        # render this text over the bar while preserving the background color
+        panel.drawStr(x, y, text, [255,255,255], None)
+
+def draw_menu(window, header, options, header_height):
+    #a menu's header and options on its offscreen window, for the window's
+    #menu() in Launcher.py and the server's
+    height = window.height
+
+    #print the header, with auto-wrap
+    #libtcod.console_set_default_foreground(window, libtcod.white)
+    window.setColors(fg = [255, 255, 255])
+    #libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
+
+    text = '%s' % (header)
+    text = text.ljust(height)
+    window.drawStr(0, 0, text)
+
+    #print all the options
+    y = header_height
+    letter_index = ord('a')
+    for option_text in options:
+        text = '(' + chr(letter_index) + ') ' + option_text
+        #libtcod.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
+        text = '%s' % (text)
+        text = text.ljust(height)
+        window.drawStr(0, y, text)
+
+        y += 1
+        letter_index += 1
+
+def objects_in_view(game):
+    #the objects that may be drawn, in drawing order within each tile. there
+    #can be any number of them out of view (on a big level, or a world, see
+    #world.py), so only the tiles in view are looked at
+    rect = game.visible_tiles.rect()
+    if rect is None:
+        return []
+    (x1, y1, x2, y2) = rect
+    at = game.objects.index.at
+    return [obj for y in range(y1, y2) for x in range(x1, x2) for obj in at(x, y)]
+
+def get_names_under_mouse(game, x, y):
+    #return a string with the names of all objects under the mouse
+
+    #create a list with the names of all objects at the mouse's coordinates and in FOV
+    names = []
+    if (x, y) in game.visible_tiles:
+        names = [obj.name for obj in game.objects.index.at(x, y)]
+        decal = game.map.decals.at(x, y)
+        if decal is not None:
+            names.insert(0, decal[2])
+
+    names = ', '.join(names)  #join the names, separated by commas
+    return names.capitalize()
@@ -0,0 +1,217 @@
+#recording and replaying sessions. the recorder writes everything the game
+#reads from the window (the events of each poll, and the keys pressed in
+#menus) next to the game's seed and rules. a replay feeds the same input to a
+#headless Game with the same seed, as fast as possible, so a slow session
+#reported by a player can be played again under a profiler:
+#
+#   python Launcher.py --record session.rlr
+#   python replay.py session.rlr --profile
+#
+#file format, all little-endian:
+#   header: b'RLRP', version (B), seed (Q), roaming (B, see Game.roaming)
+#   then records, each starting with a tag byte:
+#       b'P' a poll: event count (H), then the events
+#       b'W' a key read by a menu: one event
+#   an event is its type (B, an index into EVENT_TYPES), then
+#       KEYDOWN/KEYUP: key (B, an index into KEY_NAMES), char (I, 0 if none)
+#       MOUSEMOTION/MOUSEDOWN/MOUSEUP: cell x (H), cell y (H)
+#       QUIT: nothing
+#   a type or key that isn't in the tables is written as 255, then its name
+#   (length B, then the UTF-8 bytes).
+import argparse
+import asyncio
+import cProfile
+import pstats
+import struct
+import time
+from controls import menu_choice, play_turn
+from game import Game
+from regions import RegionSimulator
+from events import StdoutSink, BinaryLogSink
+
+MAGIC = b'RLRP'
+VERSION = 2
+_HEADER = struct.Struct('<4sBQB')
+_COUNT = struct.Struct('<H')
+_CHAR = struct.Struct('<I')
+_CELL = struct.Struct('<HH')
+
+POLL = b'P'
+KEY_WAIT = b'W'
+
+EVENT_TYPES = ['KEYDOWN', 'KEYUP', 'MOUSEMOTION', 'MOUSEDOWN', 'MOUSEUP', 'QUIT']
+KEY_NAMES = ['NONE', 'CHAR', 'TEXT', 'ESCAPE', 'BACKSPACE', 'TAB', 'ENTER', 'SHIFT',
+             'CONTROL', 'ALT', 'PAUSE', 'CAPSLOCK', 'PAGEUP', 'PAGEDOWN', 'END', 'HOME',
+             'UP', 'LEFT', 'RIGHT', 'DOWN', 'PRINTSCREEN', 'INSERT', 'DELETE', 'LWIN',
+             'RWIN', 'APPS', 'SPACE', 'NUMLOCK', 'SCROLLLOCK', 'KPADD', 'KPSUB', 'KPDIV',
+             'KPMUL', 'KPDEC', 'KPENTER'] + \
+            [str(n) for n in range(10)] + ['KP%i' % n for n in range(10)] + \
+            ['F%i' % n for n in range(1, 13)]
+_OTHER = 255
+
+_TYPE_IDS = dict((name, i) for i, name in enumerate(EVENT_TYPES))
+_KEY_IDS = dict((name, i) for i, name in enumerate(KEY_NAMES))
+
+class RecordedEvent:
+    #an event read back from a recording. has the same attributes the game
+    #uses on tdl's events
+    def __init__(self, type, key=None, char='', cell=None):
+        self.type = type
+        self.key = key
+        self.char = char
+        self.cell = cell
+
+    @property
+    def keychar(self):
+        #like tdl: the character for CHAR keys, the key name for the others
+        if self.key == 'CHAR':
+            return self.char
+        return self.key
+
+class InputRecorder:
+    #writes the input read by the game to a file
+    def __init__(self, path, seed, roaming=False):
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(MAGIC, VERSION, seed, roaming))
+
+    def record_poll(self, events):
+        #polls without events don't change the game, so they are not stored
+        if not events:
+            return
+        parts = [POLL, _COUNT.pack(len(events))]
+        for event in events:
+            self._encode(event, parts)
+        self.file.write(b''.join(parts))
+
+    def record_key(self, key):
+        parts = [KEY_WAIT]
+        self._encode(key, parts)
+        self.file.write(b''.join(parts))
+
+    def close(self):
+        self.file.close()
+
+    def _encode(self, event, parts):
+        _encode_name(_TYPE_IDS, event.type, parts)
+        if event.type in ('KEYDOWN', 'KEYUP'):
+            _encode_name(_KEY_IDS, event.key, parts)
+            char = getattr(event, 'char', '') or ''
+            parts.append(_CHAR.pack(ord(char) if char else 0))
+        elif event.type in ('MOUSEMOTION', 'MOUSEDOWN', 'MOUSEUP'):
+            (x, y) = event.cell
+            parts.append(_CELL.pack(max(x, 0), max(y, 0)))
+
+class ReplayInput:
+    #the "input" of a game (see controls.py) read back from a recording.
+    #menus don't draw anything, they just answer with the recorded key
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        (magic, version, self.seed, roaming) = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a recorded session' % path)
+        if version != VERSION:
+            raise ValueError('unsupported recording version %i' % version)
+        self.roaming = bool(roaming)
+        self.pos = _HEADER.size
+        self.mouse_x = 0
+        self.mouse_y = 0
+
+    def finished(self):
+        return self.pos >= len(self.data)
+
+    async def get(self):
+        self._expect(POLL)
+        (count,) = _COUNT.unpack_from(self.data, self.pos)
+        self.pos += _COUNT.size
+        return [self._decode() for i in range(count)]
+
+    def key_wait(self):
+        self._expect(KEY_WAIT)
+        return self._decode()
+
+    async def menu(self, header, options, width):
+        return menu_choice(self.key_wait(), options)
+
+    def _expect(self, tag):
+        found = self.data[self.pos:self.pos + 1]
+        if found != tag:
+            raise ValueError('recording out of sync: expected %r, found %r at byte %i'
+                             % (tag, found, self.pos))
+        self.pos += 1
+
+    def _decode(self):
+        type = self._decode_name(EVENT_TYPES)
+        if type in ('KEYDOWN', 'KEYUP'):
+            key = self._decode_name(KEY_NAMES)
+            (char,) = _CHAR.unpack_from(self.data, self.pos)
+            self.pos += _CHAR.size
+            return RecordedEvent(type, key=key, char=chr(char) if char else '')
+        if type in ('MOUSEMOTION', 'MOUSEDOWN', 'MOUSEUP'):
+            cell = _CELL.unpack_from(self.data, self.pos)
+            self.pos += _CELL.size
+            return RecordedEvent(type, cell=cell)
+        return RecordedEvent(type)
+
+    def _decode_name(self, names):
+        i = self.data[self.pos]
+        self.pos += 1
+        if i != _OTHER:
+            return names[i]
+        length = self.data[self.pos]
+        name = self.data[self.pos + 1:self.pos + 1 + length].decode('utf-8')
+        self.pos += 1 + length
+        return name
+
+def _encode_name(ids, name, parts):
+    i = ids.get(name)
+    if i is not None:
+        parts.append(bytes([i]))
+    else:
+        encoded = name.encode('utf-8')[:255]
+        parts.append(bytes([_OTHER, len(encoded)]) + encoded)
+
+def play(path, fov_function=None, sinks=()):
+    #replay a recorded session headless, returns the final Game. the events
+    #of the game also go to the given sinks (see events.py)
+    return asyncio.run(_play(path, fov_function, sinks))
+
+async def _play(path, fov_function, sinks):
+    input = ReplayInput(path)
+    game = Game(seed=input.seed, fov_function=fov_function, roaming=input.roaming)
+    if game.roaming:
+        #the far regions come out the same in this process as in workers
+        game.regions = RegionSimulator(0)
+    for sink in sinks:
+        game.events.add_sink(sink)
+    while not input.finished():
+        if await play_turn(game, input) == 'exit':
+            break
+    game.events.close()
+    return game
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded session without a window.')
+    parser.add_argument('recording')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile and print the stats')
+    parser.add_argument('--event-log', metavar='FILE', help='also write the game events to a binary log')
+    args = parser.parse_args()
+
+    sinks = [StdoutSink()]
+    if args.event_log:
+        sinks.append(BinaryLogSink(args.event_log))
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        game = play(args.recording, sinks=sinks)
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+    else:
+        start = time.perf_counter()
+        game = play(args.recording, sinks=sinks)
+        print('replayed in %.3fs, game state: %s, player hp: %i'
+              % (time.perf_counter() - start, game.game_state, game.player.fighter.hp))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+#saving and loading a whole game: the current level, the player and the
+#inventory, the messages, the monsters' turns, the levels left behind and the
+#state of the random generator, so a loaded game plays on exactly like the
+#saved one would have. the tile layers are written as they are in memory
+#(one byte per tile) at an offset known from the header, so loading maps the
+#file and copies each layer with one slice instead of reading tile by tile:
+#saving or loading even a huge map only takes a few milliseconds.
+#
+#file format, all little-endian:
+#   header: b'RLSV', version (B), map width (H), map height (H), seed (Q),
+#       dungeon level (H), turn (I), game state (B, an index into
+#       GAME_STATES), size of the rest (I)
+#   the blocked, block_sight, explored and decals layers, width * height
+#   bytes each
+#   the rest:
+#       settings: map width, map height, max rooms, max room monsters,
+#           max room items, heal amount (H each), roaming (B), then the fighter stats:
+#           count (B), then name (length B, UTF-8), hp, defense, power (h each)
+#       the kinds of decals, as DecalLayer.pack_kinds() writes them
+#       random generator: version (B), its 625 words (I), gauss (?, d)
+#       objects: count (I), then each of them as game.pack_object() writes it,
+#           the player, the stairs and the upstairs with their FROZEN_* flag
+#       inventory: count (H), then the objects
+#       messages: count (H), then each line: length (H), color (3B), UTF-8
+#       scheduler: time (Q), count (Q), awake actors (I), each one is
+#           time (Q), order (Q), object (I, index in the objects); then the
+#           dormant buckets (I), each one is x, y (h), actors (I), objects (I)
+#       levels left behind: count (H), then each: dungeon level (H),
+#           compressed (B), size (I), the level as Game.freeze_level() wrote it
+import heapq
+import mmap
+import os
+import struct
+from game import Game, pack_object, unpack_object, FROZEN_STAIRS, FROZEN_UPSTAIRS, FROZEN_PLAYER
+from gamemap import GameMap
+from spatial import ObjectList
+from fov import FovCache
+from pathing import FlowField
+from scheduler import TurnScheduler
+
+SAVE_MAGIC = b'RLSV'
+SAVE_VERSION = 3
+GAME_STATES = ['playing', 'dead']
+_HEADER = struct.Struct('<4sBHHQHIBI')
+_SETTINGS = struct.Struct('<HHHHHHB')
+_STATS = struct.Struct('<hhh')
+_RNG = struct.Struct('<B625I?d')
+_COUNT = struct.Struct('<I')
+_SHORT_COUNT = struct.Struct('<H')
+_MESSAGE = struct.Struct('<H3B')
+_SCHEDULER = struct.Struct('<QQI')
+_QUEUED = struct.Struct('<QQI')
+_BUCKET = struct.Struct('<hhI')
+_LEVEL = struct.Struct('<HBI')
+
+#how many player turns between two autosaves
+AUTOSAVE_TURNS = 50
+
+def save_game(game, path):
+    #write the game to path. it's written next to it first, then renamed:
+    #if anything goes wrong the last save is still there
+    map = game.map
+    if map.chunked:
+        raise ValueError('a world (see world.py) can\'t be saved')
+    rest = pack_state(game)
+    header = _HEADER.pack(SAVE_MAGIC, SAVE_VERSION, map.width, map.height, game.seed, game.dungeon_level,
+                          game.turn, GAME_STATES.index(game.game_state), len(rest))
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(header)
+        f.write(map.blocked)
+        f.write(map.block_sight)
+        f.write(map.explored)
+        f.write(map.decals.cells)
+        f.write(rest)
+    os.replace(temp, path)
+
+def pack_state(game):
+    #everything in a save but the header and the map layers
+    parts = [_SETTINGS.pack(game.map_width, game.map_height, game.max_rooms, game.max_room_monsters,
+                            game.max_room_items, game.heal_amount, game.roaming),
+             bytes([len(game.fighter_stats)])]
+    for (kind, stats) in game.fighter_stats.items():
+        _pack_text(kind, parts, 'B')
+        parts.append(_STATS.pack(*stats))
+    game.map.decals.pack_kinds(parts)
+
+    (version, words, gauss) = game.rng.getstate()
+    parts.append(_RNG.pack(version, *(words + (gauss is not None, gauss or 0.0))))
+
+    #objects are referred to by their position in the list (the scheduler)
+    positions = {}
+    parts.append(_COUNT.pack(len(game.objects)))
+    for (i, obj) in enumerate(game.objects):
+        positions[id(obj)] = i
+        flags = 0
+        if obj is game.player:
+            flags = FROZEN_PLAYER
+        elif obj is game.stairs:
+            flags = FROZEN_STAIRS
+        elif obj is game.upstairs:
+            flags = FROZEN_UPSTAIRS
+        pack_object(obj, parts, flags)
+
+    parts.append(_SHORT_COUNT.pack(len(game.inventory)))
+    for obj in game.inventory:
+        pack_object(obj, parts)
+
+    parts.append(_SHORT_COUNT.pack(len(game.game_msgs)))
+    for (line, color) in game.game_msgs:
+        text = line.encode('utf-8')
+        parts.append(_MESSAGE.pack(len(text), color[0], color[1], color[2]))
+        parts.append(text)
+
+    _pack_scheduler(game.scheduler, positions, parts)
+
+    levels = game.levels
+    stored = ([(n, 1, data) for (n, data) in levels.compressed.items()] +
+              [(n, 0, game.freeze_level(level)) for (n, level) in levels.recent.items()])
+    parts.append(_SHORT_COUNT.pack(len(stored)))
+    for (dungeon_level, compressed, data) in stored:
+        parts.append(_LEVEL.pack(dungeon_level, compressed, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def _pack_scheduler(scheduler, positions, parts):
+    #the actors that died or left the level are left out, the scheduler
+    #would skip them anyway
+    def alive(actor):
+        return actor.ai is not None and id(actor) in positions
+
+    queue = [(time, count, positions[id(actor)]) for (time, count, actor) in scheduler.queue if alive(actor)]
+    parts.append(_SCHEDULER.pack(scheduler.time, scheduler.count, len(queue)))
+    for entry in queue:
+        parts.append(_QUEUED.pack(*entry))
+    buckets = []
+    for ((bx, by), bucket) in scheduler.dormant.items():
+        actors = [positions[id(actor)] for actor in bucket if alive(actor)]
+        if actors:
+            buckets.append((bx, by, actors))
+    parts.append(_COUNT.pack(len(buckets)))
+    for (bx, by, actors) in buckets:
+        parts.append(_BUCKET.pack(bx, by, len(actors)))
+        parts.append(struct.pack('<%iI' % len(actors), *actors))
+
+def _pack_text(text, parts, length_format):
+    data = text.encode('utf-8')
+    parts.append(struct.pack('<' + length_format, len(data)))
+    parts.append(data)
+
+def load_game(path, fov_function=None):
+    #the Game save_game() wrote to path
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            with memoryview(data) as view:
+                return _load(view, path, fov_function)
+
+def _load(data, path, fov_function):
+    (magic, version, width, height, seed, dungeon_level, turn, state, size) = _HEADER.unpack_from(data, 0)
+    if magic != SAVE_MAGIC:
+        raise ValueError('%s is not a saved game' % path)
+    if version != SAVE_VERSION:
+        raise ValueError('unsupported save version %i' % version)
+    pos = _HEADER.size
+    n = width * height
+    layers = [bytearray(data[pos + i * n:pos + (i + 1) * n]) for i in range(4)]
+    pos += 4 * n
+    if pos + size > len(data):
+        raise ValueError('%s is truncated' % path)
+
+    (map_width, map_height, max_rooms, max_room_monsters, max_room_items, heal_amount, roaming) = \
+        _SETTINGS.unpack_from(data, pos)
+    pos += _SETTINGS.size
+    fighter_stats = {}
+    kinds = data[pos]
+    pos += 1
+    for i in range(kinds):
+        (kind, pos) = _unpack_text(data, pos, 'B')
+        fighter_stats[kind] = _STATS.unpack_from(data, pos)
+        pos += _STATS.size
+    map = GameMap(width, height)
+    (map.blocked, map.block_sight, map.explored, map.decals.cells) = layers
+    pos = map.decals.unpack_kinds(data, pos)
+
+    game = Game(seed=seed, fov_function=fov_function, map_width=map_width, map_height=map_height,
+                max_rooms=max_rooms, max_room_monsters=max_room_monsters, max_room_items=max_room_items,
+                heal_amount=heal_amount, fighter_stats=fighter_stats, generate=False,
+                roaming=bool(roaming))
+    game.dungeon_level = dungeon_level
+    game.turn = turn
+    game.game_state = GAME_STATES[state]
+
+    rng = _RNG.unpack_from(data, pos)
+    pos += _RNG.size
+    game.rng.setstate((rng[0], rng[1:626], rng[627] if rng[626] else None))
+
+    #the map, then its objects
+    game.map = map
+    game.fov = FovCache(map, game.fov_function)
+    game.flow = FlowField(map)
+
+    (count,) = _COUNT.unpack_from(data, pos)
+    pos += _COUNT.size
+    game.objects = ObjectList()
+    game.stairs = game.upstairs = None
+    for i in range(count):
+        (obj, flags, pos) = unpack_object(data, pos)
+        if flags & FROZEN_PLAYER:
+            game.player = obj
+        elif flags & FROZEN_STAIRS:
+            game.stairs = obj
+        elif flags & FROZEN_UPSTAIRS:
+            game.upstairs = obj
+        game.objects.append(obj)
+
+    (count,) = _SHORT_COUNT.unpack_from(data, pos)
+    pos += _SHORT_COUNT.size
+    for i in range(count):
+        (obj, flags, pos) = unpack_object(data, pos)
+        game.inventory.append(obj)
+
+    (count,) = _SHORT_COUNT.unpack_from(data, pos)
+    pos += _SHORT_COUNT.size
+    for i in range(count):
+        (length, r, g, b) = _MESSAGE.unpack_from(data, pos)
+        pos += _MESSAGE.size
+        game.game_msgs.append((bytes(data[pos:pos + length]).decode('utf-8'), [r, g, b]))
+        pos += length
+
+    pos = _unpack_scheduler(game, data, pos)
+
+    (count,) = _SHORT_COUNT.unpack_from(data, pos)
+    pos += _SHORT_COUNT.size
+    levels = game.levels
+    for i in range(count):
+        (n, compressed, length) = _LEVEL.unpack_from(data, pos)
+        pos += _LEVEL.size
+        level = bytes(data[pos:pos + length])
+        pos += length
+        if compressed:
+            levels.compressed[n] = level
+            levels.compressed_size += length
+        else:
+            levels.recent[n] = game.thaw_level(level)
+
+    game.recompute_fov()
+    return game
+
+def _unpack_scheduler(game, data, pos):
+    scheduler = game.scheduler = TurnScheduler()
+    objects = game.objects
+    (scheduler.time, scheduler.count, count) = _SCHEDULER.unpack_from(data, pos)
+    pos += _SCHEDULER.size
+    for i in range(count):
+        (time, order, actor) = _QUEUED.unpack_from(data, pos)
+        pos += _QUEUED.size
+        scheduler.queue.append((time, order, objects[actor]))
+    heapq.heapify(scheduler.queue)
+    (count,) = _COUNT.unpack_from(data, pos)
+    pos += _COUNT.size
+    for i in range(count):
+        (bx, by, actors) = _BUCKET.unpack_from(data, pos)
+        pos += _BUCKET.size
+        #filed again where they are, (bx, by) is the bucket of their position
+        for actor in struct.unpack_from('<%iI' % actors, data, pos):
+            scheduler.sleep(objects[actor])
+        pos += 4 * actors
+    return pos
+
+def _unpack_text(data, pos, length_format):
+    length_format = '<' + length_format
+    (length,) = struct.unpack_from(length_format, data, pos)
+    pos += struct.calcsize(length_format)
+    return (bytes(data[pos:pos + length]).decode('utf-8'), pos + length)
+
+class Autosave:
+    #saves the game to path every "turns" player turns, call update() after
+    #each turn. a dead player's game isn't saved
+    def __init__(self, path, turns=AUTOSAVE_TURNS):
+        self.path = path
+        self.turns = turns
+        self.last_turn = None
+
+    def update(self, game):
+        if self.last_turn is None:
+            self.last_turn = game.turn
+        if game.turn - self.last_turn >= self.turns:
+            self.save(game)
+
+    def save(self, game):
+        if game.game_state == 'playing':
+            save_game(game, self.path)
+        self.last_turn = game.turn
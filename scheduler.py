@@ -0,0 +1,131 @@
+import heapq
+from constants import *
+
+#time one action takes at normal speed. the player always acts at normal
+#speed, so each player turn advances the time by ACTION_COST
+ACTION_COST = 100
+NORMAL_SPEED = 100
+
+#monsters this close to the player (or in view) are woken up, and the ones
+#that get farther than SLEEP_RADIUS (and out of view) fall asleep again
+WAKE_RADIUS = 2 * TORCH_RADIUS
+SLEEP_RADIUS = WAKE_RADIUS + 5
+
+#the dormant actors are also filed by square regions of this many tiles per
+#side, for the simulation of the far regions (see regions.py). the same as
+#a chunk of the world (see world.py)
+REGION_SIZE = 64
+
+class TurnScheduler:
+    #decides which monsters act after each player turn. the awake ones are
+    #in a priority queue, ordered by the time of their next action (faster
+    #monsters come back sooner). monsters far from the player are dormant:
+    #they are kept in a coarse grid of buckets and don't cost anything until
+    #the player comes near, so a turn only costs as much as the awake ones.
+    def __init__(self, wake_radius=WAKE_RADIUS, sleep_radius=SLEEP_RADIUS):
+        self.wake_radius = wake_radius
+        self.sleep_radius = sleep_radius
+        self.time = 0
+        #heap of (time of next action, order added, actor)
+        self.queue = []
+        self.count = 0
+        #(x // wake_radius, y // wake_radius) -> list of dormant actors
+        self.dormant = {}
+        #(x // REGION_SIZE, y // REGION_SIZE) -> the same dormant actors, as
+        #{id(actor): actor} in the order they fell asleep
+        self.regions = {}
+
+    def add(self, actor):
+        #a new actor (object with an AI) starts dormant
+        self.sleep(actor)
+
+    def sleep(self, actor):
+        key = (actor.x // self.wake_radius, actor.y // self.wake_radius)
+        bucket = self.dormant.get(key)
+        if bucket is None:
+            self.dormant[key] = [actor]
+        else:
+            bucket.append(actor)
+        key = (actor.x // REGION_SIZE, actor.y // REGION_SIZE)
+        region = self.regions.get(key)
+        if region is None:
+            self.regions[key] = {id(actor): actor}
+        else:
+            region[id(actor)] = actor
+
+    def forget(self, actor):
+        #an actor that left the map while asleep, or that is going to move
+        #while asleep (file it again with sleep()). an awake one is skipped
+        #when its turn comes, like a dead one
+        key = (actor.x // self.wake_radius, actor.y // self.wake_radius)
+        bucket = self.dormant.get(key)
+        if bucket is not None and actor in bucket:
+            bucket.remove(actor)
+            if not bucket:
+                del self.dormant[key]
+        self.unfile_region(actor)
+
+    def unfile_region(self, actor):
+        key = (actor.x // REGION_SIZE, actor.y // REGION_SIZE)
+        region = self.regions.get(key)
+        if region is not None and region.pop(id(actor), None) is not None and not region:
+            del self.regions[key]
+
+    def schedule(self, actor, time):
+        heapq.heappush(self.queue, (time, self.count, actor))
+        self.count += 1
+
+    def wake_nearby(self, game):
+        #wake up the dormant actors near the player or in view
+        player = game.player
+        r = self.wake_radius
+        (x1, y1, x2, y2) = (player.x - r, player.y - r, player.x + r + 1, player.y + r + 1)
+        rect = game.visible_tiles.rect()
+        if rect is not None:
+            (x1, y1, x2, y2) = (min(x1, rect[0]), min(y1, rect[1]), max(x2, rect[2]), max(y2, rect[3]))
+
+        for bx in range(x1 // r, (x2 - 1) // r + 1):
+            for by in range(y1 // r, (y2 - 1) // r + 1):
+                bucket = self.dormant.get((bx, by))
+                if not bucket:
+                    continue
+                still_dormant = []
+                for actor in bucket:
+                    if actor.ai is None or actor.index is None:
+                        #dead or gone while asleep, forget it
+                        self.unfile_region(actor)
+                    elif self.is_near(actor, player, r) or (actor.x, actor.y) in game.visible_tiles:
+                        self.unfile_region(actor)
+                        #its first action comes one of its actions from now,
+                        #like the next ones: at normal speed, it acts once
+                        #in the turn it wakes up
+                        self.schedule(actor, self.time + ACTION_COST * NORMAL_SPEED // actor.ai.speed)
+                    else:
+                        still_dormant.append(actor)
+                if still_dormant:
+                    self.dormant[(bx, by)] = still_dormant
+                else:
+                    del self.dormant[(bx, by)]
+
+    def is_near(self, actor, player, radius):
+        return abs(actor.x - player.x) <= radius and abs(actor.y - player.y) <= radius
+
+    def run_turn(self, game):
+        #one player turn passes: every awake actor whose time has come acts
+        self.wake_nearby(game)
+        self.time += ACTION_COST
+        player = game.player
+        while self.queue and self.queue[0][0] <= self.time:
+            (time, count, actor) = heapq.heappop(self.queue)
+            ai = actor.ai
+            if ai is None or actor.index is None:
+                continue  #dead or removed from the map
+            ai.take_turn(game)
+            if (not self.is_near(actor, player, self.sleep_radius) and
+                    (actor.x, actor.y) not in game.visible_tiles):
+                self.sleep(actor)
+            else:
+                self.schedule(actor, time + ACTION_COST * NORMAL_SPEED // ai.speed)
+
+    def active_count(self):
+        return len(self.queue)
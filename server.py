@@ -0,0 +1,328 @@
+#a game server without a window: every connection (TCP or Unix socket) plays
+#a game of its own. the client sends commands, one per line, and gets back
+#only the cells of the screen that changed since the last frame it got, so a
+#session costs a few hundred bytes per turn and is only drawn when a command
+#changes something. client.py shows the frames in a tdl window:
+#
+#   python server.py --port 7777      (or --unix /tmp/roguelike.sock)
+#   python client.py --port 7777
+#
+#commands (ASCII lines): up, down, left, right, pickup, inventory, descend,
+#ascend, quit, "mouse X Y", or a single character, the key pressed (a menu
+#option...). they go through controls.handle_keys() like the window's keys.
+#
+#the server's stream, all little-endian:
+#   hello: b'RLSS', version (B), screen width (H), screen height (H)
+#   then frames: size of the rest (I), then spans of changed cells, each one
+#       first cell (H, cells are counted row by row), cell count (B), the
+#       characters (one byte each), then the colors as runs covering the
+#       cells of the span: run length (B), foreground (3B), background (3B)
+#   the first frame has the whole screen, a frame with no change isn't sent.
+import argparse
+import asyncio
+import struct
+from array import array
+from constants import *
+from game import Game, seed_argument
+from render import Renderer, draw_menu
+from controls import menu_choice, play_turn
+from replay import RecordedEvent
+
+STREAM_MAGIC = b'RLSS'
+STREAM_VERSION = 1
+HELLO = struct.Struct('<4sBHH')
+FRAME_HEADER = struct.Struct('<I')
+SPAN_HEADER = struct.Struct('<HB')
+COLOR_RUN = struct.Struct('<B3B3B')
+#spans no more than this many unchanged cells apart are sent as one, the
+#unchanged cells cost less than the header of another span
+SPAN_GAP = 2
+MAX_SPAN = 255
+
+#the key each command stands for, as tdl would report it (key, char)
+COMMANDS = {
+    'up': ('UP', ''),
+    'down': ('DOWN', ''),
+    'left': ('LEFT', ''),
+    'right': ('RIGHT', ''),
+    'pickup': ('CHAR', 'g'),
+    'inventory': ('CHAR', 'i'),
+    'descend': ('CHAR', '<'),
+    'ascend': ('CHAR', '>'),
+    'quit': ('ESCAPE', ''),
+}
+
+WHITE = 0xFFFFFF
+BLACK = 0x000000
+
+def _rgb(color):
+    return (color[0] << 16) | (color[1] << 8) | color[2]
+
+class CellConsole:
+    #a console like tdl.Console (the calls the renderer makes, with tdl 1.1's
+    #arguments), without a window. characters are kept as codes and colors as
+    #0xRRGGBB, one array each, row by row
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        #the colors of tdl's printStr(), which isn't used
+        self.fg_default = WHITE
+        self.bg_default = BLACK
+        self.chars = array('I', [ord(' ')]) * (width * height)
+        self.fg = array('I', [WHITE]) * (width * height)
+        self.bg = array('I', [BLACK]) * (width * height)
+
+    def _color(self, color):
+        #None keeps the cell's color
+        if color is None:
+            return None
+        return _rgb(color)
+
+    def _put(self, i, char, fg, bg):
+        if char is not None:
+            self.chars[i] = char
+        if fg is not None:
+            self.fg[i] = fg
+        if bg is not None:
+            self.bg[i] = bg
+
+    def drawChar(self, x, y, char, fgcolor=(255, 255, 255), bgcolor=(0, 0, 0)):
+        if isinstance(char, str):
+            char = ord(char)
+        self._put(y * self.width + x, char, self._color(fgcolor), self._color(bgcolor))
+
+    def drawStr(self, x, y, string, fgcolor=(255, 255, 255), bgcolor=(0, 0, 0)):
+        #like tdl, a string longer than the line goes on to the next one
+        fg = self._color(fgcolor)
+        bg = self._color(bgcolor)
+        i = y * self.width + x
+        for char in string[:len(self.chars) - i]:
+            self._put(i, ord(char), fg, bg)
+            i += 1
+
+    def drawRect(self, x, y, width, height, string, fgcolor=(255, 255, 255), bgcolor=(0, 0, 0)):
+        if width is None:
+            width = self.width - x
+        if height is None:
+            height = self.height - y
+        if isinstance(string, str):
+            string = ord(string)
+        fg = self._color(fgcolor)
+        bg = self._color(bgcolor)
+        for row in range(y, y + height):
+            for i in range(row * self.width + x, row * self.width + x + width):
+                self._put(i, string, fg, bg)
+
+    def clear(self, fgcolor=(0, 0, 0), bgcolor=(0, 0, 0)):
+        n = self.width * self.height
+        self.chars = array('I', [ord(' ')]) * n
+        self.fg = array('I', [_rgb(fgcolor)]) * n
+        self.bg = array('I', [_rgb(bgcolor)]) * n
+
+    def setColors(self, fg=None, bg=None):
+        if fg is not None:
+            self.fg_default = _rgb(fg)
+        if bg is not None:
+            self.bg_default = _rgb(bg)
+
+    def move(self, x, y):
+        pass
+
+    def blit(self, source, x=0, y=0, width=None, height=None, srcX=0, srcY=0):
+        #copy a rectangle of source, a row (three array slices) at a time
+        (x, y) = (int(x), int(y))
+        if width is None:
+            width = source.width - srcX
+        if height is None:
+            height = source.height - srcY
+        width = min(width, self.width - x, source.width - srcX)
+        height = min(height, self.height - y, source.height - srcY)
+        if width <= 0:
+            return
+        for row in range(max(height, 0)):
+            a = (y + row) * self.width + x
+            b = (srcY + row) * source.width + srcX
+            self.chars[a:a + width] = source.chars[b:b + width]
+            self.fg[a:a + width] = source.fg[b:b + width]
+            self.bg[a:a + width] = source.bg[b:b + width]
+
+class FrameEncoder:
+    #turns what changed on a CellConsole since the last frame into a frame
+    #(see the stream format above). rows are compared as a whole first, only
+    #the ones that changed are looked at cell by cell
+    def __init__(self, console):
+        self.console = console
+        #what the client has, nothing at first
+        self.chars = None
+
+    def encode(self):
+        #the next frame, None if nothing changed
+        console = self.console
+        w = console.width
+        if self.chars is None:
+            spans = [(i, min(MAX_SPAN, row + w - i))
+                     for row in range(0, w * console.height, w) for i in range(row, row + w, MAX_SPAN)]
+        else:
+            spans = self.changed_spans()
+        self.chars = array('I', console.chars)
+        self.fg = array('I', console.fg)
+        self.bg = array('I', console.bg)
+        if not spans:
+            return None
+
+        chars = console.chars
+        fg = console.fg
+        bg = console.bg
+        parts = []
+        for (start, count) in spans:
+            parts.append(SPAN_HEADER.pack(start, count))
+            parts.append(bytes(c if c < 256 else ord('?') for c in chars[start:start + count]))
+            #runs of cells with the same colors
+            i = start
+            end = start + count
+            while i < end:
+                j = i + 1
+                while j < end and j - i < MAX_SPAN and fg[j] == fg[i] and bg[j] == bg[i]:
+                    j += 1
+                (f, b) = (fg[i], bg[i])
+                parts.append(COLOR_RUN.pack(j - i, f >> 16, (f >> 8) & 255, f & 255, b >> 16, (b >> 8) & 255, b & 255))
+                i = j
+        payload = b''.join(parts)
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+    def changed_spans(self):
+        console = self.console
+        w = console.width
+        spans = []
+        for row in range(0, w * console.height, w):
+            end = row + w
+            if (console.chars[row:end] == self.chars[row:end] and console.fg[row:end] == self.fg[row:end] and
+                    console.bg[row:end] == self.bg[row:end]):
+                continue
+            start = None
+            last = None
+            for i in range(row, end):
+                if (console.chars[i] == self.chars[i] and console.fg[i] == self.fg[i] and
+                        console.bg[i] == self.bg[i]):
+                    continue
+                if start is not None and i - last <= SPAN_GAP + 1 and i - start < MAX_SPAN:
+                    last = i
+                    continue
+                if start is not None:
+                    spans.append((start, last - start + 1))
+                start = last = i
+            spans.append((start, last - start + 1))
+        return spans
+
+def apply_frame(console, payload):
+    #draw the cells of a frame (without its size) on console, any tdl console
+    #or a CellConsole. it's what client.py does with the frames it gets
+    w = console.width
+    pos = 0
+    while pos < len(payload):
+        (start, count) = SPAN_HEADER.unpack_from(payload, pos)
+        pos += SPAN_HEADER.size
+        chars = payload[pos:pos + count]
+        pos += count
+        i = 0
+        while i < count:
+            (length, fr, fg, fb, br, bg, bb) = COLOR_RUN.unpack_from(payload, pos)
+            pos += COLOR_RUN.size
+            for j in range(i, i + length):
+                (y, x) = divmod(start + j, w)
+                console.drawChar(x, y, chars[j], (fr, fg, fb), (br, bg, bb))
+            i += length
+
+class Session:
+    #one connected player and their game. it's the "input" of the game (see
+    #controls.py): the commands read from the connection are the key events
+    def __init__(self, reader, writer, seed=None):
+        self.reader = reader
+        self.writer = writer
+        self.game = Game(seed=seed)
+        self.root = CellConsole(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.renderer = Renderer(self.root, CellConsole(MAP_WIDTH, MAP_HEIGHT),
+                                 CellConsole(SCREEN_WIDTH, PANEL_HEIGHT))
+        self.encoder = FrameEncoder(self.root)
+        self.mouse_x = 0
+        self.mouse_y = 0
+
+    async def run(self):
+        self.writer.write(HELLO.pack(STREAM_MAGIC, STREAM_VERSION, SCREEN_WIDTH, SCREEN_HEIGHT))
+        await self.send_frame()
+        while await play_turn(self.game, self) != 'exit':
+            await self.send_frame()
+
+    async def send_frame(self):
+        self.renderer.render_all(self.game, self.mouse_x, self.mouse_y)
+        frame = self.encoder.encode()
+        if frame is not None:
+            self.writer.write(frame)
+            await self.writer.drain()
+
+    async def get(self):
+        #the events of the next command. the connection closing is like escape
+        line = await self.reader.readline()
+        if not line:
+            return [RecordedEvent('KEYDOWN', key='ESCAPE')]
+        return command_events(line.decode('ascii', 'replace').strip())
+
+    async def key_wait(self):
+        while True:
+            for event in await self.get():
+                if event.type == 'KEYDOWN':
+                    return event
+
+    async def menu(self, header, options, width):
+        #like the window's menu (see Launcher.py), shown over the screen
+        #until the next key
+        height = len(options) + 1
+        window = self.renderer.layers.get(('menu', header, tuple(options), width), width, height,
+                                          lambda window: draw_menu(window, header, options, 1))
+        self.renderer.popup = (window, SCREEN_WIDTH/2 - width/2, SCREEN_HEIGHT/2 - height/2)
+        try:
+            await self.send_frame()
+            key = await self.key_wait()
+        finally:
+            self.renderer.popup = None
+        return menu_choice(key, options)
+
+def command_events(command):
+    #the events a command stands for, none if it isn't one
+    if command in COMMANDS:
+        (key, char) = COMMANDS[command]
+        return [RecordedEvent('KEYDOWN', key=key, char=char)]
+    if len(command) == 1:
+        return [RecordedEvent('KEYDOWN', key='CHAR', char=command)]
+    words = command.split()
+    if len(words) == 3 and words[0] == 'mouse' and words[1].isdigit() and words[2].isdigit():
+        return [RecordedEvent('MOUSEMOTION', cell=(int(words[1]), int(words[2])))]
+    return []
+
+async def serve(host, port, unix_path, seed):
+    async def handle(reader, writer):
+        try:
+            await Session(reader, writer, seed).run()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(handle, unix_path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve games over a socket, without a window.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--seed', type=seed_argument, help='seed of every game, random if not given')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.unix, args.seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+class SpatialIndex:
+    #answers "what is at (x, y)?" without scanning every object: a dict from
+    #a cell to the list of objects standing on it (empty cells aren't stored).
+    #"version" changes whenever an object is added, removed or moved.
+    #the objects of a cell are kept in drawing order: what doesn't block
+    #(items, stairs) lies under the rest, the last one put there at the
+    #bottom, so the order of the object list doesn't matter
+    def __init__(self):
+        self.cells = {}
+        self.version = 0
+
+    def add(self, obj):
+        self.version += 1
+        key = (obj.x, obj.y)
+        cell = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = [obj]
+        elif obj.blocks:
+            cell.append(obj)
+        else:
+            cell.insert(0, obj)
+
+    def remove(self, obj):
+        self.version += 1
+        key = (obj.x, obj.y)
+        cell = self.cells[key]
+        cell.remove(obj)
+        if not cell:
+            del self.cells[key]
+
+    def move(self, obj, x, y):
+        #change the object's position and file it under its new cell
+        self.remove(obj)
+        obj.x = x
+        obj.y = y
+        self.add(obj)
+
+    def at(self, x, y):
+        #the objects at (x, y), in drawing order. don't modify it!
+        return self.cells.get((x, y), ())
+
+    def blocking_at(self, x, y):
+        for obj in self.cells.get((x, y), ()):
+            if obj.blocks:
+                return obj
+        return None
+
+class ObjectList(list):
+    #the list of objects on the map. it behaves like a normal list, but
+    #objects added to it are indexed by position, and they are told about
+    #the index so that moving them keeps it up to date.
+    def __init__(self, objects=()):
+        list.__init__(self)
+        self.index = SpatialIndex()
+        self.extend(objects)
+
+    def append(self, obj):
+        list.append(self, obj)
+        self.index.add(obj)
+        obj.index = self.index
+
+    def insert(self, i, obj):
+        list.insert(self, i, obj)
+        self.index.add(obj)
+        obj.index = self.index
+
+    def extend(self, objects):
+        for obj in objects:
+            self.append(obj)
+
+    def remove(self, obj):
+        list.remove(self, obj)
+        self.index.remove(obj)
+        obj.index = None
+
+class RectGrid:
+    #finds which of many rectangles (rooms) overlap a new one, without
+    #testing all of them: each rectangle is filed in every square bucket of
+    #the grid it touches, and a query only looks at the buckets it touches
+    def __init__(self, bucket_size):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+
+    def _keys(self, rect):
+        size = self.bucket_size
+        for bx in range(rect.x1 // size, rect.x2 // size + 1):
+            for by in range(rect.y1 // size, rect.y2 // size + 1):
+                yield (bx, by)
+
+    def add(self, rect):
+        for key in self._keys(rect):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = [rect]
+            else:
+                bucket.append(rect)
+
+    def intersects_any(self, rect):
+        #true if rect intersects (see Rect.intersect) any rectangle added so far
+        for key in self._keys(rect):
+            for other in self.buckets.get(key, ()):
+                if rect.intersect(other):
+                    return True
+        return False
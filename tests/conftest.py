@@ -0,0 +1,5 @@
+#the checks import the game's modules, which live one directory up
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
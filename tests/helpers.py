@@ -0,0 +1,8 @@
+#what the checks share: a snapshot of an object that two games, or a game
+#and its saved or frozen copy, must agree on
+
+def describe(obj):
+    fighter = obj.fighter
+    return (obj.name, obj.x, obj.y, obj.char, list(obj.color), obj.blocks,
+            fighter and (fighter.max_hp, fighter.hp, fighter.defense, fighter.power, fighter.death_function),
+            obj.ai and obj.ai.speed, obj.item and obj.item.use_function)
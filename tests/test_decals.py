@@ -0,0 +1,49 @@
+#checks of decals.py: a dead monster leaves the object list for good, and its
+#remains are drawn under whatever stands on them
+from constants import *
+from game import Game, create_object
+from render import Renderer, get_names_under_mouse
+from server import CellConsole
+
+def visible_floor(game):
+    #an open tile in view, next to the player
+    (px, py) = (game.player.x, game.player.y)
+    for (x, y) in [(px + 1, py), (px - 1, py), (px, py + 1), (px, py - 1)]:
+        if not game.is_blocked(x, y) and (x, y) in game.visible_tiles:
+            return (x, y)
+
+def test_a_dead_monster_leaves_its_remains():
+    game = Game(seed=1)
+    monster = [obj for obj in game.objects if obj.ai][0]
+    (x, y) = (monster.x, monster.y)
+    version = game.map.decals.version
+    count = len(game.objects)
+    monster.fighter.take_damage(monster.fighter.hp, game)
+    assert monster not in game.objects and len(game.objects) == count - 1
+    assert monster.index is None and monster.ai is None and monster.fighter is None
+    assert game.map.decals.at(x, y) == ('%', color_dark_red, 'remains of ' + monster.name)
+    assert game.map.decals.version > version
+    assert not game.is_blocked(x, y)
+    #the turns go on without it
+    for i in range(5):
+        game.monsters_take_turn()
+    assert monster not in game.objects and (monster.x, monster.y) == (x, y)
+
+def test_remains_are_drawn_under_objects():
+    game = Game(seed=2)
+    (x, y) = visible_floor(game)
+    orc = create_object('orc', x, y)
+    game.objects.append(orc)
+    orc.fighter.take_damage(orc.fighter.hp, game)
+    potion = create_object('healing potion', x, y)
+    game.objects.append(potion)
+    renderer = Renderer(CellConsole(SCREEN_WIDTH, SCREEN_HEIGHT), CellConsole(MAP_WIDTH, MAP_HEIGHT),
+                        CellConsole(SCREEN_WIDTH, PANEL_HEIGHT))
+    con = renderer.con
+    renderer.render_all(game)
+    assert chr(con.chars[y * con.width + x]) == '!'
+    assert get_names_under_mouse(game, x, y) == 'Remains of orc, healing potion'
+    game.objects.remove(potion)
+    renderer.render_all(game)
+    assert chr(con.chars[y * con.width + x]) == '%'
+    assert con.fg[y * con.width + x] == 0xCC0000
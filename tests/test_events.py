@@ -0,0 +1,94 @@
+#checks of events.py: the events of a turn reach every sink once, at the end
+#of the turn, and the binary log reads back what was written
+import asyncio
+import io
+from events import (EventBus, MessageLogSink, StdoutSink, BinaryLogSink, read_event_log,
+                    AttackEvent, DeathEvent, PickupEvent)
+from controls import play_turn
+from game import Game, create_object
+from replay import RecordedEvent
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    def consume(self, events):
+        self.batches.append(list(events))
+
+    def close(self):
+        self.closed = True
+
+class KeyInput:
+    #the input of a turn where the player presses one key
+    def __init__(self, key):
+        self.key = key
+
+    async def get(self):
+        return [RecordedEvent('KEYDOWN', key=self.key)]
+
+def some_events():
+    return [AttackEvent(1, 'orc', 'player', 3), AttackEvent(1, 'player', 'orc', 0),
+            DeathEvent(2, 'orc'), PickupEvent(2, 'healing potion'),
+            PickupEvent(3, 'scroll of fireball', picked_up=False), DeathEvent(4, 'player', player=True)]
+
+def test_each_sink_gets_the_batch_once_at_flush():
+    (first, second) = (ListSink(), ListSink())
+    bus = EventBus([first])
+    bus.add_sink(second)
+    events = some_events()
+    for event in events:
+        bus.emit(event)
+    assert first.batches == [] and second.batches == []
+    bus.flush()
+    assert first.batches == [events] and second.batches == [events]
+    #nothing new, nothing sent
+    bus.flush()
+    assert len(first.batches) == 1
+    bus.emit(DeathEvent(5, 'troll'))
+    bus.close()
+    assert [len(batch) for batch in first.batches] == [len(events), 1]
+    assert first.closed and second.closed
+
+def test_message_log_and_stdout_sinks():
+    game = Game(seed=1)
+    del game.game_msgs[:]
+    stream = io.StringIO()
+    game.events.add_sink(StdoutSink(stream))
+    game.events.emit(AttackEvent(1, 'orc', 'player', 3))
+    game.events.emit(DeathEvent(1, 'orc'))
+    game.events.flush()
+    texts = ['Orc attacks player for 3 hit points.', 'Orc is dead!']
+    assert [text for (text, color) in game.game_msgs] == texts
+    assert stream.getvalue() == ''.join(text + '\n' for text in texts)
+
+def test_binary_log_round_trip(tmp_path):
+    path = str(tmp_path / 'events.rlev')
+    bus = EventBus([BinaryLogSink(path)])
+    events = some_events()
+    for event in events[:3]:
+        bus.emit(event)
+    bus.flush()
+    for event in events[3:]:
+        bus.emit(event)
+    bus.close()
+    fields = lambda event: [(slot, getattr(event, slot)) for slot in event.__slots__]
+    assert [fields(event) for event in read_event_log(path)] == [fields(event) for event in events]
+
+def test_a_fight_is_told_at_the_end_of_the_turn():
+    game = Game(seed=1)
+    (px, py) = (game.player.x, game.player.y)
+    (key, dx, dy) = [(key, dx, dy) for (key, dx, dy) in [('RIGHT', 1, 0), ('LEFT', -1, 0), ('DOWN', 0, 1), ('UP', 0, -1)]
+                     if not game.is_blocked(px + dx, py + dy)][0]
+    orc = create_object('orc', px + dx, py + dy)
+    orc.fighter.hp = 1
+    game.objects.append(orc)
+    sink = ListSink()
+    game.events.add_sink(sink)
+    asyncio.run(play_turn(game, KeyInput(key)))
+    assert orc not in game.objects
+    assert len(sink.batches) == 1 and game.events.pending == []
+    (attack, death) = sink.batches[0][:2]
+    assert (attack.attacker, attack.target, attack.damage) == ('player', 'orc', 5)
+    assert death.name == 'orc' and not death.player
+    assert 'Orc is dead!' in [text for (text, color) in game.game_msgs]
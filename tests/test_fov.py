@@ -0,0 +1,146 @@
+#checks of fov.py: the table-driven Shadowcaster against a plain
+#shadowcasting written the textbook way (slopes computed cell by cell) and
+#against what any FOV has to give on simple maps, and the cache of results
+import random
+from fov import FovCache, Shadowcaster
+from game import Game
+from gamemap import GameMap
+
+def reference_fov(transparent, width, height, x, y, radius, light_walls):
+    #recursive shadowcasting over the whole map, no tables and no box
+    visible = {(x, y)}
+
+    def opaque(cx, cy):
+        if cx < 0 or cy < 0 or cx >= width or cy >= height:
+            return True
+        return not transparent[cy * width + cx]
+
+    def cast(row, start, end, xx, xy, yx, yy):
+        if start < end:
+            return
+        new_start = 0.0
+        for depth in range(row, radius + 1):
+            blocked = False
+            for col in range(depth, -1, -1):
+                cx = x - col * xx - depth * xy
+                cy = y - col * yx - depth * yy
+                high = (col + 0.5) / (depth - 0.5)
+                low = (col - 0.5) / (depth + 0.5)
+                if start < low:
+                    continue
+                if end > high:
+                    break
+                wall = opaque(cx, cy)
+                if col * col + depth * depth <= radius * radius and (light_walls or not wall):
+                    if 0 <= cx < width and 0 <= cy < height:
+                        visible.add((cx, cy))
+                if blocked:
+                    if wall:
+                        new_start = low
+                        continue
+                    blocked = False
+                    start = new_start
+                elif wall and depth < radius:
+                    blocked = True
+                    cast(depth + 1, start, high, xx, xy, yx, yy)
+                    new_start = low
+            if blocked:
+                break
+
+    for octant in [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+                   (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]:
+        cast(1, 1.0, 0.0, *octant)
+    return visible
+
+def noise_map(width, height, seed, walls=0.3):
+    #a map with walls scattered at random
+    rng = random.Random(seed)
+    map = GameMap(width, height, blocked=False)
+    for i in range(width * height):
+        if rng.random() < walls:
+            map.blocked[i] = map.block_sight[i] = 1
+    return map
+
+def fixed_maps():
+    maps = [Game(seed=seed).map for seed in (1, 2, 3)]
+    maps += [noise_map(40, 30, seed) for seed in (1, 2)]
+    return maps
+
+def test_matches_reference_shadowcasting():
+    for map in fixed_maps():
+        transparent = map.transparency()
+        for (radius, light_walls) in [(10, True), (10, False), (4, True)]:
+            fov = Shadowcaster(radius, light_walls)
+            for i in range(0, map.width * map.height, 7):
+                if not transparent[i]:
+                    continue
+                (x, y) = (i % map.width, i // map.width)
+                result = fov.compute_result(transparent, map.width, map.height, x, y)
+                expected = reference_fov(transparent, map.width, map.height, x, y, radius, light_walls)
+                assert set(result) == expected, (x, y, radius, light_walls)
+                assert len(result) == len(expected)
+
+def test_open_map_sees_the_whole_disc():
+    map = GameMap(41, 41, blocked=False)
+    result = FovCache(map, Shadowcaster(10)).compute(20, 20)
+    disc = {(x, y) for x in range(41) for y in range(41) if (x - 20) ** 2 + (y - 20) ** 2 <= 100}
+    assert set(result) == disc
+
+def test_edge_of_the_map():
+    #the box is cut by the map's edges, nothing outside it is seen
+    map = GameMap(12, 8, blocked=False)
+    result = FovCache(map, Shadowcaster(10)).compute(0, 0)
+    assert set(result) == {(x, y) for x in range(12) for y in range(8) if x * x + y * y <= 100}
+    assert result.rect() == (0, 0, 11, 8)
+
+def test_wall_casts_a_shadow():
+    #a pillar right next to the origin hides what is straight behind it
+    map = GameMap(21, 21, blocked=False)
+    i = map.index(11, 10)
+    map.blocked[i] = map.block_sight[i] = 1
+    result = FovCache(map, Shadowcaster(10, light_walls=True)).compute(10, 10)
+    assert (11, 10) in result
+    assert all((x, 10) not in result for x in range(12, 21))
+    result = FovCache(map, Shadowcaster(10, light_walls=False)).compute(10, 10)
+    assert (11, 10) not in result
+
+class CountingFov:
+    #a Shadowcaster that counts the FOVs it really computes
+    def __init__(self, radius):
+        self.shadowcaster = Shadowcaster(radius)
+        self.calls = 0
+
+    def compute_result(self, *args):
+        self.calls += 1
+        return self.shadowcaster.compute_result(*args)
+
+def test_cache_keeps_the_last_origins():
+    map = GameMap(30, 30, blocked=False)
+    fov = CountingFov(6)
+    cache = FovCache(map, fov, max_entries=3)
+    first = cache.compute(5, 5)
+    assert cache.compute(5, 5) is first and fov.calls == 1
+    for x in (6, 7, 8):
+        cache.compute(x, 5)
+    #(5, 5) was the least recently used one, it's computed again
+    assert cache.compute(5, 5) is not first and fov.calls == 5
+    assert (cache.hits, cache.misses) == (1, 5)
+
+def test_cache_is_dropped_when_the_walls_change():
+    map = GameMap(30, 30, blocked=False)
+    fov = CountingFov(10)
+    cache = FovCache(map, fov)
+    before = cache.compute(10, 10)
+    assert (12, 10) in before
+    #a wall through the map's arrays (TileView bumps the version)
+    map[11][10].blocked = True
+    map[11][10].block_sight = True
+    after = cache.compute(10, 10)
+    assert fov.calls == 2
+    assert (12, 10) not in after
+    assert set(after) == set(FovCache(map, Shadowcaster(10)).compute(10, 10))
+    #a change the map doesn't know about, the game says so with invalidate()
+    map.block_sight[map.index(9, 10)] = 1
+    assert cache.compute(10, 10) is after
+    cache.invalidate()
+    assert (8, 10) not in cache.compute(10, 10) and fov.calls == 3
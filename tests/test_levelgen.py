@@ -0,0 +1,43 @@
+#checks of the packed levels (Game.pack_level/load_level) and of the levels
+#made ahead of time by levelgen.py
+from game import Game, generate_level, level_seed
+from levelgen import LevelPregenerator
+
+def layout(game):
+    #what a freshly generated level is made of
+    map = game.map
+    return (map.width, map.height, bytes(map.blocked), bytes(map.block_sight),
+            [(obj.name, obj.x, obj.y) for obj in game.objects])
+
+def test_pack_and_load_round_trip():
+    for seed in (1, 2, 3):
+        game = Game(seed=seed)
+        data = game.pack_level()
+        loaded = Game(seed=seed, generate=False)
+        loaded.load_level(data)
+        assert layout(loaded) == layout(game)
+        assert (loaded.player.x, loaded.player.y) == (game.player.x, game.player.y)
+        assert loaded.stairs.name == 'stairs' and loaded.stairs in loaded.objects
+        assert loaded.pack_level() == data
+
+def test_loaded_level_plays_like_the_generated_one():
+    #same seed, same level, same moves: the same game
+    game = Game(seed=5)
+    loaded = Game(seed=5, generate=False)
+    loaded.load_level(game.pack_level())
+    for g in (game, loaded):
+        for (dx, dy) in [(1, 0), (1, 0), (0, 1), (-1, 0), (0, -1)] * 6:
+            g.player_move_or_attack(dx, dy)
+            g.monsters_take_turn()
+    assert layout(loaded) == layout(game)
+    assert loaded.player.fighter.hp == game.player.fighter.hp
+
+def test_pregenerated_levels_are_the_generated_ones():
+    game = Game(seed=7)
+    pregenerator = LevelPregenerator(game)
+    try:
+        for dungeon_level in (2, 3):
+            data = pregenerator.take(dungeon_level)
+            assert data == generate_level(game.settings(), level_seed(game.seed, dungeon_level))
+    finally:
+        pregenerator.close()
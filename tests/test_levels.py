@@ -0,0 +1,72 @@
+#checks of levels.py and of the levels Game.freeze_level() compresses: what
+#comes back must be the level that was left, down to the hp of its monsters
+import random
+from game import Game, create_object
+from levels import Level, LevelManager, pack_bits, unpack_bits
+from helpers import describe
+
+def describe_level(level):
+    map = level.map
+    return (map.width, map.height, bytes(map.blocked), bytes(map.block_sight), bytes(map.explored),
+            bytes(map.decals.cells), map.decals.kinds, [describe(obj) for obj in level.objects],
+            level.stairs and describe(level.stairs), level.upstairs and describe(level.upstairs))
+
+def played_level(seed):
+    #a level after some turns: explored tiles, wounded monsters, remains
+    game = Game(seed=seed)
+    rng = random.Random(seed)
+    for i in range(60):
+        game.player_move_or_attack(rng.randint(-1, 1), rng.randint(-1, 1))
+        game.monsters_take_turn()
+        #the renderer marks what was seen as explored
+        for (x, y) in game.visible_tiles:
+            game.map.explored[game.map.index(x, y)] = 1
+    for obj in game.objects:
+        if obj.fighter and obj is not game.player:
+            obj.fighter.hp -= 1
+    game.map.decals.add(1, 1, '%', [204, 0, 0], 'remains of orc')
+    upstairs = create_object('upstairs', game.player.x, game.player.y)
+    game.objects.append(upstairs)
+    game.objects.remove(game.player)
+    return (game, Level(game.map, game.objects, game.stairs, upstairs))
+
+def test_bits_round_trip():
+    rng = random.Random(1)
+    for length in (0, 1, 7, 8, 9, 4000, 4001):
+        layer = bytearray(rng.randint(0, 1) for i in range(length))
+        data = pack_bits(layer)
+        assert len(data) == (length + 7) // 8
+        assert unpack_bits(data, length) == layer
+
+def test_freeze_and_thaw_round_trip():
+    for seed in (1, 2, 3):
+        (game, level) = played_level(seed)
+        thawed = game.thaw_level(game.freeze_level(level))
+        assert describe_level(thawed) == describe_level(level)
+        assert thawed.stairs in thawed.objects and thawed.upstairs in thawed.objects
+        assert game.freeze_level(thawed) == game.freeze_level(level)
+
+def test_manager_gives_back_the_levels_left():
+    #with one recent level, the others are frozen, then thawed when taken
+    (game, first) = played_level(1)
+    manager = LevelManager(game.freeze_level, game.thaw_level, recent=1)
+    levels = {1: first}
+    for dungeon_level in (2, 3, 4):
+        levels[dungeon_level] = played_level(dungeon_level)[1]
+    expected = {n: describe_level(level) for (n, level) in levels.items()}
+    for (n, level) in levels.items():
+        manager.store(n, level)
+    assert list(manager.recent) == [4] and list(manager.compressed) == [1, 2, 3]
+    for n in (2, 4, 1, 3):
+        assert n in manager
+        assert describe_level(manager.take(n)) == expected[n]
+        assert n not in manager
+
+def test_manager_forgets_over_budget():
+    (game, level) = played_level(1)
+    size = len(game.freeze_level(level))
+    manager = LevelManager(game.freeze_level, game.thaw_level, recent=0, budget=2 * size)
+    for n in (1, 2, 3):
+        manager.store(n, level)
+    assert list(manager.compressed) == [2, 3]
+    assert manager.take(1) is None
@@ -0,0 +1,38 @@
+#checks of the dungeon levels Game.make_map() generates, and of the bucket
+#grid it tests new rooms against
+import itertools
+import random
+from game import Game, Rect, create_object
+from spatial import ObjectList, RectGrid
+from constants import *
+
+def test_grid_finds_the_overlaps_of_a_plain_search():
+    rng = random.Random(1)
+    grid = RectGrid(ROOM_MAX_SIZE + 1)
+    rooms = []
+    for i in range(2000):
+        (w, h) = (rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE), rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE))
+        room = Rect(rng.randint(0, 400 - w - 1), rng.randint(0, 300 - h - 1), w, h)
+        overlaps = any(room.intersect(other) for other in rooms)
+        assert grid.intersects_any(room) == overlaps
+        if not overlaps:
+            rooms.append(room)
+            grid.add(room)
+    assert len(rooms) > 100
+
+def test_a_level_always_has_a_room():
+    for max_rooms in (0, 1):
+        game = Game(seed=2, max_rooms=max_rooms)
+        assert not game.map.is_blocked(game.player.x, game.player.y)
+        assert (game.stairs.x, game.stairs.y) == (game.player.x, game.player.y)
+
+def test_items_lie_under_monsters():
+    #whatever order they were put there in, a tile draws what blocks last
+    for order in itertools.permutations(['orc', 'healing potion', 'stairs']):
+        objects = ObjectList(create_object(kind, 5, 5) for kind in order)
+        assert [obj.blocks for obj in objects.index.at(5, 5)] == [False, False, True]
+    troll = create_object('troll', 6, 5)
+    objects.append(troll)
+    troll.place(5, 5)
+    assert objects.index.at(5, 5)[-1] is troll
+    assert [obj.blocks for obj in objects.index.at(5, 5)] == [False, False, True, True]
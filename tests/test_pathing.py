@@ -0,0 +1,62 @@
+#checks of pathing.py: a FlowField updated one step at a time must give the
+#same distances as one built from scratch at the same position
+import random
+from game import Game
+from gamemap import GameMap
+from pathing import FlowField, DIRECTIONS
+
+def distances(field):
+    map = field.map
+    return [field.distance(x, y) for y in range(map.height) for x in range(map.width)]
+
+def walk(map, start, steps, seed):
+    #the positions of a random walk over the open tiles
+    rng = random.Random(seed)
+    (x, y) = start
+    path = []
+    for i in range(steps):
+        (dx, dy) = rng.choice(DIRECTIONS)
+        if map.in_bounds(x + dx, y + dy) and not map.is_blocked(x + dx, y + dy):
+            (x, y) = (x + dx, y + dy)
+        path.append((x, y))
+    return path
+
+def test_incremental_update_matches_rebuild():
+    for seed in (1, 2, 3):
+        game = Game(seed=seed)
+        field = FlowField(game.map)
+        start = (game.player.x, game.player.y)
+        field.update(*start)
+        for (x, y) in walk(game.map, start, 200, seed):
+            field.update(x, y)
+            fresh = FlowField(game.map)
+            fresh.rebuild(x, y)
+            assert distances(field) == distances(fresh), (seed, x, y)
+
+def test_open_map_distances():
+    #without walls the number of steps is the chebyshev distance
+    map = GameMap(30, 30, blocked=False)
+    field = FlowField(map, radius=8)
+    field.update(15, 15)
+    field.update(16, 15)
+    for y in range(30):
+        for x in range(30):
+            d = max(abs(x - 16), abs(y - 15))
+            assert field.distance(x, y) == (d if d <= 8 else None)
+
+def test_best_step_goes_around_a_wall():
+    #a wall between the monster and the player, open at the bottom
+    map = GameMap(10, 10, blocked=False)
+    for y in range(0, 8):
+        map.blocked[map.index(5, y)] = 1
+    map.version += 1
+    field = FlowField(map)
+    field.update(8, 2)
+    (x, y) = (2, 2)
+    for i in range(20):
+        if (x, y) == (8, 2):
+            break
+        (dx, dy) = field.best_step(x, y, map.is_blocked)
+        assert (dx, dy) != (0, 0)
+        (x, y) = (x + dx, y + dy)
+    assert (x, y) == (8, 2)
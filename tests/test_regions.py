@@ -0,0 +1,93 @@
+#checks of regions.py: with the roaming rules, the far monsters go on, the
+#same whatever the number of workers, without two monsters on a tile or one
+#in a wall, and without paging in the chunks of a world
+import tempfile
+from game import Game
+from regions import RegionSimulator, DISTANT_RADIUS
+from world import ChunkStore
+
+def describe(obj):
+    return (obj.name, obj.x, obj.y, obj.fighter and obj.fighter.hp)
+
+def big_game(roaming=True):
+    #a dungeon big enough for many regions far from the player
+    return Game(seed=1, map_width=400, map_height=300, max_rooms=600, max_room_monsters=6, roaming=roaming)
+
+def play(game, turns):
+    #the player stands still (and can't die), the monsters go on
+    for i in range(turns):
+        game.player.fighter.hp = game.player.fighter.max_hp
+        game.monsters_take_turn()
+
+def test_same_results_in_process_and_in_workers():
+    games = []
+    for processes in (0, 2):
+        game = big_game()
+        game.regions = RegionSimulator(processes, interval=2)
+        try:
+            play(game, 20)
+        finally:
+            game.regions.close()
+        games.append(game)
+    (a, b) = games
+    assert a.regions.regions_run > 0 and a.regions.handoffs > 0
+    assert (a.regions.regions_run, a.regions.handoffs) == (b.regions.regions_run, b.regions.handoffs)
+    assert [describe(obj) for obj in a.objects] == [describe(obj) for obj in b.objects]
+
+def test_no_overlap_and_no_monster_in_a_wall():
+    game = big_game()
+    start = [describe(obj) for obj in game.objects]
+    game.regions = RegionSimulator(0, interval=1)
+    play(game, 30)
+    assert [describe(obj) for obj in game.objects] != start
+    taken = set()
+    for obj in game.objects:
+        if obj.blocks:
+            assert (obj.x, obj.y) not in taken
+            taken.add((obj.x, obj.y))
+            assert not game.map.is_blocked(obj.x, obj.y)
+    #every sleeping monster is filed where it is
+    scheduler = game.scheduler
+    for (key, region) in scheduler.regions.items():
+        for actor in region.values():
+            assert (actor.x // 64, actor.y // 64) == key
+            assert actor in scheduler.dormant[(actor.x // scheduler.wake_radius, actor.y // scheduler.wake_radius)]
+
+def test_far_monsters_go_on():
+    game = big_game()
+    game.regions = RegionSimulator(0, interval=1)
+    far = [obj for obj in game.objects if obj.ai and obj.distance_to(game.player) > 3 * DISTANT_RADIUS]
+    for obj in far:
+        obj.fighter.hp = 1
+    start = [describe(obj) for obj in far]
+    play(game, 10)
+    after = [describe(obj) for obj in far]
+    #they wandered about and healed, while asleep
+    assert all(obj in game.scheduler.regions[(obj.x // 64, obj.y // 64)].values() for obj in far)
+    assert sum(a[1:3] != b[1:3] for (a, b) in zip(start, after)) > len(far) // 2
+    assert sum(a[3] > b[3] for (a, b) in zip(after, start)) > len(far) // 4
+
+def test_plain_rules_leave_far_monsters_alone():
+    #without roaming, the far monsters follow the rules of the others: the
+    #same game as without a simulator
+    plain = big_game(roaming=False)
+    simulated = big_game(roaming=False)
+    simulated.regions = RegionSimulator(0, interval=1)
+    play(plain, 20)
+    play(simulated, 20)
+    assert [describe(obj) for obj in simulated.objects] == [describe(obj) for obj in plain.objects]
+
+def test_world_chunks_are_not_paged_in():
+    store = ChunkStore(tempfile.TemporaryFile(), 2048, 2048, resident=24)
+    game = Game(seed=2, world=store, roaming=True)
+    #make more chunks than are kept in memory, far enough from the player
+    #for their regions to be simulated: some of them border dropped chunks
+    for (x, y) in [(1024 + dx, 1024 + dy) for dx in (-256, 0, 256) for dy in (-256, 0, 256)]:
+        store.generate_around(x, y, 64)
+    game.regions = RegionSimulator(0, interval=1)
+    play(game, 5)
+    loads = store.loads
+    play(game, 40)
+    assert game.regions.handoffs > 0
+    assert store.loads == loads
+    store.close()
@@ -0,0 +1,91 @@
+#checks of render.py: whatever the renderer skips drawing, its consoles must
+#end up as if everything was drawn again, every frame
+import random
+import tempfile
+from constants import *
+from game import Game
+from render import Renderer, BackgroundLayer
+from server import CellConsole
+from world import ChunkStore
+
+MOVES = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)]
+
+def packed(color):
+    return (color[0] << 16) | (color[1] << 8) | color[2]
+
+def new_renderer():
+    return Renderer(CellConsole(SCREEN_WIDTH, SCREEN_HEIGHT), CellConsole(MAP_WIDTH, MAP_HEIGHT),
+                    CellConsole(SCREEN_WIDTH, PANEL_HEIGHT))
+
+def frames(game, turns, seed):
+    #render every turn of a random walk (the player can't die), yields the
+    #renderer after each frame
+    renderer = new_renderer()
+    rng = random.Random(seed)
+    renderer.render_all(game)
+    yield renderer
+    for i in range(turns):
+        game.player.fighter.hp = game.player.fighter.max_hp
+        game.player_move_or_attack(*rng.choice(MOVES))
+        game.monsters_take_turn()
+        renderer.render_all(game)
+        yield renderer
+
+def naive_background(game, renderer):
+    #the background of every cell of the map console, worked out one by one
+    con = renderer.con
+    map = game.map
+    (cam_x, cam_y) = renderer.camera
+    bg = []
+    for y in range(cam_y, cam_y + con.height):
+        for x in range(cam_x, cam_x + con.width):
+            i = map.index(x, y)
+            if not map.in_bounds(x, y) or not map.explored[i]:
+                color = (0, 0, 0)
+            elif (x, y) in game.visible_tiles:
+                color = color_light_wall if map.block_sight[i] else color_light_ground
+            else:
+                color = color_dark_wall if map.block_sight[i] else color_dark_ground
+            bg.append(packed(color))
+    return bg
+
+def world_game(seed):
+    return Game(seed=seed, world=ChunkStore(tempfile.TemporaryFile(), 512, 512))
+
+def test_background_is_the_shade_of_every_cell():
+    for game in [Game(seed=1), Game(seed=2), world_game(3)]:
+        for renderer in frames(game, 150, 4):
+            assert list(renderer.con.bg) == naive_background(game, renderer)
+
+def test_only_changed_shades_are_drawn():
+    game = Game(seed=8)
+    con = CellConsole(MAP_WIDTH, MAP_HEIGHT)
+    background = BackgroundLayer(game.map, [None, color_dark_wall, color_dark_ground,
+                                            color_light_wall, color_light_ground])
+    first = background.update(con, game.visible_tiles)
+    assert first == len(list(game.visible_tiles))
+    #the same FOV again: nothing to draw
+    assert background.update(con, game.visible_tiles) == 0
+    #one step: the cells that came into view or went out of it, far fewer
+    #than all the explored ones
+    (x, y) = (game.player.x, game.player.y)
+    (dx, dy) = [(dx, dy) for (dx, dy) in MOVES if not game.is_blocked(x + dx, y + dy)][0]
+    game.player_move_or_attack(dx, dy)
+    drawn = background.update(con, game.visible_tiles)
+    assert 0 < drawn < sum(game.map.explored)
+
+def test_partial_redraw_is_a_full_redraw():
+    for game in [Game(seed=5), world_game(6)]:
+        for renderer in frames(game, 100, 7):
+            #a renderer that never drew anything, looking from the same place
+            full = new_renderer()
+            full.camera = renderer.camera
+            game.fov_recompute = True
+            full.render_all(game)
+            for (a, b) in [(renderer.con, full.con), (renderer.root, full.root)]:
+                assert a.chars == b.chars
+                assert a.bg == b.bg
+                #an erased cell keeps the color of the character it had,
+                #nothing shows it
+                assert [f for (c, f) in zip(a.chars, a.fg) if c != ord(' ')] == \
+                       [f for (c, f) in zip(b.chars, b.fg) if c != ord(' ')]
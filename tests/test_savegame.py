@@ -0,0 +1,79 @@
+#checks of savegame.py: a loaded game must be the saved one, and play on
+#exactly like it would have
+import os
+import random
+from game import Game, create_object
+from savegame import save_game, load_game, Autosave
+from helpers import describe
+
+#the same moves for both games, with a potion drunk now and then
+MOVES = [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)]
+
+def play(game, turns, seed):
+    rng = random.Random(seed)
+    for i in range(turns):
+        if game.game_state != 'playing':
+            break
+        if game.inventory and game.player.fighter.hp < game.player.fighter.max_hp:
+            game.inventory[0].item.use(game)
+        game.player_move_or_attack(*rng.choice(MOVES))
+        game.monsters_take_turn()
+
+def state(game):
+    map = game.map
+    return (game.seed, game.roaming, game.dungeon_level, game.turn, game.game_state, game.rng.getstate(),
+            bytes(map.blocked), bytes(map.block_sight), bytes(map.explored), bytes(map.decals.cells),
+            map.decals.kinds, [describe(obj) for obj in game.objects],
+            [describe(obj) for obj in game.inventory], game.game_msgs,
+            describe(game.stairs), game.upstairs and describe(game.upstairs),
+            sorted(game.levels.recent), sorted(game.levels.compressed))
+
+def saved_game(seed, roaming=False):
+    #a game on its third level, with levels left behind and a potion. the
+    #player is made tough enough to walk around that long
+    game = Game(seed=seed, roaming=roaming)
+    game.player.fighter.max_hp = game.player.fighter.hp = 1000
+    play(game, 20, seed)
+    game.next_level()
+    play(game, 20, seed + 1)
+    game.next_level()
+    play(game, 20, seed + 2)
+    game.inventory.append(create_object('healing potion', 0, 0))
+    return game
+
+def test_save_and_load_round_trip(tmp_path):
+    for seed in (1, 2):
+        path = str(tmp_path / ('%i.sav' % seed))
+        game = saved_game(seed)
+        save_game(game, path)
+        loaded = load_game(path)
+        assert state(loaded) == state(game)
+        #saving the loaded game writes the same file
+        again = str(tmp_path / 'again.sav')
+        save_game(loaded, again)
+        with open(path, 'rb') as a, open(again, 'rb') as b:
+            assert a.read() == b.read()
+
+def test_loaded_game_plays_on_the_same(tmp_path):
+    #with the roaming rules, the monsters out of view use the generator too
+    path = str(tmp_path / 'game.sav')
+    game = saved_game(3, roaming=True)
+    save_game(game, path)
+    loaded = load_game(path)
+    for g in (game, loaded):
+        play(g, 80, 4)
+        g.previous_level()
+        play(g, 20, 5)
+    assert state(loaded) == state(game)
+
+def test_autosave(tmp_path):
+    path = str(tmp_path / 'auto.sav')
+    game = Game(seed=4)
+    autosave = Autosave(path, turns=5)
+    autosave.update(game)
+    play(game, 4, 4)
+    autosave.update(game)
+    assert not os.path.exists(path)
+    play(game, 1, 5)
+    autosave.update(game)
+    assert state(load_game(path)) == state(game)
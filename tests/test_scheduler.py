@@ -0,0 +1,103 @@
+#checks of scheduler.py: the monsters act as often as their speed says, in
+#the order of their turns, and only the ones near the player act at all
+from scheduler import TurnScheduler, NORMAL_SPEED, WAKE_RADIUS, SLEEP_RADIUS
+
+class NothingInView:
+    def rect(self):
+        return None
+
+    def __contains__(self, coord):
+        return False
+
+class Spot:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class StubGame:
+    def __init__(self):
+        self.player = Spot(0, 0)
+        self.visible_tiles = NothingInView()
+        self.log = []
+
+class LoggingAI:
+    #writes down when it acts, and can be told to move its owner
+    def __init__(self, owner, speed=NORMAL_SPEED):
+        self.owner = owner
+        self.speed = speed
+        self.path = []
+
+    def take_turn(self, game):
+        game.log.append(self.owner.name)
+        if self.path:
+            (self.owner.x, self.owner.y) = self.path.pop(0)
+
+class Actor(Spot):
+    def __init__(self, name, x, y, speed=NORMAL_SPEED):
+        Spot.__init__(self, x, y)
+        self.name = name
+        self.ai = LoggingAI(self, speed)
+        self.index = object()
+
+def test_faster_monsters_act_more_often():
+    game = StubGame()
+    scheduler = TurnScheduler()
+    for actor in [Actor('normal', 1, 0), Actor('fast', 2, 0, 2 * NORMAL_SPEED),
+                  Actor('slow', 3, 0, NORMAL_SPEED // 2)]:
+        scheduler.add(actor)
+    turns = []
+    for i in range(4):
+        game.log = []
+        scheduler.run_turn(game)
+        turns.append(game.log)
+    #by the time of their next action, the one scheduled first going first
+    #for the same time. the slow one acts every other turn, starting with
+    #the second one: it acts one of its actions after it wakes up
+    assert turns == [['fast', 'normal', 'fast'],
+                     ['fast', 'slow', 'normal', 'fast'],
+                     ['fast', 'normal', 'fast'],
+                     ['fast', 'slow', 'normal', 'fast']]
+
+def test_far_monsters_sleep_until_the_player_comes():
+    game = StubGame()
+    scheduler = TurnScheduler()
+    near = Actor('near', WAKE_RADIUS, 0)
+    far = Actor('far', 3 * WAKE_RADIUS, 0)
+    scheduler.add(near)
+    scheduler.add(far)
+    scheduler.run_turn(game)
+    assert game.log == ['near'] and scheduler.active_count() == 1
+    #the player comes closer: the far one wakes up
+    game.player.x = 2 * WAKE_RADIUS
+    game.log = []
+    scheduler.run_turn(game)
+    assert sorted(game.log) == ['far', 'near'] and scheduler.active_count() == 2
+
+def test_monsters_fall_asleep_far_from_the_player():
+    game = StubGame()
+    scheduler = TurnScheduler()
+    walker = Actor('walker', SLEEP_RADIUS, 0)
+    scheduler.add(walker)
+    walker.x = WAKE_RADIUS
+    walker.ai.path = [(SLEEP_RADIUS + 1, 0)]
+    scheduler.run_turn(game)
+    #it acted, and ended up too far: dormant again, filed where it is
+    assert game.log == ['walker'] and scheduler.active_count() == 0
+    r = scheduler.wake_radius
+    assert walker in scheduler.dormant[(walker.x // r, walker.y // r)]
+    game.log = []
+    scheduler.run_turn(game)
+    assert game.log == []
+
+def test_dead_monsters_are_skipped():
+    game = StubGame()
+    scheduler = TurnScheduler()
+    (a, b) = (Actor('a', 1, 0), Actor('b', 2, 0))
+    scheduler.add(a)
+    scheduler.add(b)
+    scheduler.run_turn(game)
+    a.ai = None
+    b.index = None
+    game.log = []
+    scheduler.run_turn(game)
+    assert game.log == [] and scheduler.active_count() == 0
@@ -0,0 +1,74 @@
+#checks of server.py's stream: every frame, drawn over what the client had,
+#must give back the session's root console cell for cell
+import asyncio
+from server import (Session, CellConsole, FrameEncoder, apply_frame, command_events,
+                    HELLO, FRAME_HEADER, STREAM_MAGIC)
+
+COMMANDS = ['right', 'right', 'down', 'mouse 10 10', 'left', 'up', 'i', 'a', 'g',
+            'right', 'left', 'x', 'down', 'down', 'up', 'mouse 40 20', 'right']
+
+class ClientWriter:
+    #the connection as the client sees it: decodes each frame as it's sent
+    #and compares the client's screen with the session's
+    def __init__(self):
+        self.session = None
+        self.screen = None
+        self.frames = 0
+
+    def write(self, data):
+        if self.screen is None:
+            (magic, version, width, height) = HELLO.unpack(data)
+            assert magic == STREAM_MAGIC
+            self.screen = CellConsole(width, height)
+            return
+        (size,) = FRAME_HEADER.unpack_from(data, 0)
+        assert size == len(data) - FRAME_HEADER.size
+        apply_frame(self.screen, data[FRAME_HEADER.size:])
+        self.frames += 1
+        root = self.session.root
+        assert self.screen.chars == root.chars
+        assert self.screen.fg == root.fg
+        assert self.screen.bg == root.bg
+
+    async def drain(self):
+        pass
+
+def run_session(seed, commands):
+    writer = ClientWriter()
+
+    async def run():
+        reader = asyncio.StreamReader()
+        for command in commands:
+            reader.feed_data(command.encode('ascii') + b'\n')
+        reader.feed_eof()
+        session = writer.session = Session(reader, writer, seed)
+        await session.run()
+
+    asyncio.run(run())
+    return writer
+
+def test_frames_rebuild_the_screen():
+    for seed in (1, 2):
+        writer = run_session(seed, COMMANDS)
+        assert writer.frames > 1
+
+def test_only_changed_cells_are_sent():
+    console = CellConsole(20, 5)
+    screen = CellConsole(20, 5)
+    encoder = FrameEncoder(console)
+    console.drawStr(0, 0, 'hello', (255, 255, 0), (0, 0, 100))
+    apply_frame(screen, encoder.encode()[FRAME_HEADER.size:])
+    assert encoder.encode() is None
+    console.drawChar(3, 2, '@', (255, 255, 255), None)
+    console.drawChar(19, 4, 'x', None, (1, 2, 3))
+    frame = encoder.encode()
+    #two spans of one cell each
+    assert len(frame) == FRAME_HEADER.size + 2 * (3 + 1 + 7)
+    apply_frame(screen, frame[FRAME_HEADER.size:])
+    assert (screen.chars, screen.fg, screen.bg) == (console.chars, console.fg, console.bg)
+
+def test_commands():
+    assert command_events('up')[0].key == 'UP'
+    assert command_events('g')[0].char == 'g'
+    assert command_events('mouse 3 4')[0].cell == (3, 4)
+    assert command_events('mouse x 4') == []
@@ -0,0 +1,72 @@
+#checks of world.py: the objects of a chunk leave memory with it and come
+#back as they were when it's loaded again
+import tempfile
+from game import Game
+from world import ChunkStore, CHUNK_SIZE
+from helpers import describe
+
+def objects_in_chunk(game, cx, cy):
+    return sorted(describe(obj) for obj in game.objects
+                  if obj is not game.player and (obj.x // CHUNK_SIZE, obj.y // CHUNK_SIZE) == (cx, cy))
+
+def world_game(resident):
+    store = ChunkStore(tempfile.TemporaryFile(), 1024, 1024, resident=resident)
+    return (store, Game(seed=1, world=store))
+
+def test_objects_come_back_with_their_chunk():
+    (store, game) = world_game(resident=9)
+    (cx, cy) = (game.player.x // CHUNK_SIZE, game.player.y // CHUNK_SIZE)
+    #wound the monsters, so it shows if they come back fresh instead
+    for obj in game.objects:
+        if obj.fighter and obj is not game.player:
+            obj.fighter.hp -= 1
+    before = {key: objects_in_chunk(game, *key) for key in store.chunks}
+    assert any(before.values())
+    #go far away, then come back
+    for (x, y) in [(100, 100), (900, 100)]:
+        game.player.place(x, y)
+        game.recompute_fov()
+    for key in before:
+        assert key not in store.chunks
+        assert objects_in_chunk(game, *key) == []
+    game.player.place(cx * CHUNK_SIZE + 1, cy * CHUNK_SIZE + 1)
+    game.recompute_fov()
+    for key in before:
+        store.chunk(*key)
+    for (key, objects) in before.items():
+        assert objects_in_chunk(game, *key) == objects
+    store.close()
+
+def test_only_resident_chunks_have_objects():
+    (store, game) = world_game(resident=4)
+    for (x, y) in [(100, 100), (900, 100), (900, 900), (100, 900), (512, 512), (100, 100)]:
+        game.player.place(x, y)
+        game.recompute_fov()
+        for i in range(3):
+            game.monsters_take_turn()
+        for obj in game.objects:
+            assert (obj.x // CHUNK_SIZE, obj.y // CHUNK_SIZE) in store.chunks
+            assert obj.index is game.objects.index
+        for bucket in game.scheduler.dormant.values():
+            for actor in bucket:
+                assert actor.index is not None
+    store.close()
+
+def test_record_room_is_reused():
+    store = ChunkStore(tempfile.TemporaryFile(), 256, 256, resident=1)
+    records = {(0, 0): b'abcdef', (1, 0): b'xy'}
+    loaded = []
+    store.save_objects = lambda chunk, x, y: records.get((chunk.cx, chunk.cy), b'')
+    store.load_objects = lambda chunk, x, y, data: loaded.append(((chunk.cx, chunk.cy), data))
+    store.chunk(0, 0)
+    store.chunk(1, 0)
+    records[(0, 0)] = b'abc'
+    store.chunk(0, 0)
+    end = store.file_end
+    store.chunk(1, 0)
+    assert loaded == [((0, 0), b'abcdef'), ((1, 0), b'xy')]
+    #the smaller record went where the first one was
+    assert store.file_end == end
+    store.chunk(0, 0)
+    assert loaded[-1] == ((0, 0), b'abc')
+    store.close()
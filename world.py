@@ -0,0 +1,321 @@
+import mmap
+from array import array
+from collections import OrderedDict
+from gamemap import GameMap
+from decals import DecalLayer
+
+#an overworld too big to keep in memory (10000x10000 tiles and more). its
+#tiles are cut into square chunks, stored one after the other in a memory
+#mapped file. only the chunks around the player are kept in memory (the
+#least recently used ones are written back to the file and dropped), and a
+#chunk is made (see Game.generate_chunk) the first time it's needed. the
+#objects on a chunk leave memory with it: they are written to the file as
+#records after the chunks, and put back when the chunk is loaded again.
+
+#tiles per side of a chunk, a power of two
+CHUNK_SIZE = 64
+#how many chunks are kept in memory at most
+RESIDENT_CHUNKS = 64
+#the layers of a chunk, in that order: blocked, block_sight, explored, decals
+LAYERS = 4
+
+class Chunk:
+    __slots__ = ('cx', 'cy', 'layers', 'dirty')
+
+    def __init__(self, cx, cy, layers):
+        self.cx = cx
+        self.cy = cy
+        #one bytearray of CHUNK_SIZE * CHUNK_SIZE tiles (row by row) per layer
+        self.layers = layers
+        self.dirty = False
+
+class ChunkStore:
+    #the chunks of a world of width x height tiles, in "file" (an open file,
+    #a temporary one will do) that is memory mapped. generate(chunk, x, y)
+    #fills a new chunk whose first tile is (x, y), before it's first used.
+    #save_objects(chunk, x, y) takes the objects off a chunk that is dropped
+    #from memory and returns them as bytes, load_objects(chunk, x, y, data)
+    #puts them back when it's loaded again
+    def __init__(self, file, width, height, generate=None, resident=RESIDENT_CHUNKS):
+        self.width = width
+        self.height = height
+        self.generate = generate
+        self.save_objects = None
+        self.load_objects = None
+        self.resident = resident
+        self.shift = CHUNK_SIZE.bit_length() - 1
+        self.chunks_x = (width + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self.chunks_y = (height + CHUNK_SIZE - 1) // CHUNK_SIZE
+        #the layers of a chunk take whole pages, dropping them from memory
+        #after writing them back is then exact
+        self.chunk_bytes = LAYERS * CHUNK_SIZE * CHUNK_SIZE
+        #the file is sparse: the chunks never made don't take any disk space
+        file.truncate(self.chunks_x * self.chunks_y * self.chunk_bytes)
+        self.file = file
+        self.data = mmap.mmap(file.fileno(), 0)
+        #1 for each chunk that was made already
+        self.generated = bytearray(self.chunks_x * self.chunks_y)
+        #the objects of each chunk, a record in the file past the chunks: its
+        #offset, size, and the room it has (a smaller record is written over
+        #it, a bigger one goes at the end of the file)
+        count = self.chunks_x * self.chunks_y
+        self.record_offset = array('Q', [0]) * count
+        self.record_size = array('I', [0]) * count
+        self.record_room = array('I', [0]) * count
+        self.file_end = count * self.chunk_bytes
+        #(cx, cy) -> Chunk, the least recently used first
+        self.chunks = OrderedDict()
+        self.last = None
+        self.loads = 0
+        self.evictions = 0
+
+    def chunk(self, cx, cy):
+        #the chunk (cx, cy), from memory, the file, or made now
+        last = self.last
+        if last is not None and last.cx == cx and last.cy == cy:
+            return last
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+        else:
+            chunk = self.load(cx, cy)
+        self.last = chunk
+        return chunk
+
+    def load(self, cx, cy):
+        n = CHUNK_SIZE * CHUNK_SIZE
+        i = cy * self.chunks_x + cx
+        offset = i * self.chunk_bytes
+        chunk = Chunk(cx, cy, [bytearray(self.data[offset + layer * n:offset + (layer + 1) * n])
+                               for layer in range(LAYERS)])
+        self.loads += 1
+        self.chunks[(cx, cy)] = chunk
+        if not self.generated[i]:
+            self.generated[i] = 1
+            chunk.dirty = True
+            if self.generate is not None:
+                self.generate(chunk, cx * CHUNK_SIZE, cy * CHUNK_SIZE)
+        elif self.record_size[i] and self.load_objects is not None:
+            self.file.seek(self.record_offset[i])
+            data = self.file.read(self.record_size[i])
+            self.record_size[i] = 0
+            self.load_objects(chunk, cx * CHUNK_SIZE, cy * CHUNK_SIZE, data)
+        while len(self.chunks) > self.resident:
+            (key, old) = self.chunks.popitem(last=False)
+            self.evict(old)
+        return chunk
+
+    def evict(self, chunk):
+        #write the chunk back (if it changed) with its objects, and let the
+        #system drop its pages
+        i = chunk.cy * self.chunks_x + chunk.cx
+        offset = i * self.chunk_bytes
+        if chunk.dirty:
+            self.data[offset:offset + self.chunk_bytes] = b''.join(chunk.layers)
+        if self.save_objects is not None:
+            self.write_record(i, self.save_objects(chunk, chunk.cx * CHUNK_SIZE, chunk.cy * CHUNK_SIZE))
+        if hasattr(self.data, 'madvise'):
+            self.data.madvise(mmap.MADV_DONTNEED, offset, self.chunk_bytes)
+        if chunk is self.last:
+            self.last = None
+        self.evictions += 1
+
+    def write_record(self, i, data):
+        #the objects of chunk i, as save_objects() returned them
+        self.record_size[i] = len(data)
+        if not data:
+            return
+        if len(data) > self.record_room[i]:
+            self.record_offset[i] = self.file_end
+            self.record_room[i] = len(data)
+            self.file_end += len(data)
+        self.file.seek(self.record_offset[i])
+        self.file.write(data)
+
+    def generate_around(self, x, y, radius):
+        #make the chunks within radius tiles of (x, y) that weren't made yet,
+        #always in the same order, so the world comes out the same whatever
+        #else looks at it (the renderer...)
+        s = self.shift
+        for cy in range(max(y - radius, 0) >> s, (min(y + radius, self.height - 1) >> s) + 1):
+            for cx in range(max(x - radius, 0) >> s, (min(x + radius, self.width - 1) >> s) + 1):
+                if not self.generated[cy * self.chunks_x + cx]:
+                    self.chunk(cx, cy)
+
+    def peek(self, cx, cy, layer):
+        #one layer of the chunk (cx, cy) as bytes, without paging it in (or
+        #making it): None if it wasn't made yet
+        i = cy * self.chunks_x + cx
+        if not self.generated[i]:
+            return None
+        chunk = self.chunks.get((cx, cy))
+        if chunk is not None:
+            return bytes(chunk.layers[layer])
+        n = CHUNK_SIZE * CHUNK_SIZE
+        offset = i * self.chunk_bytes + layer * n
+        return self.data[offset:offset + n]
+
+    def window(self, layer, x1, y1, x2, y2, fill):
+        #the tiles x1 <= x < x2, y1 <= y < y2 of a layer, row by row, read
+        #with peek(). tiles off the world or in chunks not made yet are "fill"
+        s = self.shift
+        mask = CHUNK_SIZE - 1
+        peeked = {}
+        rows = []
+        for y in range(y1, y2):
+            row = bytearray([fill]) * (x2 - x1)
+            if 0 <= y < self.height:
+                x = max(x1, 0)
+                end = min(x2, self.width)
+                while x < end:
+                    key = (x >> s, y >> s)
+                    if key not in peeked:
+                        peeked[key] = self.peek(key[0], key[1], layer)
+                    tiles = peeked[key]
+                    n = min(end - x, CHUNK_SIZE - (x & mask))
+                    if tiles is not None:
+                        a = (y & mask) * CHUNK_SIZE + (x & mask)
+                        row[x - x1:x - x1 + n] = tiles[a:a + n]
+                    x += n
+            rows.append(row)
+        return b''.join(rows)
+
+    def flush(self):
+        #write the tiles of every chunk in memory back to the file (their
+        #objects are only written when the chunk is dropped)
+        for chunk in self.chunks.values():
+            if chunk.dirty:
+                offset = (chunk.cy * self.chunks_x + chunk.cx) * self.chunk_bytes
+                self.data[offset:offset + self.chunk_bytes] = b''.join(chunk.layers)
+                chunk.dirty = False
+        self.data.flush()
+
+    def close(self):
+        self.chunks.clear()
+        self.last = None
+        self.data.close()
+        self.file.close()
+
+class ChunkedLayer:
+    #one layer of every chunk, indexed like the flat bytearrays of GameMap
+    #(y * width + x), single tiles or slices of tiles
+    def __init__(self, store, layer):
+        self.store = store
+        self.layer = layer
+
+    def __len__(self):
+        return self.store.width * self.store.height
+
+    def __getitem__(self, i):
+        store = self.store
+        if isinstance(i, slice):
+            indices = range(*i.indices(len(self)))
+            if i.step in (None, 1):
+                return self._get_run(indices.start, indices.stop)
+            return bytes(self[j] for j in indices)
+        (y, x) = divmod(i, store.width)
+        chunk = store.chunk(x >> store.shift, y >> store.shift)
+        return chunk.layers[self.layer][(y & (CHUNK_SIZE - 1)) * CHUNK_SIZE + (x & (CHUNK_SIZE - 1))]
+
+    def __setitem__(self, i, value):
+        store = self.store
+        if isinstance(i, slice):
+            indices = range(*i.indices(len(self)))
+            if len(value) != len(indices):
+                raise ValueError('a chunked layer can\'t change size')
+            if i.step in (None, 1):
+                self._set_run(indices.start, value)
+            else:
+                for (j, v) in zip(indices, value):
+                    self[j] = v
+            return
+        (y, x) = divmod(i, store.width)
+        chunk = store.chunk(x >> store.shift, y >> store.shift)
+        chunk.layers[self.layer][(y & (CHUNK_SIZE - 1)) * CHUNK_SIZE + (x & (CHUNK_SIZE - 1))] = value
+        chunk.dirty = True
+
+    def _pieces(self, start, stop):
+        #the part of each chunk covered by tiles start to stop (exclusive):
+        #(chunk, first index in the chunk's layer, tile count)
+        store = self.store
+        w = store.width
+        i = start
+        while i < stop:
+            (y, x) = divmod(i, w)
+            #up to the end of the chunk's row, of the map's row, or of the run
+            n = min(CHUNK_SIZE - (x & (CHUNK_SIZE - 1)), w - x, stop - i)
+            chunk = store.chunk(x >> store.shift, y >> store.shift)
+            yield (chunk, (y & (CHUNK_SIZE - 1)) * CHUNK_SIZE + (x & (CHUNK_SIZE - 1)), n)
+            i += n
+
+    def _get_run(self, start, stop):
+        layer = self.layer
+        return b''.join(bytes(chunk.layers[layer][a:a + n]) for (chunk, a, n) in self._pieces(start, stop))
+
+    def _set_run(self, start, value):
+        layer = self.layer
+        pos = 0
+        for (chunk, a, n) in self._pieces(start, start + len(value)):
+            chunk.layers[layer][a:a + n] = value[pos:pos + n]
+            chunk.dirty = True
+            pos += n
+
+class Transparency:
+    #1 for the tiles light goes through, like FovCache's grid, but read from
+    #the chunks when asked instead of made for the whole map
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, i):
+        store = self.store
+        (y, x) = divmod(i, store.width)
+        layers = store.chunk(x >> store.shift, y >> store.shift).layers
+        j = (y & (CHUNK_SIZE - 1)) * CHUNK_SIZE + (x & (CHUNK_SIZE - 1))
+        return 0 if layers[0][j] or layers[1][j] else 1
+
+class ChunkedMap(GameMap):
+    #a GameMap whose layers are the chunks of a ChunkStore. everything
+    #reading or carving the map works the same, but nothing should go over
+    #the whole map: only the parts around the player are ever in memory
+    chunked = True
+
+    def __init__(self, store):
+        self.width = store.width
+        self.height = store.height
+        self.store = store
+        self.blocked = ChunkedLayer(store, 0)
+        self.block_sight = ChunkedLayer(store, 1)
+        self.explored = ChunkedLayer(store, 2)
+        self.decals = DecalLayer(store.width, store.height, ChunkedLayer(store, 3))
+        self.version = 0
+
+    def transparency(self):
+        return Transparency(self.store)
+
+    def window(self, layer, x1, y1, x2, y2, fill=1):
+        #like GameMap.window(), without paging chunks in or making them
+        return self.store.window(layer.layer, x1, y1, x2, y2, fill)
+
+def overworld_chunk(chunk, x0, y0, width, height, rng):
+    #open ground with a few rocky outcrops, walls all around the world
+    size = CHUNK_SIZE
+    (blocked, block_sight) = (chunk.layers[0], chunk.layers[1])
+    for i in range(rng.randint(2, 6)):
+        w = rng.randint(2, 8)
+        h = rng.randint(2, 8)
+        x = rng.randint(0, size - w)
+        y = rng.randint(0, size - h)
+        wall = b'\x01' * w
+        for row in range(y, y + h):
+            blocked[row * size + x:row * size + x + w] = wall
+            block_sight[row * size + x:row * size + x + w] = wall
+    #the world's border, and the part of the chunk beyond it
+    if 0 < x0 and 0 < y0 and x0 + size < width - 1 and y0 + size < height - 1:
+        return
+    for y in range(size):
+        for x in range(size):
+            (wx, wy) = (x0 + x, y0 + y)
+            if wx <= 0 or wy <= 0 or wx >= width - 1 or wy >= height - 1:
+                blocked[y * size + x] = 1
+                block_sight[y * size + x] = 1